@@ -42,13 +42,56 @@ notice = None
 checkers = {}
 settings = {}
 
-on_request = []
-on_response = []
-on_request_upstream = []
-on_response_upstream = []
 
-encoder = []
-decoder = []
+def _invalidate_dispatch_table(method):
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            # After the mutation, so a table built from the list during it is never used
+            self.version += 1
+            self.dispatch_table = None
+    return wrapper
+
+
+class HandlerList(list):
+    """
+    Registered functions of a flow editor or encoder/decoder hook
+
+    The dispatch table is built from this list when a flow is matched first, and cached on it
+    with the version of the list. Modifying the list increases the version, the cached table is used
+    only if its version is the current one.
+
+    Functions are read when the table is built, `rank` and `rules` of a registered function changed
+    in place are not tracked, replace the item instead, e.g. `handlers[index] = dict(func_info, rank=1)`
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = 0
+        # (version, DispatchTable)
+        self.dispatch_table = None
+
+    append = _invalidate_dispatch_table(list.append)
+    extend = _invalidate_dispatch_table(list.extend)
+    insert = _invalidate_dispatch_table(list.insert)
+    remove = _invalidate_dispatch_table(list.remove)
+    pop = _invalidate_dispatch_table(list.pop)
+    clear = _invalidate_dispatch_table(list.clear)
+    sort = _invalidate_dispatch_table(list.sort)
+    reverse = _invalidate_dispatch_table(list.reverse)
+    __setitem__ = _invalidate_dispatch_table(list.__setitem__)
+    __delitem__ = _invalidate_dispatch_table(list.__delitem__)
+    __iadd__ = _invalidate_dispatch_table(list.__iadd__)
+
+
+on_request = HandlerList()
+on_response = HandlerList()
+on_request_upstream = HandlerList()
+on_response_upstream = HandlerList()
+
+encoder = HandlerList()
+decoder = HandlerList()
 
 labels = None
 
@@ -85,6 +128,12 @@ def terminate_server():
         server[name].terminate()
 
 
+# Scope of queue producers and consumers, see SyncManager.get_queue
+QUEUE_SCOPE_THREAD = 'thread'
+QUEUE_SCOPE_PROCESS = 'process'
+QUEUE_SCOPE_MANAGER = 'manager'
+
+
 class SyncManager():
     def __init__(self) -> None:
         global sync_namespace
@@ -102,7 +151,19 @@ class SyncManager():
         self.async_objs['namespace'].append(namespace)
         return namespace
 
-    def get_queue(self):
+    def get_queue(self, scope=QUEUE_SCOPE_MANAGER):
+        """
+        Return the cheapest queue for the scope of its producers and consumers
+
+        thread: all in main process, no pickle and no IPC
+        process: shared with child processes when they start, pickled through a pipe
+        manager: proxy of a queue in manager process, could be sent to any process at any time,
+                 but every put and get is a round trip to manager process
+        """
+        if scope == QUEUE_SCOPE_THREAD:
+            return self.get_thread_queue()
+        if scope == QUEUE_SCOPE_PROCESS:
+            return self.get_multiprocessing_queue()
         queue = self.manager.Queue()
         self.async_objs['manager_queues'].append(queue)
         return queue
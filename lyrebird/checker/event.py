@@ -5,17 +5,20 @@ from .. import checker
 
 class CheckerEventHandler:
 
-    def __call__(self, channel, process=True, *args, **kw):
+    def __call__(self, channel, process=True, *args, rules=None, **kw):
         def func(origin_func):
             if not checker.scripts_tmp_storage.get(checker.TYPE_EVENT):
                 checker.scripts_tmp_storage[checker.TYPE_EVENT] = []
-            checker.scripts_tmp_storage[checker.TYPE_EVENT].append({
+            func_info = {
                 'name': origin_func.__name__,
                 'origin': origin_func.__code__.co_filename,
                 'func': origin_func,
                 'channel': channel,
                 'process': process
-            })
+            }
+            if rules:
+                func_info['rules'] = rules
+            checker.scripts_tmp_storage[checker.TYPE_EVENT].append(func_info)
             return origin_func
         return func
 
@@ -125,7 +125,6 @@ def prepare_application_for_monkey_patch() -> Namespace:
     namespace = application.sync_manager.get_namespace()
     namespace.application = ProcessApplicationInfo(application, application_white_map)
     namespace.context = ProcessApplicationInfo(context, context_white_map)
-    namespace.queue = application.server['event'].event_queue
     return namespace
 
 
@@ -3,21 +3,32 @@ import math
 import datetime
 import traceback
 import time
-import copy
+import zlib
+import queue
+import hashlib
+import threading
 from pathlib import Path
+from collections import Counter, OrderedDict
 from lyrebird import application
 from lyrebird import log
-from lyrebird.utils import convert_size, convert_size_to_byte, JSONFormat
+from lyrebird.utils import convert_size, convert_size_to_byte, JSONFormat, CopyOnWriteDict
 from lyrebird.base_server import ThreadServer
 from lyrebird.mock import context
-from sqlalchemy import event, and_
-from sqlalchemy.orm import sessionmaker, scoped_session
+from lyrebird.mock.dm.jsonpath import jsonpath
+from sqlalchemy import event, and_, select, text, literal_column, func
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, Integer, Text, DateTime, create_engine, Table, MetaData
+from sqlalchemy import Column, String, Integer, Text, DateTime, LargeBinary, create_engine, Table, MetaData
 from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.types import NullType
 from sqlalchemy.exc import OperationalError
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 """
 Database server
@@ -30,12 +41,63 @@ logger = log.get_logger()
 
 Base = declarative_base()
 
+# Max events written in one transaction
+DEFAULT_BATCH_SIZE = 200
+# Max time(ms) waiting for more events after the first event of a batch
+DEFAULT_BATCH_INTERVAL = 50
+# Database locked by FTS backfill or retention thread is retried, it does not mean the database is broken
+DB_LOCKED_RETRY_COUNT = 3
+# Seconds between two retries
+DB_LOCKED_RETRY_INTERVAL = 1
+
+# Full-text search index of event message and selected content fields
+# Trigram tokenizer matches substring, the same as `LIKE '%term%'`, but term shorter than 3 could not use it
+FTS_TABLE_NAME = 'event_fts'
+FTS_MIN_TERM_LENGTH = 3
+# Events already in the database are indexed in background, the progress is kept in this table
+FTS_BACKFILL_TABLE_NAME = 'event_fts_backfill'
+FTS_BACKFILL_BATCH_SIZE = 1000
+
+# Event content compression, zstd is used only if zstandard is installed
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Response body larger than it is stored once by hash in compression mode
+DEDUP_MIN_SIZE = 256
+# Number of body hashes known to be stored, their bodies are not sent to the writer again
+KNOWN_BODY_CACHE_SIZE = 10000
+
 
 class LyrebirdDatabaseServer(ThreadServer):
     def __init__(self, path=None):
         self.database_uri = None
         self.error_log = []
         self.error_log_threshold = application.config.get('event.db_connection_recover_threshold', 0)
+        self.fts_enabled = application.config.get('event.db.fts', False)
+        self.fts_backfill_thread = None
+        self.fts_content_fields = application.config.get('event.db.fts.content_fields', [])
+        self.compression = get_compression(application.config.get('event.db.compression'))
+        self.known_body_hashes = OrderedDict()
+        self.known_body_lock = threading.Lock()
+        # Held by the writer from making rows to commit, unused bodies are deleted under it
+        # so a body skipped by known_body_hashes is not deleted before its event is committed
+        self.body_lock = threading.Lock()
+        # Event count of each channel, maintained by the writer
+        self.channel_counter = Counter()
+        # Content size of each channel, only loaded for channels limited by size
+        self.channel_size = {}
+        self.channel_counter_lock = threading.Lock()
+        # Last event id compacted by retention server of each channel, cleared with the database
+        self.compact_watermark = {}
+        self.writer_status = {
+            'batch_count': 0,
+            'event_count': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_commit_time': 0,
+            'max_commit_time': 0,
+            'total_commit_time': 0
+        }
         super().__init__()
 
         if not path or path.isspace():
@@ -60,7 +122,8 @@ class LyrebirdDatabaseServer(ThreadServer):
             logger.warning("Restarting will delete the broken database by default, historical events in inspector-pro will be lost, please be careful.")
 
         # init queue
-        self.storage_queue = application.sync_manager.get_queue()
+        # Events are only consumed by the writer thread in the same process
+        self.storage_queue = application.sync_manager.get_thread_queue()
 
         # subscribe all channel
         application.server['event'].subscribe({
@@ -70,6 +133,20 @@ class LyrebirdDatabaseServer(ThreadServer):
             'func': self.event_receiver
         })
     
+    def migrate_auto_vacuum(self, engine):
+        """
+        auto_vacuum set on connect only works on new database, older databases are vacuumed once to enable it
+        """
+        connection = engine.raw_connection()
+        try:
+            # 2 is INCREMENTAL
+            if connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return
+            logger.info(f'[Local DB]Vacuum database to enable incremental vacuum: {self.database_uri}')
+            connection.connection.executescript('PRAGMA auto_vacuum=INCREMENTAL; VACUUM')
+        finally:
+            connection.close()
+
     def auto_alter_tables(self, engine):
         metadata = MetaData()
         tables = {
@@ -100,6 +177,110 @@ class LyrebirdDatabaseServer(ThreadServer):
                     continue
                 column_type = attr.type.compile(dialect=engine.dialect)
                 engine.execute(f'ALTER TABLE {table_name} ADD COLUMN {attr_name} {column_type}')
+                for index in model_class.__table__.indexes:
+                    if attr_name in index.columns:
+                        index.create(bind=engine)
+
+        if self.fts_enabled:
+            self.fts_enabled = self.init_fts_table(engine, tables)
+
+    def init_fts_table(self, engine, tables):
+        """
+        Create the full-text search table, events already in the database are indexed in background
+
+        Return False if FTS5 or trigram tokenizer is not supported by SQLite
+        """
+        if FTS_TABLE_NAME in tables:
+            # Resume the unfinished backfill
+            if FTS_BACKFILL_TABLE_NAME in tables:
+                self.start_fts_backfill()
+                return True
+            # Events written while full-text search was disabled are not indexed
+            # Index is built in id order, events after the highest indexed id are backfilled
+            last_id = engine.execute(f'SELECT max(rowid) FROM {FTS_TABLE_NAME}').scalar() or 0
+            max_id = engine.execute('SELECT max(id) FROM event').scalar()
+            if max_id is not None and max_id > last_id:
+                self.create_fts_backfill(engine, last_id, max_id)
+            return True
+        try:
+            engine.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE_NAME} USING fts5(message, content, tokenize='trigram')")
+        except OperationalError:
+            logger.warning(f'[Local DB]SQLite FTS5 trigram tokenizer is not supported, full-text search is disabled')
+            return False
+
+        engine.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE_NAME}_delete AFTER DELETE ON event BEGIN
+                DELETE FROM {FTS_TABLE_NAME} WHERE rowid = old.id;
+            END
+        ''')
+        logger.info(f'[Local DB]Full-text search index is created')
+
+        # Events written after this are indexed by the writer
+        max_id = engine.execute('SELECT max(id) FROM event').scalar()
+        if max_id is not None:
+            self.create_fts_backfill(engine, 0, max_id)
+        return True
+
+    def create_fts_backfill(self, engine, last_id, max_id):
+        engine.execute(f'CREATE TABLE {FTS_BACKFILL_TABLE_NAME} (last_id INTEGER, max_id INTEGER)')
+        engine.execute(f'INSERT INTO {FTS_BACKFILL_TABLE_NAME} VALUES ({int(last_id)}, {int(max_id)})')
+        self.start_fts_backfill()
+
+    def start_fts_backfill(self):
+        self.fts_backfill_thread = threading.Thread(
+            target=self.fts_backfill, args=(self._scoped_session, ), name='fts-backfill', daemon=True)
+        self.fts_backfill_thread.start()
+
+    def fts_backfill(self, scoped_session):
+        """
+        Index events in batches of FTS_BACKFILL_BATCH_SIZE, each batch is committed with its progress
+        """
+        content_sql = ' || \' \' || '.join(
+            f"coalesce(json_extract(content, '{path}'), '')"
+            for path in filter(None, map(get_sqlite_json_path, self.fts_content_fields))
+        ) or "''"
+        session = scoped_session()
+        retry_count = 0
+        try:
+            while True:
+                try:
+                    if self._fts_backfill_batch(session, content_sql):
+                        break
+                    retry_count = 0
+                except OperationalError as e:
+                    # Writer and retention thread hold the lock for a short time, wait for them
+                    if not is_database_locked(e) or retry_count >= DB_LOCKED_RETRY_COUNT:
+                        raise
+                    session.rollback()
+                    retry_count += 1
+                    time.sleep(DB_LOCKED_RETRY_INTERVAL)
+            logger.info(f'[Local DB]Full-text search index of existing events is built')
+        except Exception:
+            session.rollback()
+            logger.error(f'[Local DB]Build full-text search index failed, it is resumed on next start. {traceback.format_exc()}')
+        finally:
+            scoped_session.remove()
+
+    def _fts_backfill_batch(self, session, content_sql):
+        """
+        Index one batch and commit the progress, return True if all events are indexed
+        """
+        last_id, max_id = session.execute(text(f'SELECT last_id, max_id FROM {FTS_BACKFILL_TABLE_NAME}')).first()
+        batch_end_id = session.execute(text('''
+            SELECT max(id) FROM (SELECT id FROM event WHERE id > :last_id AND id <= :max_id ORDER BY id LIMIT :limit)
+        '''), {'last_id': last_id, 'max_id': max_id, 'limit': FTS_BACKFILL_BATCH_SIZE}).scalar()
+        if batch_end_id is None:
+            session.execute(text(f'DROP TABLE {FTS_BACKFILL_TABLE_NAME}'))
+            session.commit()
+            return True
+        session.execute(text(f'''
+            INSERT INTO {FTS_TABLE_NAME}(rowid, message, content)
+            SELECT id, message, CASE WHEN typeof(content) = 'text' AND json_valid(content) THEN {content_sql} ELSE '' END
+            FROM event WHERE id > :last_id AND id <= :batch_end_id
+        '''), {'last_id': last_id, 'batch_end_id': batch_end_id})
+        session.execute(text(f'UPDATE {FTS_BACKFILL_TABLE_NAME} SET last_id = :last_id'), {'last_id': batch_end_id})
+        session.commit()
+        return False
 
     def init_engine(self):
         sqlite_path = 'sqlite:///'+str(self.database_uri)+'?check_same_thread=False'
@@ -125,47 +306,147 @@ class LyrebirdDatabaseServer(ThreadServer):
         session_factory = sessionmaker(bind=engine)
         Session = scoped_session(session_factory)
         self._scoped_session = Session
+        self.migrate_auto_vacuum(engine)
         self.auto_alter_tables(engine=engine)
+        self.load_channel_counter()
 
         logger.info(f'Init DB engine: {self.database_uri}')
         return True
 
+    def load_channel_counter(self):
+        session = self._scoped_session()
+        result = session.query(Event.channel, func.count(Event.id)).group_by(Event.channel).all()
+        self._scoped_session.remove()
+        with self.channel_counter_lock:
+            self.channel_counter = Counter(dict(result))
+            self.channel_size = {}
+
+    def get_channel_size(self, channel):
+        with self.channel_counter_lock:
+            if channel in self.channel_size:
+                return self.channel_size[channel]
+        session = self._scoped_session()
+        size = session.query(func.sum(func.length(Event.stored_content))).filter(Event.channel == channel).scalar() or 0
+        self._scoped_session.remove()
+        with self.channel_counter_lock:
+            # Events written during the query may be missed, the size is approximate
+            return self.channel_size.setdefault(channel, size)
+
+    def update_channel_counter(self, channel, count, size=0):
+        with self.channel_counter_lock:
+            self.channel_counter[channel] += count
+            if channel in self.channel_size:
+                self.channel_size[channel] += size
+
     def _fk_pragma_on_connect(self, dbapi_con, con_record):
         # https://www.sqlite.org/pragma.html#pragma_journal_mode
         dbapi_con.execute('PRAGMA journal_mode=MEMORY')
         # https://www.sqlite.org/pragma.html#pragma_synchronous
         dbapi_con.execute('PRAGMA synchronous=OFF')
+        # Work on new database only, older databases are migrated by migrate_auto_vacuum
+        # Free pages are released by retention server
+        # https://www.sqlite.org/pragma.html#pragma_auto_vacuum
+        dbapi_con.execute('PRAGMA auto_vacuum=INCREMENTAL')
 
     def event_receiver(self, event, channel=None, event_id=None):
+        # event is the snapshot copied by EventServer and shared by all subscribers, it must not be modified
+        # Serialization is done in the writer thread, keep broadcast workers free
+        self.storage_queue.put((event, channel, event_id))
+
+    def make_row(self, event, channel, event_id):
         # event is decoded , which should be encoded when save
-        # deepcopy to avoid affecting checker running
         if channel == 'flow':
-            event = copy.deepcopy(event)
-            application.encoders_decoders.encoder_handler(event['flow'])
+            event = self.encode_flow_event(event)
 
-        content = json.dumps(event, ensure_ascii=False)
         if isinstance(event, dict):
             message = event.get('message')
         else:
             message = None
-        flow = Event(event_id=event_id, channel=channel, content=content, message=message)
-        self.storage_queue.put(flow)
+        row = {
+            'event_id': event_id,
+            'channel': channel,
+            'message': message
+        }
+        if self.fts_enabled:
+            row['fts_content'] = get_fts_content(event, self.fts_content_fields)
+        if self.compression and channel == 'flow':
+            event = self.pop_response_body(event, row)
+        content = json.dumps(event, ensure_ascii=False)
+        if self.compression:
+            row['content'] = None
+            row['compressed_content'] = compress_content(content, self.compression)
+        else:
+            row['content'] = content
+        return row
+
+    @staticmethod
+    def encode_flow_event(event):
+        """
+        Return event with encoded flow, event itself is not modified
+
+        The flow is copied on write, only when an encoder is matched
+        """
+        encoders_decoders = application.encoders_decoders
+        matched_funcs = encoders_decoders.get_matched_sorted_handler(encoders_decoders.encoder, event['flow'])
+        if not matched_funcs:
+            return event
+        event = dict(event)
+        event['flow'] = CopyOnWriteDict(event['flow'])
+        encoders_decoders.func_handler(matched_funcs, event['flow'], handler_type='encoder')
+        return event
+
+    def pop_response_body(self, event, row):
+        """
+        Return event without the large response body, the body is stored in EventBody once by hash
+        """
+        response = event.get('flow', {}).get('response')
+        if not isinstance(response, dict):
+            return event
+        body = response.get('data')
+        if not isinstance(body, str) or len(body) < DEDUP_MIN_SIZE:
+            return event
+        body_bytes = body.encode()
+        body_hash = hashlib.sha1(body_bytes).hexdigest()
+        event = dict(event)
+        event['flow'] = dict(event['flow'])
+        event['flow']['response'] = dict(response, data=None)
+        row['response_body_hash'] = body_hash
+        with self.known_body_lock:
+            if body_hash in self.known_body_hashes:
+                self.known_body_hashes.move_to_end(body_hash)
+                return event
+            self.known_body_hashes[body_hash] = True
+            if len(self.known_body_hashes) > KNOWN_BODY_CACHE_SIZE:
+                self.known_body_hashes.popitem(last=False)
+        row['response_body'] = {'hash': body_hash, 'data': compress_content(body_bytes, self.compression)}
+        return event
+
+    def forget_known_bodies(self):
+        with self.known_body_lock:
+            self.known_body_hashes.clear()
 
     def start(self):
         super().start()
 
     def run(self):
         session = self._scoped_session()
-        while self.running:
+        is_stopped = False
+        while self.running and not is_stopped:
             try:
-                event = self.storage_queue.get()
-                if event is None:
-                    break
-                session.add(event)
-                session.commit()
-                context.emit('db_action', 'add event log')
+                batch, is_stopped = self._get_batch()
+                with self.body_lock:
+                    rows = self._make_rows(batch)
+                    if not rows:
+                        continue
+                    self._write_batch_with_retry(session, rows)
             except OperationalError as e:
                 logger.error(f'Save event failed. {traceback.format_exc()}')
+                # Bodies in the failed batch are not stored
+                self.forget_known_bodies()
+                if is_database_locked(e):
+                    # The lock is held by other threads, the database is not broken
+                    session.rollback()
+                    continue
                 self.error_log.append(e)
                 if len(self.error_log) > self.error_log_threshold:
                     logger.warning(f'DB would be reset: {self.database_uri}')
@@ -176,64 +457,207 @@ class LyrebirdDatabaseServer(ThreadServer):
                     session.rollback()
             except Exception:
                 logger.error(f'Save event failed. {traceback.format_exc()}')
+                self.forget_known_bodies()
                 session.rollback()
 
+    def _make_rows(self, batch):
+        rows = []
+        for event, channel, event_id in batch:
+            try:
+                rows.append(self.make_row(event, channel, event_id))
+            except Exception:
+                logger.error(f'Serialize event failed. channel={channel} event_id={event_id} {traceback.format_exc()}')
+        return rows
+
+    def _get_batch(self):
+        """
+        Block until an event arrives, then drain up to batch_size events
+        or until batch_interval(ms) is passed
+
+        Return (events, is_stopped), is_stopped is True when None is received
+        """
+        batch_size = application.config.get('event.db.batch_size', DEFAULT_BATCH_SIZE)
+        batch_interval = application.config.get('event.db.batch_interval', DEFAULT_BATCH_INTERVAL) / 1000
+
+        batch = []
+        event = self.storage_queue.get()
+        if event is None:
+            return batch, True
+        batch.append(event)
+
+        deadline = time.time() + batch_interval
+        while len(batch) < batch_size:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0:
+                    event = self.storage_queue.get(timeout=timeout)
+                else:
+                    event = self.storage_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _write_batch_with_retry(self, session, batch):
+        for retry_count in range(DB_LOCKED_RETRY_COUNT + 1):
+            try:
+                self._write_batch(session, batch)
+                return
+            except OperationalError as e:
+                if not is_database_locked(e) or retry_count == DB_LOCKED_RETRY_COUNT:
+                    raise
+                session.rollback()
+                logger.warning(f'[Local DB]Database is locked, retry saving {len(batch)} events')
+                time.sleep(DB_LOCKED_RETRY_INTERVAL)
+
+    def _write_batch(self, session, batch):
+        start_time = time.time()
+        # Rows in batch are not modified, the batch could be written again after rollback
+        fts_contents = [row.get('fts_content') for row in batch]
+        bodies = [row['response_body'] for row in batch if 'response_body' in row]
+        if bodies:
+            session.execute(EventBody.__table__.insert().prefix_with('OR IGNORE'), bodies)
+        event_rows = [
+            {key: value for key, value in row.items() if key not in ('fts_content', 'response_body')}
+            for row in batch
+        ]
+        # Ids of inserted rows are set into the rows for their FTS rows
+        session.bulk_insert_mappings(Event, event_rows, return_defaults=self.fts_enabled)
+        fts_rows = [
+            {'id': row['id'], 'message': row.get('message'), 'content': fts_content}
+            for row, fts_content in zip(event_rows, fts_contents) if fts_content is not None
+        ]
+        if fts_rows and self.fts_enabled:
+            session.execute(text(f'''
+                INSERT INTO {FTS_TABLE_NAME}(rowid, message, content) VALUES (:id, :message, :content)
+            '''), fts_rows)
+        session.commit()
+        commit_time = round((time.time() - start_time) * 1000, 3)
+
+        with self.channel_counter_lock:
+            for row in batch:
+                self.channel_counter[row['channel']] += 1
+                if row['channel'] in self.channel_size:
+                    self.channel_size[row['channel']] += len(row.get('compressed_content') or row['content'] or '')
+
+        status = self.writer_status
+        status['batch_count'] += 1
+        status['event_count'] += len(batch)
+        status['last_batch_size'] = len(batch)
+        status['max_batch_size'] = max(status['max_batch_size'], len(batch))
+        status['last_commit_time'] = commit_time
+        status['max_commit_time'] = max(status['max_commit_time'], commit_time)
+        status['total_commit_time'] += commit_time
+
+        context.emit('db_action', 'add event log')
+
+    def get_writer_status(self):
+        """
+        Backpressure metrics of the writer, time unit is ms
+        """
+        status = dict(self.writer_status)
+        try:
+            status['queue_size'] = self.storage_queue.qsize()
+        except NotImplementedError:
+            status['queue_size'] = None
+        batch_count = status['batch_count']
+        status['avg_batch_size'] = round(status['event_count'] / batch_count, 3) if batch_count else 0
+        status['avg_commit_time'] = round(status.pop('total_commit_time') / batch_count, 3) if batch_count else 0
+        return status
+
     def stop(self):
         super().stop()
+        self.storage_queue.put(None)
 
     @property
     def session(self):
         return self._scoped_session()
 
-    def get_event(self, channel_rules, offset=0, limit=20, search_str=''):
-        search_str_list = [item.strip() for item in search_str.strip().split('+')] if search_str else []
+    def get_event(self, channel_rules, offset=0, limit=20, search_str='', before_id=None):
+        """
+        Get events in descending order of id
+
+        If before_id is set, return events whose id is less than it and offset is ignored,
+        this keyset pagination costs the same on any page
+        """
         session = self._scoped_session()
         _subquery = session.query(Event.id).order_by(Event.id.desc())
         if len(channel_rules) > 0:
             _subquery = _subquery.filter(Event.channel.in_(channel_rules))
+        _subquery = self._filter_search(_subquery, search_str)
+        if before_id is not None:
+            _subquery = _subquery.filter(Event.id < before_id)
+        else:
+            _subquery = _subquery.offset(offset)
+        _subquery = _subquery.limit(limit).subquery()
+        result = session.query(Event).filter(Event.id == _subquery.c.id).order_by(Event.id.desc()).all()
+        self._scoped_session.remove()
+        return result
+
+    def _filter_search(self, query, search_str):
+        search_str_list = [item.strip() for item in search_str.strip().split('+')] if search_str else []
+        if len(search_str_list) == 0:
+            return query
+
+        if self.fts_enabled:
+            fts_terms = [item for item in search_str_list if len(item) >= FTS_MIN_TERM_LENGTH]
+            search_str_list = [item for item in search_str_list if len(item) < FTS_MIN_TERM_LENGTH]
+            if fts_terms:
+                fts_match = ' '.join('"' + item.replace('"', '""') + '"' for item in fts_terms)
+                fts_query = select([literal_column('rowid')]) \
+                    .select_from(text(FTS_TABLE_NAME)) \
+                    .where(literal_column(FTS_TABLE_NAME).op('MATCH')(fts_match))
+                query = query.filter(Event.id.in_(fts_query))
+
         if len(search_str_list) > 0:
-            _subquery = _subquery.filter(Event.message != None)
+            query = query.filter(Event.message != None)
             and_cond = []
             for search_str in search_str_list:
                 and_cond.append(Event.message.like(f'%%{search_str}%%'))
-            _subquery = _subquery.filter(and_(*and_cond))
-        _subquery = _subquery.offset(offset).limit(limit).subquery()
-        result = session.query(Event).filter(Event.id == _subquery.c.id).all()
-        self._scoped_session.remove()
-        return result
+            query = query.filter(and_(*and_cond))
+        return query
 
-    def get_page_index_by_event_id(self, event_id, channel_rules, limit=20):
+    def get_page_index_by_event_id(self, event_id, channel_rules, limit=20, search_str=''):
+        """
+        Return index of the page containing the event in get_event(offset=index*limit), 0 if not found
 
+        Only events newer than the target are counted by a range of id,
+        the cost depends on how far the event is from the newest one, not on the table size
+        """
         session = self._scoped_session()
-        _subquery = session.query(Event).filter(Event.event_id == event_id).subquery()
+        target_id = session.query(Event.id).filter(Event.event_id == event_id).scalar()
+        if target_id is None:
+            self._scoped_session.remove()
+            return 0
         query = session.query(Event.id)
         if len(channel_rules) > 0:
             query = query.filter(Event.channel.in_(channel_rules))
-        # Fix bug: event_id in page end, return next page
-        # Wrong code: query.filter(Event.id>=subquery.c.id).count()
-        result = query.filter(Event.id > _subquery.c.id).count()
+        query = self._filter_search(query, search_str)
+        result = query.filter(Event.id > target_id).count()
+        self._scoped_session.remove()
         return int(result/limit)
 
     def get_channel_list(self):
-        session = self._scoped_session()
-        result = session.query(Event.channel) \
-            .group_by(Event.channel) \
-            .all()
-        self._scoped_session.remove()
-        return result
+        with self.channel_counter_lock:
+            return [(channel,) for channel in sorted(self.channel_counter) if self.channel_counter[channel] > 0]
+
+    def get_event_count(self, channel_rules):
+        with self.channel_counter_lock:
+            if len(channel_rules) == 0:
+                return sum(self.channel_counter.values())
+            return sum(self.channel_counter.get(channel, 0) for channel in set(channel_rules))
 
     def get_page_count(self, channel_rules, page_size=20, search_str=''):
+        if not search_str:
+            return math.ceil(self.get_event_count(channel_rules) / page_size)
+
         session = self._scoped_session()
         query = session.query(Event.id)
-        search_str_list = [item.strip() for item in search_str.strip().split('+')] if search_str else []
         if len(channel_rules) > 0:
             query = query.filter(Event.channel.in_(channel_rules))
-        if len(search_str_list) > 0:
-            query = query.filter(Event.message != None)
-            and_cond = []
-            for search_str in search_str_list:
-                and_cond.append(Event.message.like(f'%%{search_str}%%'))
-            query = query.filter(and_(*and_cond))
+        query = self._filter_search(query, search_str)
         result = query.count()
         self._scoped_session.remove()
         return math.ceil(result / page_size)
@@ -254,11 +678,16 @@ class LyrebirdDatabaseServer(ThreadServer):
             oversized = threshold_byte and size > threshold_byte
             database_info['threshold'] = threshold_str
             database_info['oversized'] = oversized
-        
+
+        database_info['writer'] = self.get_writer_status()
         return database_info
 
     def reset(self):
-        self.stop()
+        self.forget_known_bodies()
+        # Replaced rather than cleared, a running compaction updates the watermark of the old database
+        self.compact_watermark = {}
+        # Keep the writer thread alive, events in queue are written into the new database
+        self.running = False
         self.database_uri.unlink()
         self.init_engine()
         if not self.server_thread.is_alive():
@@ -266,17 +695,137 @@ class LyrebirdDatabaseServer(ThreadServer):
         self.running = True
 
 
+def is_database_locked(error):
+    """
+    Whether the OperationalError is raised because the database is locked by another connection
+    """
+    return 'database is locked' in str(getattr(error, 'orig', error))
+
+
+def get_fts_content(event, fields):
+    """
+    Join values of selected fields in event as the content of full-text search index
+    """
+    if not fields or not isinstance(event, dict):
+        return ''
+    values = []
+    for field in fields:
+        for node in jsonpath.search(event, field) or []:
+            value = node.node
+            if value is None:
+                continue
+            values.append(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+    return ' '.join(values)
+
+
+def get_sqlite_json_path(field):
+    """
+    Convert field `a.b[0]` to SQLite JSON path `$."a"."b"[0]`, return None if it contains `[*]`
+    """
+    path = '$'
+    for key in jsonpath.parse(field):
+        if key == '[*]':
+            return
+        if key.startswith('['):
+            path += key
+        else:
+            key = key.replace('"', '').replace("'", "''")
+            path += f'."{key}"'
+    return path
+
+
+def get_compression(compression):
+    if not compression:
+        return
+    if compression == COMPRESSION_ZSTD:
+        if zstandard:
+            return COMPRESSION_ZSTD
+        logger.warning(f'[Local DB]zstandard is not installed, zlib is used for event compression')
+        return COMPRESSION_ZLIB
+    if compression != COMPRESSION_ZLIB:
+        logger.warning(f'[Local DB]Unknown event compression {compression}, zlib is used')
+    return COMPRESSION_ZLIB
+
+
+def compress_content(content, compression):
+    if isinstance(content, str):
+        content = content.encode()
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor().compress(content)
+    return zlib.compress(content)
+
+
+def decompress_content(content):
+    """
+    Return compressed content as str, its format is detected by the magic number
+    """
+    content = bytes(content)
+    if content.startswith(ZSTD_MAGIC):
+        if not zstandard:
+            raise RuntimeError('Event content is compressed by zstd, but zstandard is not installed')
+        return zstandard.ZstdDecompressor().decompress(content).decode()
+    return zlib.decompress(content).decode()
+
+
 class Event(Base, JSONFormat):
     __tablename__ = 'event'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     channel = Column(String(16), index=True)
     event_id = Column(String(32), index=True)
+    # str, None in compression mode
     content = Column(Text)
+    # Compressed content in compression mode
+    compressed_content = Column(LargeBinary, default=None)
     message = Column(Text, default=None)
     _timestamp = Column('timestamp', DateTime(timezone=True), default=datetime.datetime.utcnow)
+    # Hash of response body stored in EventBody
+    response_body_hash = Column(String(40), index=True, default=None)
+    # Loaded with the event by a join, so the body is restored for events of any query
+    response_body = relationship(
+        'EventBody',
+        primaryjoin='EventBody.hash == Event.response_body_hash',
+        foreign_keys='Event.response_body_hash',
+        viewonly=True,
+        lazy='joined'
+    )
 
     @hybrid_property
     def timestamp(self):
         seconds_offset = time.localtime().tm_gmtoff
         return self._timestamp.timestamp() + seconds_offset
+
+    @hybrid_property
+    def stored_content(self):
+        return self.compressed_content if self.compressed_content is not None else self.content
+
+    @stored_content.expression
+    def stored_content(cls):
+        # Untyped, str or bytes is returned as it is
+        return func.coalesce(cls.compressed_content, cls.content, type_=NullType)
+
+    def get_content(self):
+        """
+        Return the decompressed content with response body
+        """
+        content = self.content if self.compressed_content is None else decompress_content(self.compressed_content)
+        if not self.response_body_hash or self.response_body is None:
+            return content
+        event = json.loads(content)
+        event['flow']['response']['data'] = decompress_content(self.response_body.data)
+        return json.dumps(event, ensure_ascii=False)
+
+    def json(self):
+        prop_collection = super().json()
+        prop_collection.pop('response_body_hash', None)
+        prop_collection.pop('stored_content', None)
+        if self.stored_content is not None:
+            prop_collection['content'] = self.get_content()
+        return prop_collection
+
+
+class EventBody(Base):
+    __tablename__ = 'event_body'
+
+    hash = Column(String(40), primary_key=True)
+    data = Column(LargeBinary)
@@ -0,0 +1,273 @@
+import json
+import time
+import datetime
+import threading
+import traceback
+from lyrebird import application
+from lyrebird import log
+from lyrebird.utils import convert_size_to_byte
+from lyrebird.base_server import ThreadServer
+from lyrebird.db.database_server import Event, EventBody, compress_content, decompress_content
+from sqlalchemy import func, exists
+
+
+"""
+Event retention server
+
+Worked as a background thread
+Delete or compact old events in database by the policy of each channel
+"""
+
+logger = log.get_logger()
+
+# Seconds between two retention runs
+DEFAULT_INTERVAL = 60
+# Max events deleted or compacted in one transaction, keep the writer thread unblocked
+DEFAULT_BATCH_SIZE = 500
+# Max free pages released by incremental vacuum in one run
+DEFAULT_VACUUM_PAGES = 2000
+
+# Keys kept in event when the event is compacted into metadata only
+METADATA_KEYS = ('channel', 'id', 'timestamp', 'sender', 'message')
+
+
+class EventRetentionServer(ThreadServer):
+    """
+    Retention policy is set by `event.db.retention`, key is channel name, `*` for other channels
+
+    "event.db.retention": {
+        "flow": {
+            "max_age": 7,           # days
+            "max_rows": 100000,
+            "max_bytes": "1GB",
+            "metadata_after": 1     # days, remove request and response body
+        },
+        "*": {
+            "max_rows": 10000
+        }
+    }
+    """
+
+    def __init__(self, db_server):
+        super().__init__()
+        self.name = 'event-retention'
+        self.db_server = db_server
+        self.stop_event = threading.Event()
+        self.retention_status = {
+            'run_count': 0,
+            'deleted_count': 0,
+            'compacted_count': 0,
+            'last_run_time': None,
+            'last_duration': 0
+        }
+
+    def start(self, *args, **kwargs):
+        self.stop_event.clear()
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        super().stop()
+        self.stop_event.set()
+
+    def run(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception:
+                logger.error(f'Event retention failed. {traceback.format_exc()}')
+            self.stop_event.wait(application.config.get('event.db.retention.interval', DEFAULT_INTERVAL))
+
+    def run_once(self):
+        policies = application.config.get('event.db.retention')
+        if not policies:
+            return
+
+        start_time = time.time()
+        deleted_count = 0
+        compacted_count = 0
+        with self.db_server.channel_counter_lock:
+            channels = [channel for channel, count in self.db_server.channel_counter.items() if count > 0]
+        try:
+            for channel in channels:
+                policy = policies.get(channel, policies.get('*'))
+                if not policy:
+                    continue
+                deleted_count += self.apply_policy(channel, policy)
+                if policy.get('metadata_after') is not None:
+                    compacted_count += self.compact(channel, policy['metadata_after'])
+            if deleted_count or compacted_count:
+                self.delete_unused_bodies()
+                self.incremental_vacuum()
+        finally:
+            self.db_server._scoped_session.remove()
+
+        status = self.retention_status
+        status['run_count'] += 1
+        status['deleted_count'] += deleted_count
+        status['compacted_count'] += compacted_count
+        status['last_run_time'] = round(start_time, 3)
+        status['last_duration'] = round((time.time() - start_time) * 1000, 3)
+        if deleted_count or compacted_count:
+            logger.info(f'[Local DB]Retention deleted {deleted_count} events, compacted {compacted_count} events')
+
+    def apply_policy(self, channel, policy):
+        deleted_count = 0
+
+        max_age = policy.get('max_age')
+        if max_age is not None:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=max_age)
+            deleted_count += self.delete_oldest(channel, lambda timestamp, size: timestamp < cutoff)
+
+        max_rows = policy.get('max_rows')
+        if max_rows is not None:
+            with self.db_server.channel_counter_lock:
+                over_count = [self.db_server.channel_counter[channel] - max_rows]
+
+            def is_over_count(timestamp, size):
+                over_count[0] -= 1
+                return over_count[0] >= 0
+            if over_count[0] > 0:
+                deleted_count += self.delete_oldest(channel, is_over_count)
+
+        max_bytes = policy.get('max_bytes')
+        if isinstance(max_bytes, str):
+            max_bytes = convert_size_to_byte(max_bytes)
+        if max_bytes is not None:
+            over_size = [self.db_server.get_channel_size(channel) - max_bytes]
+
+            def is_over_size(timestamp, size):
+                if over_size[0] <= 0:
+                    return False
+                over_size[0] -= size
+                return True
+            if over_size[0] > 0:
+                deleted_count += self.delete_oldest(channel, is_over_size)
+
+        return deleted_count
+
+    def delete_oldest(self, channel, should_delete):
+        """
+        Delete events from the oldest one in batches, until should_delete(timestamp, size) returns False
+        """
+        batch_size = application.config.get('event.db.retention.batch_size', DEFAULT_BATCH_SIZE)
+        session = self.db_server._scoped_session()
+        deleted_count = 0
+        while not self.stop_event.is_set():
+            rows = session.query(Event.id, Event._timestamp, func.length(Event.stored_content)) \
+                .filter(Event.channel == channel) \
+                .order_by(Event.id) \
+                .limit(batch_size) \
+                .all()
+            ids = []
+            deleted_size = 0
+            for event_id, timestamp, size in rows:
+                if not should_delete(timestamp, size or 0):
+                    break
+                ids.append(event_id)
+                deleted_size += size or 0
+            if ids:
+                session.query(Event).filter(Event.id.in_(ids)).delete(synchronize_session=False)
+                session.commit()
+                self.db_server.update_channel_counter(channel, -len(ids), -deleted_size)
+                deleted_count += len(ids)
+            if len(ids) < batch_size:
+                break
+        return deleted_count
+
+    def compact(self, channel, metadata_after):
+        """
+        Only keep the metadata of events older than metadata_after days
+        """
+        batch_size = application.config.get('event.db.retention.batch_size', DEFAULT_BATCH_SIZE)
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=metadata_after)
+        session = self.db_server._scoped_session()
+        compacted_count = 0
+        compact_watermark = self.db_server.compact_watermark
+        while not self.stop_event.is_set():
+            watermark = compact_watermark.get(channel, 0)
+            rows = session.query(Event.id, Event._timestamp, Event.content, Event.compressed_content) \
+                .filter(Event.channel == channel, Event.id > watermark) \
+                .order_by(Event.id) \
+                .limit(batch_size) \
+                .all()
+            updates = []
+            compacted_size = 0
+            is_finished = len(rows) < batch_size
+            for event_id, timestamp, content, compressed_content in rows:
+                if timestamp >= cutoff:
+                    is_finished = True
+                    break
+                watermark = event_id
+                if compressed_content is None:
+                    metadata_content = get_metadata_content(content)
+                    stored_size = len(content or '')
+                else:
+                    metadata_content = get_metadata_content(decompress_content(compressed_content))
+                    stored_size = len(compressed_content)
+                if metadata_content is None:
+                    continue
+                update = {'id': event_id, 'content': metadata_content, 'compressed_content': None, 'response_body_hash': None}
+                if compressed_content is not None:
+                    metadata_content = compress_content(metadata_content, self.db_server.compression)
+                    update.update(content=None, compressed_content=metadata_content)
+                updates.append(update)
+                compacted_size += stored_size - len(metadata_content)
+            if updates:
+                session.bulk_update_mappings(Event, updates)
+                session.commit()
+                self.db_server.update_channel_counter(channel, 0, -compacted_size)
+                compacted_count += len(updates)
+            compact_watermark[channel] = watermark
+            if is_finished:
+                break
+        return compacted_count
+
+    def delete_unused_bodies(self):
+        session = self.db_server._scoped_session()
+        is_used = exists().where(Event.response_body_hash == EventBody.hash)
+        # Wait for the batch being written, its events may use bodies known but not committed by them
+        with self.db_server.body_lock:
+            # Deleted bodies should be sent to the writer again
+            self.db_server.forget_known_bodies()
+            session.query(EventBody).filter(~is_used).delete(synchronize_session=False)
+            session.commit()
+
+    def incremental_vacuum(self):
+        pages = application.config.get('event.db.retention.vacuum_pages', DEFAULT_VACUUM_PAGES)
+        engine = self.db_server._scoped_session().get_bind()
+        connection = engine.raw_connection()
+        try:
+            # sqlite3 `execute` steps the pragma only once, which releases one page
+            connection.connection.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        finally:
+            connection.close()
+
+    def status(self):
+        status = dict(self.retention_status)
+        status['policy'] = application.config.get('event.db.retention')
+        return status
+
+
+def get_metadata_content(content):
+    """
+    Remove the request and response body of flow and other fields in event content
+
+    Return None if the content is not changed
+    """
+    try:
+        event = json.loads(content)
+    except (TypeError, ValueError):
+        return
+    if not isinstance(event, dict) or event.get('metadata_only'):
+        return
+
+    metadata = {key: event[key] for key in METADATA_KEYS if key in event}
+    flow = event.get('flow')
+    if isinstance(flow, dict):
+        flow = dict(flow)
+        for key in ('request', 'response'):
+            if isinstance(flow.get(key), dict):
+                flow[key] = {k: v for k, v in flow[key].items() if k != 'data'}
+        metadata['flow'] = flow
+    metadata['metadata_only'] = True
+    return json.dumps(metadata, ensure_ascii=False)
@@ -5,31 +5,61 @@ Worked as a backgrund thread
 Run events handler and background task worker
 """
 import os
+import re
 import sys
 import copy
 import uuid
 import time
-import copy
 import types
+import zlib
+import bisect
 import signal
 import pickle
+import fnmatch
+import threading
 import inspect
 import importlib
 import functools
 import traceback
 import setuptools
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from lyrebird.base_server import ThreadServer, ProcessServer
 from lyrebird.compatibility import prepare_application_for_monkey_patch, monkey_patch_application, monkey_patch_issue, monkey_patch_publish
 from lyrebird import application
 from lyrebird.mock import context
+from lyrebird.mock.dm.match_index import CompiledMatchRule
 from lyrebird import log
+from lyrebird import shared_payload
+from lyrebird.utils import freeze
 from pathlib import Path
 
 
 logger = log.get_logger()
 # only report the checker which duration more the 5s
 LYREBIRD_METRICS_REPORT_DURSTION = 5000
+# Max number of publish call sites cached for sender attribution
+SENDER_CACHE_SIZE = 4096
+
+# Subscriber queue overflow policy
+OVERFLOW_POLICY_BLOCK = 'block'
+OVERFLOW_POLICY_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_POLICY_DROP_NEWEST = 'drop-newest'
+# Queue is unbounded by default, no event is dropped
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 0
+# Max seconds the dispatcher waits for a full queue of `block` policy, the oldest event is dropped then
+# None waits until the queue has space
+DEFAULT_SUBSCRIBER_BLOCK_TIMEOUT = None
+DEFAULT_SUBSCRIBER_MAX_WORKERS = 1
+# Upper bounds(ms) of subscriber handler latency histogram buckets
+LATENCY_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Multiprocess checker executor pool
+SHARD_BY_CHECKER = 'checker'
+SHARD_BY_FLOW = 'flow'
+DEFAULT_PROCESS_COUNT = 1
+DEFAULT_HEALTH_CHECK_INTERVAL = 5
+HASH_RING_VIRTUAL_NODES = 64
 
 
 class InvalidMessage(Exception):
@@ -140,6 +170,7 @@ class CustomExecuteServer(ProcessServer):
         log_queue = async_obj['logger_queue']
         process_queue = async_obj['process_queue']
         publish_queue = async_obj['publish_queue']
+        payload_release_queue = async_obj.get('payload_release_queue')
 
         # monkey_patch is performed on the context content of the process to ensure 
         # that functions of Lyrebird can still be used in the process.
@@ -158,6 +189,12 @@ class CustomExecuteServer(ProcessServer):
                 if not msg:
                     break
                 func_ori, func_name, callback_args, callback_kwargs, info = msg
+                # Large values are sent by shared memory, release them once copied into this process
+                try:
+                    callback_args, callback_kwargs = shared_payload.resolve_and_release(
+                        (callback_args, callback_kwargs), payload_release_queue)
+                except shared_payload.SharedPayloadError:
+                    continue
                 callback_fn = get_callback_func(func_ori, func_name)
                 self.event_thread_executor.submit(callback_func_run_statistic, callback_fn, callback_args, callback_kwargs, info)
             except Exception:
@@ -171,6 +208,140 @@ class CustomExecuteServer(ProcessServer):
         super().start()
 
 
+class CustomExecutePool(ThreadServer):
+    """
+    Pool of CustomExecuteServer processes, run multiprocess checkers on multiple cores
+
+    Each process has its own queue, callbacks are sharded by consistent hash of
+        checker: origin and name of callback function, events of one checker are handled in order
+        flow: flow id, events of one flow are handled in order
+    set by `event.multiprocess.shard_by`, process count is set by `event.multiprocess.process_count`
+    Order is kept only if `event.multiprocess.thread_max_worker` is 1
+    Large bodies are sent by shared memory if the shared_payload server is running
+
+    Worked as a background thread, restart the crashed process
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.name = 'event-process-pool'
+        self.async_obj = {}
+        self.workers = []
+        self.worker_queues = []
+        self.restart_count = []
+        self.submit_count = []
+        # submit is called by subscriber workers in parallel
+        self.submit_count_lock = threading.Lock()
+        # [(hash, worker index)] sorted by hash
+        self.hash_ring = []
+        self.hash_ring_keys = []
+        self.shard_by = SHARD_BY_CHECKER
+        self.stop_event = threading.Event()
+        self.payload_server = None
+
+    def start(self, *args, **kwargs):
+        if self.running:
+            return
+        self.payload_server = application.server.get('shared_payload')
+        if self.payload_server:
+            self.async_obj['payload_release_queue'] = self.payload_server.release_queue
+        process_count = max(1, application.config.get('event.multiprocess.process_count', DEFAULT_PROCESS_COUNT))
+        self.shard_by = application.config.get('event.multiprocess.shard_by', SHARD_BY_CHECKER)
+        self.worker_queues = [application.sync_manager.get_multiprocessing_queue() for _ in range(process_count)]
+        self.workers = [None] * process_count
+        self.build_hash_ring(process_count)
+        for index in range(process_count):
+            self.start_worker(index)
+        self.stop_event.clear()
+        super().start(*args, **kwargs)
+
+    def start_worker(self, index):
+        worker = CustomExecuteServer()
+        worker.async_obj = dict(self.async_obj)
+        worker.async_obj['process_queue'] = self.worker_queues[index]
+        worker.start()
+        self.workers[index] = worker
+
+    def run(self):
+        interval = application.config.get('event.multiprocess.health_check_interval', DEFAULT_HEALTH_CHECK_INTERVAL)
+        while not self.stop_event.wait(interval):
+            for index, worker in enumerate(self.workers):
+                if not self.running:
+                    return
+                if worker.server_process and worker.server_process.is_alive():
+                    continue
+                exitcode = worker.server_process.exitcode if worker.server_process else None
+                logger.warning(f'Event process executor {index} exited with code {exitcode}, restarting')
+                try:
+                    worker.terminate()
+                    self.start_worker(index)
+                    self.restart_count[index] += 1
+                except Exception:
+                    logger.error(f'Restart event process executor {index} failed. {traceback.format_exc()}')
+
+    def build_hash_ring(self, process_count):
+        self.restart_count = [0] * process_count
+        self.submit_count = [0] * process_count
+        self.hash_ring = sorted(
+            (zlib.crc32(f'{index}-{node}'.encode()), index)
+            for index in range(process_count)
+            for node in range(HASH_RING_VIRTUAL_NODES)
+        )
+        self.hash_ring_keys = [key for key, _ in self.hash_ring]
+
+    def get_worker_index(self, shard_key):
+        if len(self.hash_ring_keys) <= HASH_RING_VIRTUAL_NODES:
+            return 0
+        position = bisect.bisect(self.hash_ring_keys, zlib.crc32(str(shard_key).encode()))
+        return self.hash_ring[position % len(self.hash_ring)][1]
+
+    def get_shard_key(self, func_info, event):
+        if self.shard_by == SHARD_BY_FLOW and isinstance(event.message, dict):
+            flow = event.message.get('flow')
+            if isinstance(flow, dict) and flow.get('id'):
+                return flow['id']
+        return f'{func_info.get("origin")}:{func_info.get("name")}'
+
+    def submit(self, func_info, event, callback_args, callback_kwargs, info):
+        index = self.get_worker_index(self.get_shard_key(func_info, event))
+        with self.submit_count_lock:
+            self.submit_count[index] += 1
+        if self.payload_server:
+            callback_args = self.payload_server.export(callback_args)
+        self.worker_queues[index].put((
+            func_info.get('origin'),
+            func_info.get('name'),
+            callback_args,
+            callback_kwargs,
+            info
+        ))
+
+    def stop(self):
+        super().stop()
+        self.stop_event.set()
+        for worker in self.workers:
+            if worker:
+                worker.stop()
+        for worker_queue in self.worker_queues:
+            worker_queue.put(None)
+
+    def terminate(self):
+        for worker in self.workers:
+            if worker:
+                worker.terminate()
+
+    def status(self):
+        return {
+            'shard_by': self.shard_by,
+            'workers': [{
+                'pid': worker.server_process.pid if worker and worker.server_process else None,
+                'alive': bool(worker and worker.server_process and worker.server_process.is_alive()),
+                'restart': self.restart_count[index],
+                'submitted': self.submit_count[index]
+            } for index, worker in enumerate(self.workers)]
+        }
+
+
 class PublishServer(ThreadServer):
     def __init__(self):
         super().__init__()
@@ -188,10 +359,182 @@ class PublishServer(ThreadServer):
                 traceback.print_exc()
 
 
+class Subscriber:
+    """
+    Subscription of a callback function
+
+    Each subscriber has its own queue and worker threads, so a slow callback only delays itself.
+    The queue is unbounded by default. When `queue_size` is set and the queue is full, the overflow policy decides:
+        block: wait until the queue has space, EventServer stops dispatching until then, the default
+               if `block_timeout` seconds is set, the wait is limited by it and the oldest event is dropped after it
+        drop-oldest: drop the oldest event in queue
+        drop-newest: drop the new event
+    Dropped events are counted in status and logged
+
+    Queue size, overflow policy, block timeout and worker count are set by func_info keys
+    `queue_size`, `overflow_policy`, `block_timeout` and `max_workers`, or by config `event.subscriber.*`
+
+    Channel could be a wildcard pattern such as `flow*`, and func_info key `rules` filters events
+    with match rules of mock data, e.g. {'flow.request.host': '(?=.*meituan)'}
+    """
+
+    def __init__(self, event_server, func_info, args, kwargs, process_executor=None):
+        self.event_server = event_server
+        self.func_info = func_info
+        self.args = args
+        self.kwargs = kwargs
+        self.process_executor = process_executor
+        self.resolve_callback()
+        channel = func_info['channel']
+        self.channel_pattern = re.compile(fnmatch.translate(channel)) if is_channel_pattern(channel) else None
+        self.rule = CompiledMatchRule(func_info['rules']) if func_info.get('rules') else None
+        self.maxsize = func_info.get('queue_size') or \
+            application.config.get('event.subscriber.queue_size', DEFAULT_SUBSCRIBER_QUEUE_SIZE)
+        self.overflow_policy = func_info.get('overflow_policy') or \
+            application.config.get('event.subscriber.overflow_policy', OVERFLOW_POLICY_BLOCK)
+        self.block_timeout = func_info.get('block_timeout') or \
+            application.config.get('event.subscriber.block_timeout', DEFAULT_SUBSCRIBER_BLOCK_TIMEOUT)
+        self.max_workers = func_info.get('max_workers') or \
+            application.config.get('event.subscriber.max_workers', DEFAULT_SUBSCRIBER_MAX_WORKERS)
+
+        self.queue = deque()
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+        self.workers = []
+        self.running = True
+
+        self.received_count = 0
+        self.filtered_count = 0
+        self.dropped_count = 0
+        self.processed_count = 0
+        self.max_latency = 0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def resolve_callback(self):
+        """
+        Inspect callback function once, broadcast_handler uses the result for every event
+        """
+        callback_fn = self.func_info.get('func')
+        func_sig = inspect.signature(callback_fn)
+        func_parameters = list(func_sig.parameters.values())
+        self.is_valid = len(func_parameters) >= 1 and func_parameters[0].default == inspect._empty
+        self.accepts_channel = 'channel' in func_sig.parameters
+        self.accepts_event_id = 'event_id' in func_sig.parameters
+        self.is_process = bool(self.func_info.get('process') and self.process_executor) and \
+            isinstance(callback_fn, types.FunctionType)
+        if not self.is_valid:
+            logger.error(f'Event callback function [{callback_fn.__name__}] need a argument for receiving event object')
+
+    def match(self, event):
+        """
+        Check the event with subscriber rules before put it into queue
+        """
+        if not self.rule:
+            return True
+        try:
+            is_match = self.rule.match(event.message)
+        except Exception:
+            logger.error(f'Event subscriber [{self.name}] rules error. {traceback.format_exc()}')
+            is_match = False
+        if not is_match:
+            self.filtered_count += 1
+        return is_match
+
+    @property
+    def name(self):
+        callback_fn = self.func_info.get('func')
+        return self.func_info.get('name') or getattr(callback_fn, '__name__', str(callback_fn))
+
+    def put(self, event):
+        with self.mutex:
+            if not self.running:
+                return
+            self.received_count += 1
+            if self.maxsize and len(self.queue) >= self.maxsize:
+                if self.overflow_policy == OVERFLOW_POLICY_DROP_NEWEST:
+                    self._drop()
+                    return
+                if self.overflow_policy == OVERFLOW_POLICY_BLOCK:
+                    deadline = time.time() + self.block_timeout if self.block_timeout else None
+                    while len(self.queue) >= self.maxsize and self.running:
+                        if deadline is None:
+                            self.not_full.wait()
+                            continue
+                        timeout = deadline - time.time()
+                        if timeout <= 0:
+                            break
+                        self.not_full.wait(timeout)
+                if len(self.queue) >= self.maxsize:
+                    self.queue.popleft()
+                    self._drop()
+            self.queue.append(event)
+            self.not_empty.notify()
+            if len(self.workers) < self.max_workers:
+                self._start_worker()
+
+    def _drop(self):
+        # Called with mutex held
+        self.dropped_count += 1
+        logger.warning(f'Event subscriber [{self.name}] queue is full, event is dropped by {self.overflow_policy} policy. Dropped: {self.dropped_count}')
+
+    def stop(self):
+        with self.mutex:
+            self.running = False
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def _start_worker(self):
+        worker = threading.Thread(target=self._work, name=f'event-subscriber-{self.name}', daemon=True)
+        self.workers.append(worker)
+        worker.start()
+
+    def _work(self):
+        while True:
+            with self.mutex:
+                while not self.queue and self.running:
+                    self.not_empty.wait()
+                if not self.queue:
+                    return
+                event = self.queue.popleft()
+                self.not_full.notify()
+
+            start_time = time.time()
+            self.event_server.broadcast_handler(self, event)
+            latency = (time.time() - start_time) * 1000
+
+            with self.mutex:
+                self.processed_count += 1
+                self.max_latency = max(self.max_latency, latency)
+                self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def status(self):
+        with self.mutex:
+            histogram = {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.latency_histogram)}
+            histogram['+Inf'] = self.latency_histogram[-1]
+            return {
+                'name': self.name,
+                'channel': self.func_info.get('channel'),
+                'queue_size': len(self.queue),
+                'max_queue_size': self.maxsize,
+                'overflow_policy': self.overflow_policy,
+                'workers': len(self.workers),
+                'max_workers': self.max_workers,
+                'received': self.received_count,
+                'filtered': self.filtered_count,
+                'dropped': self.dropped_count,
+                'processed': self.processed_count,
+                'max_latency': round(self.max_latency, 3),
+                'latency_histogram': histogram
+            }
+
+
 class EventServer(ThreadServer):
 
     async_starting = False
     publish_trace_deep = 3
+    # {code object: (file name, function name)}
+    sender_cache = {}
 
     def __init__(self, no_start = False):
         super().__init__()  
@@ -199,36 +542,30 @@ class EventServer(ThreadServer):
         self.pubsub_channels = {}
         # channel name is 'any'. Linstening on all channel
         self.any_channel = []
-        self.process_executor_queue = None
+        # channel name is a wildcard pattern, such as 'flow*'
+        self.pattern_channels = []
+        # {channel: subscribers}, rebuilt after subscribe or unsubscribe
+        self.dispatch_cache = {}
         self.event_queue = None
-        self.broadcast_executor = None
         self.process_executor = None
         self.publish_server = None
         self.only_report_channel = None
+        # (config value, channel set) of `event.multiprocess.channels`
+        self.multiprocess_channels = None
         if not no_start:
             self.only_report_channel = application.config.get('event.only_report_channel', [])
-            self.process_executor_queue = application.sync_manager.get_multiprocessing_queue()
-            self.event_queue = application.sync_manager.get_queue()
-            self.broadcast_executor = ThreadPoolExecutor(thread_name_prefix='event-broadcast-')
-            self.process_executor = CustomExecuteServer()
+            # Events are published and dispatched in main process, only process subscribers need pickle
+            self.event_queue = application.sync_manager.get_thread_queue()
+            self.process_executor = CustomExecutePool()
             self.publish_server = PublishServer()
 
-    def broadcast_handler(self, func_info, event, args, kwargs, process_queue=None):
+    def broadcast_handler(self, subscriber, event):
         """
-
+        Call the callback function of subscriber with event, or send it to process executor
         """
-        callback_fn = func_info.get('func')
-        is_process = func_info.get('process')
-
-        # Check
-        func_sig = inspect.signature(callback_fn)
-        func_parameters = list(func_sig.parameters.values())
-        if len(func_parameters) < 1 or func_parameters[0].default != inspect._empty:
-            logger.error(f'Event callback function [{callback_fn.__name__}] need a argument for receiving event object')
+        if not subscriber.is_valid:
             return
-        
-        # get enable multiprocess channel list
-        multiprocess_channel_list = application.config.get('event.multiprocess.channels', [])
+        callback_fn = subscriber.func_info.get('func')
 
         # Append event content to args
         callback_args = []
@@ -238,9 +575,9 @@ class EventServer(ThreadServer):
             callback_args.append(event.message)
         # Add channel to kwargs
         callback_kwargs = {}
-        if 'channel' in func_sig.parameters:
+        if subscriber.accepts_channel:
             callback_kwargs['channel'] = event.channel
-        if 'event_id' in func_sig.parameters:
+        if subscriber.accepts_event_id:
             callback_kwargs['event_id'] = event.id
         # add report info
         info = dict()
@@ -253,33 +590,35 @@ class EventServer(ThreadServer):
         info['channel'] = event.channel
         # Execute callback function
         try:
-            if EventServer.async_starting and is_process and isinstance(callback_fn, types.FunctionType) and event.channel in multiprocess_channel_list:
-                process_queue.put((
-                    func_info.get('origin'),
-                    func_info.get('name'),
-                    callback_args,
-                    callback_kwargs,
-                    info
-                ))
+            if EventServer.async_starting and subscriber.is_process and event.channel in self.get_multiprocess_channels():
+                subscriber.process_executor.submit(subscriber.func_info, event, callback_args, callback_kwargs, info)
             else:
                 callback_func_run_statistic(callback_fn, callback_args, callback_kwargs, info)
         except Exception:
             logger.error(f'Event callback function [{callback_fn.__name__}] error. {traceback.format_exc()}')
 
+    def get_multiprocess_channels(self):
+        """
+        Channel set is rebuilt when the config value is replaced or a config_update event is published
+        """
+        channels = application.config.get('event.multiprocess.channels', [])
+        cached = self.multiprocess_channels
+        if cached is None or cached[0] is not channels:
+            cached = (channels, frozenset(channels))
+            self.multiprocess_channels = cached
+        return cached[1]
+
     def run(self):
         while self.running:
             try:
                 e = self.event_queue.get()
                 if not e:
                     break
-                # Deep copy event for async event system
-                e = copy.deepcopy(e)
-                callback_fn_list = self.pubsub_channels.get(e.channel)
-                if callback_fn_list:
-                    for callback_fn, args, kwargs in callback_fn_list:
-                        self.broadcast_executor.submit(self.broadcast_handler, callback_fn, e, args, kwargs, self.process_executor_queue)
-                for callback_fn, args, kwargs in self.any_channel:
-                    self.broadcast_executor.submit(self.broadcast_handler, callback_fn, e, args, kwargs)
+                if e.channel == 'config_update':
+                    self.multiprocess_channels = None
+                for subscriber in self.get_channel_subscribers(e.channel):
+                    if subscriber.match(e):
+                        subscriber.put(e)
             except Exception:
                 # empty event
                 traceback.print_exc()
@@ -288,7 +627,6 @@ class EventServer(ThreadServer):
         if not self.publish_server.running:
             self.publish_server.start()
         self.process_namespace = prepare_application_for_monkey_patch()
-        self.process_executor.async_obj['process_queue'] = self.process_executor_queue
         self.process_executor.async_obj['process_namespace'] = self.process_namespace
         self.process_executor.async_obj['publish_queue'] = self.publish_server.publish_msg_queue
         self.process_executor.async_obj['eventserver'] = EventServer
@@ -301,6 +639,9 @@ class EventServer(ThreadServer):
         self.publish('system', {'name': 'event.stop'})
         time.sleep(1)
         super().stop()
+        self.event_queue.put(None)
+        for subscriber in self.get_subscribers():
+            subscriber.stop()
         self.process_executor.stop()
         self.publish_server.stop()
 
@@ -335,17 +676,33 @@ class EventServer(ThreadServer):
             message['timestamp'] = round(time.time(), 3)
 
             # Add event sender
-            stack = inspect.stack()
-            script_path = stack[EventServer.publish_trace_deep].filename
-            script_name = script_path[script_path.rfind('/') + 1:]
-            function_name = stack[EventServer.publish_trace_deep].function
-            sender_dict = {
-                "file": script_name,
-                "function": function_name
-            }
-            message['sender'] = sender_dict   
+            if application.config.get('event.sender_attribution', True):
+                message['sender'] = EventServer.get_sender(EventServer.publish_trace_deep + 1)
         return (event_id, channel, message)
 
+    @staticmethod
+    def get_sender(depth):
+        """
+        Return file name and function name of the frame at depth, relative to the caller of this function
+
+        Frames are walked directly without reading source context, the result is cached by code object
+        """
+        try:
+            code = sys._getframe(depth).f_code
+        except ValueError:
+            return {'file': None, 'function': None}
+        sender = EventServer.sender_cache.get(code)
+        if sender is None:
+            script_path = code.co_filename
+            sender = (script_path[script_path.rfind('/') + 1:], code.co_name)
+            if len(EventServer.sender_cache) >= SENDER_CACHE_SIZE:
+                EventServer.sender_cache.clear()
+            EventServer.sender_cache[code] = sender
+        return {
+            'file': sender[0],
+            'function': sender[1]
+        }
+
     def publish(self, channel, message, state=False, event_id=None, *args, **kwargs):
         """
         publish message
@@ -361,8 +718,13 @@ class EventServer(ThreadServer):
         """
         event_id, channel, message = EventServer.get_publish_message(channel, message, event_id)
 
-        if channel in self.pubsub_channels or channel not in self.only_report_channel:
-            self.event_queue.put(Event(event_id, channel, message))
+        if channel not in self.only_report_channel or self.is_channel_subscribed(channel):
+            # Snapshot of message, shared by all subscribers without copy
+            if application.config.get('event.frozen_message', True):
+                snapshot = freeze(message)
+            else:
+                snapshot = copy.deepcopy(message)
+            self.event_queue.put(Event(event_id, channel, snapshot))
 
         # TODO Remove state and raw data
         if state:
@@ -371,8 +733,8 @@ class EventServer(ThreadServer):
             else:
                 self.state[channel] = message
 
-        # Send event to socket-io
-        context.application.socket_io.emit('event', {'id': event_id, 'channel': channel})
+        # Send event to socket-io, notifications are batched by emitter
+        context.emit('event', {'id': event_id, 'channel': channel})
 
         # Send report
         if application.reporter:
@@ -389,17 +751,30 @@ class EventServer(ThreadServer):
         Subscribe channel with a callback function
         That function will be called when a new message was published into it's channel
 
+        channel could be:
+            channel name
+            'any' for all channels
+            wildcard pattern, such as 'flow*'
+
+        func_info['rules'] is optional, only events matched rules are sent to the callback function
+
         callback function kwargs:
             channel=None receive channel name
         """
         channel = func_info['channel']
         if 'process' not in func_info:
             func_info['process'] = True
+        # Lists are replaced instead of modified, the dispatching thread iterates them without lock
         if channel == 'any':
-            self.any_channel.append([func_info, args, kwargs])
+            subscriber = Subscriber(self, func_info, args, kwargs)
+            self.any_channel = self.any_channel + [subscriber]
+        elif is_channel_pattern(channel):
+            subscriber = Subscriber(self, func_info, args, kwargs, self.process_executor)
+            self.pattern_channels = self.pattern_channels + [subscriber]
         else:
-            callback_fn_list = self.pubsub_channels.setdefault(channel, [])
-            callback_fn_list.append([func_info, args, kwargs])
+            subscriber = Subscriber(self, func_info, args, kwargs, self.process_executor)
+            self.pubsub_channels[channel] = self.pubsub_channels.get(channel, []) + [subscriber]
+        self.dispatch_cache = {}
 
     def unsubscribe(self, target_func_info, *args, **kwargs):
         """
@@ -407,14 +782,60 @@ class EventServer(ThreadServer):
         """
         channel = target_func_info['channel']
         if channel == 'any':
-            for any_info, *_ in self.any_channel:
-                if target_func_info['func'] == any_info['func']:
-                    self.any_channel.remove([target_func_info, *_])
+            subscribers = self.any_channel
+        elif is_channel_pattern(channel):
+            subscribers = self.pattern_channels
         else:
-            callback_fn_list = self.pubsub_channels.get(channel)
-            for callback_fn_info, *_ in callback_fn_list:
-                if target_func_info['func'] == callback_fn_info['func']:
-                    callback_fn_list.remove([target_func_info, *_])
+            subscribers = self.pubsub_channels.get(channel, [])
+        removed = [s for s in subscribers if s.func_info['channel'] == channel and s.func_info['func'] == target_func_info['func']]
+        if not removed:
+            return
+        remained = [s for s in subscribers if s not in removed]
+        if channel == 'any':
+            self.any_channel = remained
+        elif is_channel_pattern(channel):
+            self.pattern_channels = remained
+        else:
+            self.pubsub_channels[channel] = remained
+        self.dispatch_cache = {}
+        # Events in queue are still handled before the worker exits
+        for subscriber in removed:
+            subscriber.stop()
+
+    def get_channel_subscribers(self, channel):
+        """
+        Subscribers of channel name, wildcard patterns and 'any', the result is cached by channel
+        """
+        dispatch_cache = self.dispatch_cache
+        subscribers = dispatch_cache.get(channel)
+        if subscribers is None:
+            subscribers = list(self.pubsub_channels.get(channel, []))
+            subscribers.extend(s for s in self.pattern_channels if s.channel_pattern.match(channel))
+            subscribers.extend(self.any_channel)
+            subscribers = tuple(subscribers)
+            dispatch_cache[channel] = subscribers
+        return subscribers
+
+    def is_channel_subscribed(self, channel):
+        """
+        Whether channel is subscribed by its name or a wildcard pattern, 'any' is not counted
+        """
+        if channel in self.pubsub_channels:
+            return True
+        return any(s.channel_pattern.match(channel) for s in self.pattern_channels)
+
+    def get_subscribers(self):
+        subscribers = list(self.any_channel) + list(self.pattern_channels)
+        for channel_subscribers in list(self.pubsub_channels.values()):
+            subscribers.extend(channel_subscribers)
+        return subscribers
+
+    def get_subscriber_status(self):
+        return [subscriber.status() for subscriber in self.get_subscribers()]
+
+
+def is_channel_pattern(channel):
+    return isinstance(channel, str) and any(c in channel for c in '*?[')
 
 
 class CustomEventReceiver:
@@ -433,9 +854,9 @@ class CustomEventReceiver:
     def __init__(self):
         self.listeners = []
 
-    def __call__(self, channel, object=False, *args, **kw):
+    def __call__(self, channel, object=False, *args, rules=None, **kw):
         def func(origin_func):
-            self.listeners.append(dict(channel=channel, func=origin_func, object=object))
+            self.listeners.append(dict(channel=channel, func=origin_func, object=object, rules=rules))
             return origin_func
         return func
 
@@ -444,7 +865,8 @@ class CustomEventReceiver:
             event_bus.subscribe({
                 'name': 'CustomEventReceiver',
                 'channel': listener['channel'],
-                'func': listener['func']
+                'func': listener['func'],
+                'rules': listener['rules']
             })
 
     def unregister(self, event_bus):
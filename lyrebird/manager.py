@@ -15,10 +15,13 @@ from lyrebird import application, log, project_builder, reporter, version
 from lyrebird.checker import LyrebirdCheckerServer
 from lyrebird.config import ConfigManager
 from lyrebird.db.database_server import LyrebirdDatabaseServer
+from lyrebird.db.retention import EventRetentionServer
 from lyrebird.event import EventServer
+from lyrebird.shared_payload import SharedPayloadServer
 from lyrebird.mock.dm.label import LabelHandler
 from lyrebird.mock.extra_mock_server import ExtraMockServer
 from lyrebird.mock.handlers.encoder_decoder_handler import EncoderDecoder
+from lyrebird.mock.handlers.handler_context import create_request_post_pipeline
 from lyrebird.mock.mock_server import LyrebirdMockServer
 from lyrebird.notice_center import NoticeCenter
 from lyrebird.plugins import PluginManager
@@ -213,11 +216,14 @@ def run(args: argparse.Namespace):
     # Settings server
     application.server['settings'] = SettingsManager()
     application.server['settings'].load_settings()
+    # Large payloads sent to child processes
+    application.server['shared_payload'] = SharedPayloadServer()
     # Main server
     application.server['event'] = EventServer()
     # mutilprocess message dispatcher
     application.server['dispather'] = MultiProcessServerMessageDispatcher()
     application.server['task'] = BackgroundTaskServer()
+    application.server['task'].add_pipeline(create_request_post_pipeline())
 
     # Start mitmproxy server
     # if set --no-mitm in commandline , skip start proxy server
@@ -236,6 +242,7 @@ def run(args: argparse.Namespace):
     application.server['db'] = LyrebirdDatabaseServer(path=args.database)
     if not hasattr(application.server['db'], 'session'):
         return
+    application.server['db_retention'] = EventRetentionServer(application.server['db'])
     application.server['plugin'] = PluginManager()
     application.server['checker'] = LyrebirdCheckerServer()
 
@@ -1,13 +1,13 @@
 from flask import Blueprint, request
 from flask_restful import Api
-from .common import Status, WorkMode, Manifest, DiffMode, Render
+from .common import Status, WorkMode, Manifest, DiffMode, Render, TaskStatus, UpstreamStatus
 from .flow import Flow, FlowList
 from .mock import MockData, MockGroup, ActivatedMockGroup, MockGroupByName, MockDataLabel, TreeView, OpenNodes
 from .config import Conf
 from .menu import Menu
 from .notice import Notice
 from .checker import Checker
-from .event import Event, EventExport, Channel, EventFileInfo
+from .event import Event, EventExport, Channel, EventFileInfo, EventSubscriber
 from .conflict_check import ConflictCheck, ActivatedDataConflictCheck
 from .mock_editor import Cut, Copy, Paste, Duplicate
 from .qrcode import Qrcode
@@ -60,6 +60,8 @@ api_source.add_resource(Conf, '/conf')
 api_source.add_resource(WorkMode, '/mode', '/mode/<string:mode>')
 api_source.add_resource(DiffMode, '/diffmode')
 api_source.add_resource(Render, '/render')
+api_source.add_resource(TaskStatus, '/task')
+api_source.add_resource(UpstreamStatus, '/upstream')
 api_source.add_resource(Menu, '/menu')
 api_source.add_resource(Notice, '/notice')
 api_source.add_resource(Checker, '/checker', '/checker/<string:checker_id>', '/checker/search')
@@ -93,4 +95,5 @@ api_source.add_resource(EventExport, '/event/export', '/event/export/<string:eve
 api_source.add_resource(Channel, '/channel', '/channel/<string:mode>')
 api_source.add_resource(StatusBar, '/statusbar', '/statusbar/<string:item_id>')
 api_source.add_resource(EventFileInfo, '/event/fileinfo')
+api_source.add_resource(EventSubscriber, '/event/subscriber')
 api_source.add_resource(SettingsApi, '/settings', '/settings/<string:action>')
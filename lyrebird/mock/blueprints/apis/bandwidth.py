@@ -1,12 +1,41 @@
+import time
+import random
+import threading
+from collections import OrderedDict
 from flask_restful import Resource,request
 from lyrebird import application
 from lyrebird import log
 logger = log.get_logger()
 
+"""
+Bandwidth simulation
+
+Responses are throttled by token buckets, shared by each client address or by all clients.
+Debt of a bucket is paid by sleeping once it is worth a tick, so a response is sent by coarse-grained
+chunks with few sleeps, and the total time keeps close to size / bandwidth.
+
+Latency and jitter (ms) are waited once before the first byte of each response.
+"""
+
+BANDWIDTH_SCOPE_CLIENT = 'client'
+BANDWIDTH_SCOPE_GLOBAL = 'global'
+
+# Seconds of data sent in each chunk
+THROTTLE_TICK = 0.05
+# Debt less than it is not paid by sleeping at once
+MIN_SLEEP_TIME = 0.01
+MIN_CHUNK_SIZE = 2048
+MAX_CHUNK_SIZE = 256 * 1024
+# Buckets of clients kept, the least recently used one is dropped
+MAX_BUCKETS = 1000
+
 
 class Conf:
     def __init__(self):
         self.bandwidth = -1
+        self.latency = 0
+        self.jitter = 0
+        self.scope = BANDWIDTH_SCOPE_CLIENT
         self.bandwidth_templates = [
             {
                 "template_name": "UNLIMITED",
@@ -32,24 +61,141 @@ class Conf:
             i["template_name"]: i["bandwidth"] for i in self.bandwidth_templates}
 config = Conf()
 
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        # Bytes per second
+        self.rate = rate
+        self.capacity = capacity
+        # Bucket starts empty, the first chunk is not sent at once
+        self.tokens = 0
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        """
+        Take tokens of size, return seconds to wait before sending
+
+        Tokens may be negative, the debt is paid by later waiting
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.tokens -= size
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+class BandwidthThrottler:
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.lock = threading.Lock()
+        self.rate = None
+        self.scope = None
+        # {client address or None: TokenBucket}
+        self.buckets = OrderedDict()
+        self.sleep_count = 0
+
+    @staticmethod
+    def get_chunk_size(rate):
+        return int(min(max(rate * THROTTLE_TICK, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE))
+
+    def get_bucket(self, client_address=None):
+        rate = self.conf.bandwidth * 1024
+        key = client_address if self.conf.scope == BANDWIDTH_SCOPE_CLIENT else None
+        with self.lock:
+            if rate != self.rate or self.conf.scope != self.scope:
+                self.buckets.clear()
+                self.rate = rate
+                self.scope = self.conf.scope
+            bucket = self.buckets.get(key)
+            if bucket:
+                self.buckets.move_to_end(key)
+                return bucket
+            bucket = self.buckets[key] = TokenBucket(rate, self.get_chunk_size(rate))
+            if len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+            return bucket
+
+    def wait_latency(self):
+        latency = self.conf.latency
+        if self.conf.jitter:
+            latency += random.uniform(-self.conf.jitter, self.conf.jitter)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def throttle(self, chunks, client_address=None):
+        """
+        Yield chunks in the bandwidth, large chunks are split
+        """
+        self.wait_latency()
+        if self.conf.bandwidth <= 0:
+            yield from chunks
+            return
+
+        bucket = self.get_bucket(client_address)
+        chunk_size = self.get_chunk_size(bucket.rate)
+        for chunk in chunks:
+            for i in range(0, max(len(chunk), 1), chunk_size):
+                part = chunk[i:i+chunk_size]
+                wait_time = bucket.reserve(len(part))
+                if wait_time >= MIN_SLEEP_TIME:
+                    with self.lock:
+                        self.sleep_count += 1
+                    time.sleep(wait_time)
+                yield part
+
+    def status(self):
+        with self.lock:
+            return {
+                'rate': self.rate,
+                'scope': self.scope,
+                'bucket_count': len(self.buckets),
+                'sleep_count': self.sleep_count
+            }
+
+
+throttler = BandwidthThrottler(config)
+
 class Bandwidth(Resource):
     """
     网络带宽
     """
     def get(self):
         return application.make_ok_response(
-            bandwidth=config.bandwidth
+            bandwidth=config.bandwidth,
+            latency=config.latency,
+            jitter=config.jitter,
+            scope=config.scope,
+            throttler=throttler.status()
         )
     def put(self):
-        template = request.json["templateName"]
+        template = request.json.get("templateName")
+        scope = request.json.get("scope")
+        if scope is not None and scope not in (BANDWIDTH_SCOPE_CLIENT, BANDWIDTH_SCOPE_GLOBAL):
+            return application.make_fail_response(msg=f'invalid scope ! request data is {scope}')
+        for key in ('latency', 'jitter'):
+            value = request.json.get(key)
+            if value is not None and (not isinstance(value, (int, float)) or value < 0):
+                return application.make_fail_response(msg=f'invalid {key} ! request data is {value}')
         # check template valid
-        if template in list(config.indexes_by_name.keys()):
+        if template is not None and template not in config.indexes_by_name:
+            return application.make_fail_response(msg=f'invalid template ! request data is {template}')
+
+        if template is not None:
             # reset bandwidth
             config.bandwidth = config.indexes_by_name[template]
-            logger.debug(f'Modified bandwidth: {config.bandwidth}')
-            return application.make_ok_response(bandwidth=config.bandwidth)
-        else:
-            return application.make_fail_response(msg=f'invalid template ! request data is {template}')
+        if scope is not None:
+            config.scope = scope
+        for key in ('latency', 'jitter'):
+            if request.json.get(key) is not None:
+                setattr(config, key, request.json[key])
+        logger.debug(f'Modified bandwidth: {config.bandwidth}, latency: {config.latency}, jitter: {config.jitter}, scope: {config.scope}')
+        return application.make_ok_response(bandwidth=config.bandwidth)
 
 class BandwidthTemplates(Resource):
     """
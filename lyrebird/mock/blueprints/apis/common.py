@@ -4,6 +4,7 @@ from flask import request
 from lyrebird import utils
 from lyrebird import version
 from lyrebird import application
+from lyrebird.mock.handlers import proxy_handler
 
 
 class Status(Resource):
@@ -58,8 +59,23 @@ class DiffMode(Resource):
 
 class Render(Resource):
 
+    def get(self):
+        return context.make_ok_response(data=utils.render_cache.status())
+
     def put(self):
         origin_data = request.json.get('data')
         enable_tojson = request.json.get('enable_tojson', True)
         data = utils.render(origin_data, enable_tojson)
         return context.make_ok_response(data=data)
+
+
+class TaskStatus(Resource):
+
+    def get(self):
+        return application.make_ok_response(data=application.server['task'].status())
+
+
+class UpstreamStatus(Resource):
+
+    def get(self):
+        return application.make_ok_response(data=proxy_handler.upstream_client.status())
@@ -17,10 +17,16 @@ class Event(Resource):
         channel_rules = []
         if channel:
             channel_rules = channel.split('+')
+        # Cursor is the id of the last event in previous page
+        before_id = request.args.get('before', type=int)
         if event_id:
-            page = db.get_page_index_by_event_id(event_id, channel_rules, limit=PAGE_SIZE)
-        events = db.get_event(channel_rules, offset=page*PAGE_SIZE, limit=PAGE_SIZE, search_str=search_str)
+            page = db.get_page_index_by_event_id(event_id, channel_rules, limit=PAGE_SIZE, search_str=search_str)
+        if before_id is not None:
+            events = db.get_event(channel_rules, limit=PAGE_SIZE, search_str=search_str, before_id=before_id)
+        else:
+            events = db.get_event(channel_rules, offset=page*PAGE_SIZE, limit=PAGE_SIZE, search_str=search_str)
         page_count = db.get_page_count(channel_rules, page_size=PAGE_SIZE, search_str=search_str)
+        next_cursor = events[-1].id if len(events) == PAGE_SIZE else None
         result = []
         for event in events:
             event_str = event.json()
@@ -32,7 +38,7 @@ class Event(Resource):
                 event_str['content'] = json.dumps(content, ensure_ascii=False)
 
             result.append(event_str)
-        return application.make_ok_response(events=result, page=page, page_count=page_count, page_size=PAGE_SIZE, channel=channel_rules)
+        return application.make_ok_response(events=result, page=page, page_count=page_count, page_size=PAGE_SIZE, channel=channel_rules, next_cursor=next_cursor)
 
     def post(self, channel):
         message = request.json
@@ -91,3 +97,15 @@ class EventFileInfo(Resource):
         if db is not None:
             file_info = db.get_database_info()
         return application.make_ok_response(file_info=file_info)
+
+
+class EventSubscriber(Resource):
+
+    def get(self):
+        event_server = application.server['event']
+        subscribers = event_server.get_subscriber_status()
+        process_executor = event_server.process_executor.status() if event_server.async_starting else None
+        payload_server = application.server.get('shared_payload')
+        shared_payload = payload_server.status() if payload_server else None
+        return application.make_ok_response(
+            subscribers=subscribers, process_executor=process_executor, shared_payload=shared_payload)
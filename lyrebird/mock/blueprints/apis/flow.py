@@ -7,7 +7,7 @@ from lyrebird.application import config
 from urllib.parse import urlencode, unquote
 from flask import request, Response
 from copy import deepcopy
-from lyrebird.utils import url_decode
+from lyrebird.utils import url_decode, CopyOnWriteDict
 import json
 
 
@@ -26,19 +26,20 @@ class Flow(Resource):
         elif not isinstance(no_decode, int):
             return application.make_fail_response(f'Param no_decode type error, in the request of api/flow/{id}')
         
-        for item in context.application.cache.items():
-            if item['id'] == id:
-                # Import decoder for decoding the requested content
-                display_item = {}
-                if is_origin:
-                    display_item = deepcopy(item)
-                else:
-                    application.encoders_decoders.decoder_handler(item, output=display_item)
-                if not no_decode:
-                    for key in ('url', 'path', 'query'):
-                        url_decode(display_item['request'], key)
-                return application.make_ok_response(data=display_item)
-        return application.make_fail_response(f'Request {id} not found')
+        item = context.application.cache.get(id)
+        if not item:
+            return application.make_fail_response(f'Request {id} not found')
+
+        # Import decoder for decoding the requested content
+        # Decoded flow is shared, url decoding writes on a copy-on-write view of it
+        if is_origin:
+            display_item = deepcopy(item)
+        else:
+            display_item = CopyOnWriteDict(application.encoders_decoders.decode(item))
+        if not no_decode:
+            for key in ('url', 'path', 'query'):
+                url_decode(display_item['request'], key)
+        return application.make_ok_response(data=display_item)
 
 
 def get_flow_list_by_filter(filter_obj, for_display):
@@ -115,10 +116,9 @@ class FlowList(Resource):
             _ids = request.json.get('ids')
             record_items = []
             for _id in _ids:
-                for item in context.application.cache.items():
-                    if _id == item['id']:
-                        record_items.append(item)
-                        break
+                item = context.application.cache.get(_id)
+                if item:
+                    record_items.append(item)
             dm = context.application.data_manager
 
             for flow in record_items:
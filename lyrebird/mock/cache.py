@@ -1,4 +1,7 @@
-from collections import deque
+import sys
+import threading
+from itertools import count
+from collections import OrderedDict
 
 
 _cache = None
@@ -14,44 +17,129 @@ def get_cache():
 
 class ListCache:
     """
-    双向序列
-    默认最大值1000
+    有序字典, 以id为索引
+    默认最大值1000, 可同时按总字节数限制
     存储流经mock服务的数据
-    
+
+    Items are evicted from the oldest one when the count or the total size is over the limit.
+    All operations are thread-safe.
     """
-    def __init__(self, maxlen=1000):
-        self._cache = deque(maxlen=maxlen)
+    def __init__(self, maxlen=1000, maxbytes=0):
+        self.maxlen = maxlen
+        self.maxbytes = maxbytes
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._total_size = 0
+        self._lock = threading.RLock()
+        self._anonymous_key = count()
+
+    def set_capacity(self, maxlen=None, maxbytes=None):
+        with self._lock:
+            if maxlen is not None:
+                self.maxlen = maxlen
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self._evict()
 
     def add(self, obj):
-        self._cache.append(obj)
+        with self._lock:
+            key = self._get_key(obj, is_new=True)
+            if key in self._cache:
+                self._remove(key)
+            self._cache[key] = obj
+            self._sizes[key] = self._get_size(obj)
+            self._total_size += self._sizes[key]
+            self._evict()
+
+    def update_size(self, obj):
+        """
+        Recalculate the size of obj, call it after obj is filled, such as the response is received
+        """
+        with self._lock:
+            key = self._get_key(obj)
+            if key is None or key not in self._cache:
+                return
+            size = self._get_size(obj)
+            self._total_size += size - self._sizes[key]
+            self._sizes[key] = size
+            self._evict()
 
     def items(self):
-        return list(self._cache)
+        with self._lock:
+            return list(self._cache.values())
 
     def get(self, id_):
-        for item in list(self._cache):
-            if item['id'] != id_:
-                continue
-            return item
+        with self._lock:
+            return self._cache.get(id_)
 
     def clear(self):
-        self._cache.clear()
-    
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+            self._total_size = 0
+
     def delete(self, obj):
-        self._cache.remove(obj)
-    
+        with self._lock:
+            key = self._get_key(obj)
+            if key is None or key not in self._cache:
+                raise ValueError(f'{key} not in cache')
+            self._remove(key)
+
     def delete_by_ids(self, *ids):
-        del_items = []
-        for item in list(self._cache):
-            if item['id'] in ids:
-                del_items.append(item)
-        for item in del_items:
-            self.delete(item)
+        with self._lock:
+            for id_ in ids:
+                if id_ in self._cache:
+                    self._remove(id_)
+
+    def status(self):
+        with self._lock:
+            return {
+                'count': len(self._cache),
+                'size': self._total_size,
+                'maxlen': self.maxlen,
+                'maxbytes': self.maxbytes
+            }
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _remove(self, key):
+        self._cache.pop(key)
+        self._total_size -= self._sizes.pop(key)
+
+    def _evict(self):
+        while self._cache and self.maxlen and len(self._cache) > self.maxlen:
+            self._remove(next(iter(self._cache)))
+        # Keep the newest item even if it is larger than maxbytes
+        while len(self._cache) > 1 and self.maxbytes and self._total_size > self.maxbytes:
+            self._remove(next(iter(self._cache)))
+
+    def _get_key(self, obj, is_new=False):
+        if isinstance(obj, dict) and 'id' in obj:
+            return obj['id']
+        # Object without id, such as str, could only be found by itself
+        if is_new:
+            return ('anonymous', next(self._anonymous_key))
+        for key, item in self._cache.items():
+            if item is obj or item == obj:
+                return key
+
+    @staticmethod
+    def _get_size(obj):
+        if not isinstance(obj, dict):
+            return sys.getsizeof(obj)
+        # Flow size: request body and response body
+        size = obj.get('size') or 0
+        request = obj.get('request')
+        if isinstance(request, dict) and isinstance(request.get('data'), (str, bytes)):
+            size += len(request['data'])
+        return size
+
 
 class RedisCache:
     """
     如果部署在服务器上，并使用多进程，需要使用redis存储数据，实现多进程共享数据
-    
+
     """
     pass
 
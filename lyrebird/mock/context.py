@@ -2,6 +2,7 @@ from flask import jsonify
 from . import cache
 from .dm import DataManager, DataManagerV2
 from .dm.file_data_adapter import data_adapter
+from .emitter import SocketIOEmitter
 from flask_socketio import SocketIO
 from importlib import machinery
 from pathlib import Path
@@ -76,6 +77,11 @@ class Application:
 
         self.init_datamanager()
 
+        self.cache.set_capacity(
+            maxlen=_conf.get('mock.cache.maxlen'),
+            maxbytes=_conf.get('mock.cache.maxbytes')
+        )
+
         if _conf.get('mock.mode') == MockMode.MULTIPLE:
             self.is_diff_mode = MockMode.MULTIPLE
 
@@ -147,15 +153,6 @@ class Application:
         return self.selected_filter
 
 
-"""
-SocketIO emit interval
-Because of iview table has render preformance problem
-We need to limit render time
-"""
-EMIT_INTERVAL = 1
-last_emit_time = {}
-
-
 """
 request header may casuse exception:
 - Lyrebird internal header. eg. proxy-raw-headers
@@ -193,9 +190,8 @@ def make_fail_response(msg, code=3000, **kwargs):
     return jsonify(fail_resp)
 
 
+emitter = SocketIOEmitter(lambda: application.socket_io)
+
+
 def emit(event, *args, **kwargs):
-    now = time.time()
-    last_push_time = last_emit_time.get(event, 0)
-    if (now - last_push_time) > EMIT_INTERVAL:
-        application.socket_io.emit(event, *args, **kwargs)
-        last_emit_time[event] = now
+    emitter.emit(event, *args, **kwargs)
@@ -3,7 +3,6 @@ import uuid
 import json
 import time
 import codecs
-from copy import deepcopy
 import shutil
 import traceback
 from pathlib import Path
@@ -11,10 +10,11 @@ from urllib.parse import urlparse
 from collections import OrderedDict
 from lyrebird import utils, application
 from lyrebird.log import get_logger
-from lyrebird.utils import RedisDict
+from lyrebird.utils import RedisDict, CopyOnWriteDict
 from lyrebird.application import config
 from lyrebird.mock import context
 from lyrebird.mock.dm.match import MatchRules
+from lyrebird.mock.dm.match_index import MatchIndex
 from lyrebird.mock.dm.temp_mock import TempMock
 from lyrebird.config import CONFIG_TREE_SHOW_CONFIG
 
@@ -30,6 +30,7 @@ class DataManager:
         self.id_map = {}
         self.activated_data = OrderedDict()
         self.activated_group = {}
+        self.match_index = MatchIndex()
         self.is_activated_data_rules_contains_request_data = False
         self.LEVEL_SUPER_ACTIVATED = 3
         self.clipboard = None
@@ -399,6 +400,7 @@ class DataManager:
 
         # After activate
         self._check_activated_data_rules_contains_request_data()
+        self.rebuild_match_index()
         self._adapter._after_activate(**kwargs)
 
     def _check_activated_data_rules_contains_request_data(self):
@@ -469,6 +471,7 @@ class DataManager:
         self.activated_data = OrderedDict()
         self.activated_group = {}
         self._check_activated_data_rules_contains_request_data()
+        self.rebuild_match_index()
 
     def reactive(self):
         for _group_id in self.activated_group:
@@ -495,16 +498,17 @@ class DataManager:
         Find matched mock data from activated data
         """
         if self.is_activated_data_rules_contains_request_data:
-            decode_flow = {}
-            application.encoders_decoders.decoder_handler(flow, output=decode_flow)
+            decode_flow = application.encoders_decoders.decode(flow)
         else:
             decode_flow = flow
+        if self.match_index.is_outdated(self.activated_data):
+            self.rebuild_match_index()
+
         _matched_data = []
-        for _data_id in self.activated_data:
-            _data = self.activated_data[_data_id]
-            if self._is_match_rule(decode_flow, _data.get('rule')):
-                _matched_data.append(deepcopy(_data))
-                break
+        _data_id = self.match_index.match(decode_flow)
+        if _data_id is not None and _data_id in self.activated_data:
+            # Activated data is shared by all requests, never modify it
+            _matched_data.append(CopyOnWriteDict(self.activated_data[_data_id]))
 
         for response_data in _matched_data:
             if 'response' not in response_data:
@@ -531,6 +535,12 @@ class DataManager:
     def _is_match_rule(self, flow, rules):
         return MatchRules.match(flow, rules)
 
+    def rebuild_match_index(self):
+        """
+        Compile rules of activated data, call it after activated data changed
+        """
+        self.match_index = MatchIndex(self.activated_data)
+
     def _get_activated_data_config(self):
         config_id = None
         for id_, data in self.activated_data.items():
@@ -1366,6 +1376,7 @@ class DataManagerV2(DataManager):
                 self.activated_group.pop(id_)
             if id_ in self.open_nodes:
                 self.open_nodes.remove(id_)
+        self.rebuild_match_index()
 
     def update_data(self, _id, data):
         self._adapter._update_data(_id, data)
@@ -1427,6 +1438,7 @@ class DataManagerV2(DataManager):
             application._cm.add_config(self.activate_config, type='dm', level=-1, apply_now=True)
         # TODO:After activate
         self._check_activated_data_rules_contains_request_data()
+        self.rebuild_match_index()
         self._adapter._after_activate(activated_group = group_info, activated_data = self.activated_data, **kwargs)
 
     def deactivate(self):
@@ -1439,6 +1451,7 @@ class DataManagerV2(DataManager):
         self.activated_data = OrderedDict()
         self.activated_group = {}
         self._check_activated_data_rules_contains_request_data()
+        self.rebuild_match_index()
 
     """
     cut/copy/paste
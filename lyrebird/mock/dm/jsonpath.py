@@ -1,10 +1,14 @@
 import re
 import platform
+from functools import lru_cache
 from packaging import version
 from lyrebird.log import get_logger
 
 logger = get_logger()
 
+KEY_SPLIT_PATTERN = re.compile(r'(?:\.)|(?=\[.*\])')
+LIST_KEY_PATTERN = re.compile(r'\[(\d+|\*)\]')
+
 
 class JSONPath:
 
@@ -23,23 +27,37 @@ class JSONPath:
         if not path or not isinstance(path, str) or not isinstance(root, (list, dict)):
             return
 
+        keys = JSONPath.parse(path)
+        if not keys:
+            return
+
+        return JSONPath.search_by_keys(root, keys, find_one=find_one)
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def parse(path:str):
+        """ Split JSONPath into a tuple of keys, parsed result is cached by path
+
+        EXAMPLE
+        path = 'data[*][1].name'
+        keys = ('data', '[*]', '[1]', 'name')
+        """
         if path.startswith('$'):
             path = path.replace('$', '', 1)
 
         # split by `.` and drop `.`, split by `[ ]` and keep `[ ]`
-        # EXAMPLE
-        # path = 'data[*][1].name'
-        # keys = ['data', '[*]', '[1]', 'name']
-
-        pattern = r'(?:\.)|(?=\[.*\])'
-        origin_keys = re.split(pattern, path)
+        origin_keys = KEY_SPLIT_PATTERN.split(path)
 
         # There is a bug in re.split splitting with (?=) in Python 3.6 and below
         # The following code `re_split_handle` is used to solve this problem
         # Remove when Python 3.6 is not supported
-        keys = [k for k in JSONPath.re_split_handle(origin_keys) if k]
+        return tuple(k for k in JSONPath.re_split_handle(origin_keys) if k)
 
-        if not keys or not len(keys):
+    @staticmethod
+    def search_by_keys(root, keys, find_one=False):
+        """ Same as ``search``, but ``keys`` is already parsed by ``parse``
+        """
+        if not keys or not isinstance(root, (list, dict)):
             return
 
         result = []
@@ -76,7 +94,7 @@ class JSONPath:
     def get_target_keys(root, key):
         # EXAMPLE
         # matched [0], [10], [*]
-        is_list = re.match('\[(\d+|\*)\]', key)
+        is_list = LIST_KEY_PATTERN.match(key)
 
         if not is_list:
             if isinstance(root, dict) and (key in root):
@@ -0,0 +1,354 @@
+import re
+import heapq
+from lyrebird.utils import TargetMatch
+from lyrebird.mock.dm.match import MatchRules
+from lyrebird.mock.dm.jsonpath import jsonpath
+
+
+class CompiledMatchRule:
+    '''
+    Match rule validated and compiled once, `match` is equivalent to `MatchRules.match(flow, rules)`
+
+    JSONPath keys are parsed and string patterns are compiled in advance.
+    Rule whose pattern could not be compiled falls back to `MatchRules.match`,
+    so the error is raised at the same time as before.
+    '''
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.clauses = []
+        self.is_never_match = False
+        self.is_fallback = False
+        # {target keys: [required literal, ...]} from `must` string patterns
+        self.required_literals = {}
+
+        try:
+            self._compile(rules)
+        except Exception:
+            self.is_fallback = True
+            self.clauses = []
+            self.required_literals = {}
+
+    def match(self, flow):
+        if self.is_fallback:
+            return MatchRules.match(flow, self.rules)
+        if self.is_never_match:
+            return False
+        for clause in self.clauses:
+            if not clause(flow):
+                return False
+        return True
+
+    def _compile(self, rules):
+        if not rules or not isinstance(rules, dict):
+            self.is_never_match = True
+            return
+
+        if MatchRules.is_rule_v1(rules):
+            self._compile_query_match(rules)
+            return
+
+        if not MatchRules.is_rule_v2(rules):
+            self.is_never_match = True
+            return
+
+        for bool_key, bool_value in rules.items():
+            if not bool_value:
+                self.is_never_match = True
+                return
+            expected = bool_key == 'must'
+            for query_key, query_value in bool_value.items():
+                if not query_value:
+                    self.is_never_match = True
+                    return
+                if query_key == 'match':
+                    self._compile_query_match(query_value, expected=expected)
+                elif query_key == 'exists':
+                    self._compile_query_exists(query_value, expected=expected)
+
+    def _compile_query_match(self, match, expected=True):
+        for match_key, match_pattern in match.items():
+            keys = jsonpath.parse(match_key) if isinstance(match_key, str) else ()
+            self.clauses.append(self._make_match_clause(keys, match_pattern, expected))
+            if expected and isinstance(match_pattern, str):
+                literals = get_required_literals(match_pattern)
+                if literals:
+                    self.required_literals.setdefault(keys, []).extend(literals)
+
+    def _compile_query_exists(self, exists, expected=True):
+        for exists_key in exists:
+            keys = jsonpath.parse(exists_key) if exists_key else ()
+            self.clauses.append(self._make_exists_clause(keys, expected))
+
+    @staticmethod
+    def _make_match_clause(keys, pattern, expected):
+        is_target_match = compile_target_match(pattern)
+
+        def clause(flow):
+            search_res = jsonpath.search_by_keys(flow, keys)
+            if not search_res:
+                return False
+            for node in search_res:
+                if is_target_match(node.node) != expected:
+                    return False
+            return True
+        return clause
+
+    @staticmethod
+    def _make_exists_clause(keys, expected):
+        def clause(flow):
+            return bool(jsonpath.search_by_keys(flow, keys)) == expected
+        return clause
+
+
+def compile_target_match(pattern):
+    '''
+    Return a function equivalent to `TargetMatch.is_match(target, pattern)`
+    '''
+    if not isinstance(pattern, str):
+        return lambda target: TargetMatch.is_match(target, pattern)
+
+    regex = re.compile(pattern)
+
+    def is_match(target):
+        if type(target) == str:
+            return regex.search(target) is not None
+        return TargetMatch.is_match(target, pattern)
+    return is_match
+
+
+# -----------------
+# Required literal
+# -----------------
+
+def get_required_literals(pattern):
+    '''
+    Find literal strings which must be contained by any string matched by `pattern`
+
+    Return a list of (literal, is_anchored_at_start)
+    Only simple patterns are analyzed, such as `(?=.*/path/name)(?=.*PARAMS)`, `^/path\\?`
+    An empty list is returned when the pattern is too complex to be analyzed safely
+    '''
+    if '|' in pattern:
+        return []
+    literals = []
+    if _scan_literals(pattern, 0, literals, False) is None:
+        return []
+    return [literal for literal in literals if literal[0]]
+
+
+def _scan_literals(pattern, pos, literals, in_group):
+    # Return the position after scanning, or None if the pattern is not supported
+    size = len(pattern)
+    run = []
+    run_anchored = False
+    is_start_anchored = False
+
+    def flush():
+        if run:
+            literals.append((''.join(run), run_anchored))
+            run.clear()
+
+    while pos < size:
+        char = pattern[pos]
+        atom = None
+
+        if char == '\\':
+            if pos + 1 >= size:
+                return None
+            if pattern[pos+1] in 'xuUN0123456789':
+                # \xNN \uNNNN \N{name}, octal escapes and backreferences take the following chars
+                return None
+            if pattern[pos+1].isalnum():
+                # \d \w \b ...
+                flush()
+                pos = _skip_quantifier(pattern, pos + 2)
+            else:
+                atom = pattern[pos+1]
+                pos += 2
+        elif char == '(':
+            flush()
+            if not pattern.startswith('(?=', pos):
+                return None
+            pos = _scan_literals(pattern, pos + 3, literals, True)
+            if pos is None or (pos < size and pattern[pos] in '*+?{'):
+                return None
+        elif char == ')':
+            if not in_group:
+                return None
+            flush()
+            return pos + 1
+        elif char == '^' and pos == 0 and not in_group:
+            is_start_anchored = True
+            pos += 1
+            continue
+        elif char == '[':
+            flush()
+            pos = _skip_char_class(pattern, pos)
+            if pos is not None:
+                pos = _skip_quantifier(pattern, pos)
+        elif char in '.$^':
+            flush()
+            pos = _skip_quantifier(pattern, pos + 1)
+        elif char in '*+?{}]':
+            return None
+        else:
+            atom = char
+            pos += 1
+
+        if pos is None:
+            return None
+
+        if atom is None:
+            is_start_anchored = False
+            continue
+
+        if pos < size and pattern[pos] in '*?{':
+            # The atom is optional
+            flush()
+            pos = _skip_quantifier(pattern, pos)
+            if pos is None:
+                return None
+            is_start_anchored = False
+            continue
+
+        if not run:
+            run_anchored = is_start_anchored
+        is_start_anchored = False
+        run.append(atom)
+
+        if pos < size and pattern[pos] == '+':
+            flush()
+            pos = _skip_quantifier(pattern, pos)
+            if pos is None:
+                return None
+
+    if in_group:
+        return None
+    flush()
+    return pos
+
+
+def _skip_quantifier(pattern, pos):
+    size = len(pattern)
+    if pos >= size:
+        return pos
+    if pattern[pos] in '*+?':
+        pos += 1
+    elif pattern[pos] == '{':
+        end = pattern.find('}', pos)
+        if end < 0:
+            return None
+        pos = end + 1
+    else:
+        return pos
+    # Lazy or possessive quantifier
+    if pos < size and pattern[pos] in '?+':
+        pos += 1
+    return pos
+
+
+def _skip_char_class(pattern, pos):
+    size = len(pattern)
+    pos += 1
+    if pos < size and pattern[pos] == '^':
+        pos += 1
+    if pos < size and pattern[pos] == ']':
+        pos += 1
+    while pos < size:
+        if pattern[pos] == '\\':
+            pos += 2
+            continue
+        if pattern[pos] == ']':
+            return pos + 1
+        pos += 1
+    return None
+
+
+# -----------------
+# Index
+# -----------------
+
+class MatchIndex:
+    '''
+    Compiled matcher of activated mock data
+
+    Each rule is compiled into CompiledMatchRule. Rule with a required literal path segment
+    on `request.url`, `request.path` or `request.host` is indexed by the segment prefix,
+    a flow only checks the rules whose segment prefix is found in its own target value,
+    and the rules could not be indexed.
+
+    `match` returns the first matched data id in activation order, the same as scanning all data.
+    '''
+
+    PREFIX_LENGTH = 4
+    INDEXED_TARGETS = (('request', 'url'), ('request', 'path'), ('request', 'host'))
+
+    def __init__(self, activated_data=None):
+        self.activated_data = activated_data
+        self.size = 0
+        self.data_ids = []
+        self.rules = []
+        self.prefix_map = {}
+        self.unindexed = []
+        self.indexed_targets = set()
+        if activated_data:
+            self.build(activated_data)
+
+    def build(self, activated_data):
+        self.activated_data = activated_data
+        self.size = len(activated_data)
+        for position, (data_id, data) in enumerate(activated_data.items()):
+            rule = CompiledMatchRule(data.get('rule') if isinstance(data, dict) else None)
+            self.data_ids.append(data_id)
+            self.rules.append(rule)
+
+            index_key = self._get_index_key(rule)
+            if index_key:
+                self.prefix_map.setdefault(index_key, []).append(position)
+                self.indexed_targets.add(index_key[0])
+            else:
+                self.unindexed.append(position)
+
+    def is_outdated(self, activated_data):
+        return self.activated_data is not activated_data or self.size != len(activated_data)
+
+    def match(self, flow):
+        for position in self._iter_candidates(flow):
+            if self.rules[position].match(flow):
+                return self.data_ids[position]
+
+    def _iter_candidates(self, flow):
+        hit_keys = set()
+        for target_keys in self.indexed_targets:
+            value = jsonpath.search_by_keys(flow, target_keys, find_one=True)
+            if not isinstance(value, str):
+                continue
+            for token in value.split('/'):
+                for length in range(1, min(len(token), self.PREFIX_LENGTH) + 1):
+                    index_key = (target_keys, token[:length])
+                    if index_key in self.prefix_map:
+                        hit_keys.add(index_key)
+
+        if not hit_keys:
+            return self.unindexed
+        # Each rule is indexed by only one key, candidates are unique
+        return heapq.merge(self.unindexed, *[self.prefix_map[k] for k in hit_keys])
+
+    def _get_index_key(self, rule):
+        # Every `/` in a literal is followed by the prefix of a segment of the target value
+        best = None
+        for target_keys, literals in rule.required_literals.items():
+            if target_keys not in self.INDEXED_TARGETS:
+                continue
+            for literal, is_anchored in literals:
+                segments = literal.split('/')
+                candidates = segments[1:]
+                if is_anchored:
+                    candidates.append(segments[0])
+                for segment in candidates:
+                    if segment and (not best or len(segment) > len(best[1])):
+                        best = (target_keys, segment)
+        if not best:
+            return
+        return (best[0], best[1][:self.PREFIX_LENGTH])
@@ -3,11 +3,10 @@ import traceback
 from datetime import datetime
 from urllib.parse import urlparse
 from collections import OrderedDict
-from copy import deepcopy
 
 from lyrebird.log import get_logger
 from lyrebird.mock.dm.match import MatchRules
-from lyrebird.utils import flow_data_2_str, render
+from lyrebird.utils import flow_data_2_str, render, CopyOnWriteDict
 
 
 logger = get_logger()
@@ -31,7 +30,7 @@ class TempMock:
         _matched_data = []
         for data in self.activated_data.values():
             if MatchRules.match(flow, data.get('rule')):
-                _matched_data.append(deepcopy(data))
+                _matched_data.append(CopyOnWriteDict(data))
                 break
 
         for response_data in _matched_data:
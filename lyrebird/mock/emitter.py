@@ -0,0 +1,167 @@
+import time
+import threading
+import traceback
+from lyrebird import application as app
+from lyrebird.log import get_logger
+
+
+"""
+SocketIO emitter
+
+Because of iview table has render preformance problem, we need to limit render time.
+High-rate events are coalesced on server side and sent once in each window,
+so the frontend and the threading SocketIO server are not flooded.
+
+Emit mode of each event is set by config `socketio.emit`:
+    "socketio.emit": {
+        "event": {"mode": "batch", "interval": 0.2},
+        "action": {"mode": "latest", "interval": 1}
+    }
+    immediate: send every event
+    latest: send the first event at once, then the latest event at the end of each window
+    batch: send a frame of ids and counts of each channel in the window
+"""
+
+logger = get_logger()
+
+MODE_IMMEDIATE = 'immediate'
+MODE_LATEST = 'latest'
+MODE_BATCH = 'batch'
+
+DEFAULT_EMIT_POLICY = {
+    'event': {'mode': MODE_BATCH, 'interval': 0.2}
+}
+# Policy of events not in config
+DEFAULT_MODE = MODE_LATEST
+DEFAULT_INTERVAL = 1
+# Max ids of each channel in one batch frame, the count is always exact
+BATCH_MAX_IDS = 100
+
+
+class PendingEmit:
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.args = ()
+        self.kwargs = {}
+        self.channels = {}
+        self.count = 0
+
+    def add(self, args, kwargs):
+        self.count += 1
+        if self.mode == MODE_BATCH:
+            self.add_batch(args[0] if args else None)
+        else:
+            self.args = args
+            self.kwargs = kwargs
+
+    def add_batch(self, data):
+        # Notification of an event is {'id': event_id, 'channel': channel}
+        if not isinstance(data, dict):
+            data = {'id': data}
+        channel = data.get('channel')
+        frame = self.channels.setdefault(channel, {'ids': [], 'count': 0})
+        frame['count'] += 1
+        if len(frame['ids']) >= BATCH_MAX_IDS:
+            frame['ids'].pop(0)
+        frame['ids'].append(data.get('id'))
+        # The latest id and channel are kept, so listeners of single event still work
+        self.args = (dict(data, channels=self.channels),)
+
+
+class SocketIOEmitter:
+
+    def __init__(self, get_socket_io):
+        self.get_socket_io = get_socket_io
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        # {event: PendingEmit}
+        self.pending = {}
+        # {event: time of last sent}
+        self.last_emit_time = {}
+        # {event: time to flush pending}
+        self.deadlines = {}
+        self.flush_thread = None
+        self.received_count = 0
+        self.sent_count = 0
+
+    @staticmethod
+    def get_policy(event):
+        policy = app.config.get('socketio.emit', {}).get(event) or DEFAULT_EMIT_POLICY.get(event) or {}
+        return policy.get('mode', DEFAULT_MODE), policy.get('interval', DEFAULT_INTERVAL)
+
+    def emit(self, event, *args, **kwargs):
+        mode, interval = self.get_policy(event)
+        if mode == MODE_IMMEDIATE or not interval:
+            self.send(event, args, kwargs)
+            return
+
+        now = time.time()
+        with self.lock:
+            self.received_count += 1
+            pending = self.pending.get(event)
+            if not pending and now - self.last_emit_time.get(event, 0) >= interval:
+                # Window is idle, send at once
+                self.last_emit_time[event] = now
+                if mode == MODE_BATCH:
+                    pending = PendingEmit(mode)
+                    pending.add(args, kwargs)
+                    args = pending.args
+            else:
+                if not pending:
+                    pending = self.pending[event] = PendingEmit(mode)
+                    self.deadlines[event] = self.last_emit_time.get(event, now) + interval
+                    self.condition.notify()
+                pending.add(args, kwargs)
+                self._ensure_flush_thread()
+                return
+        self.send(event, args, kwargs)
+
+    def send(self, event, args, kwargs):
+        try:
+            self.get_socket_io().emit(event, *args, **kwargs)
+            with self.lock:
+                self.sent_count += 1
+        except Exception:
+            logger.error(f'SocketIO emit {event} failed. {traceback.format_exc()}')
+
+    def flush(self, force=False):
+        """
+        Send pending events whose window is over, or all pending events if force
+        Return seconds to the next deadline
+        """
+        now = time.time()
+        to_send = []
+        with self.lock:
+            for event, deadline in list(self.deadlines.items()):
+                if force or deadline <= now:
+                    to_send.append((event, self.pending.pop(event)))
+                    self.deadlines.pop(event)
+                    self.last_emit_time[event] = now
+            next_deadline = min(self.deadlines.values()) if self.deadlines else None
+        for event, pending in to_send:
+            self.send(event, pending.args, pending.kwargs)
+        return next_deadline - now if next_deadline else None
+
+    def _ensure_flush_thread(self):
+        if self.flush_thread and self.flush_thread.is_alive():
+            return
+        self.flush_thread = threading.Thread(target=self._run, name='socketio-emitter', daemon=True)
+        self.flush_thread.start()
+
+    def _run(self):
+        while True:
+            wait_time = self.flush()
+            with self.lock:
+                if not self.deadlines:
+                    self.condition.wait()
+                elif wait_time and wait_time > 0:
+                    self.condition.wait(wait_time)
+
+    def status(self):
+        with self.lock:
+            return {
+                'received': self.received_count,
+                'sent': self.sent_count,
+                'pending': {event: pending.count for event, pending in self.pending.items()}
+            }
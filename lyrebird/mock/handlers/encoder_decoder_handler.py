@@ -1,8 +1,134 @@
+import pickle
+import hashlib
 from copy import deepcopy
 from lyrebird import application
+from lyrebird.utils import CopyOnWriteDict
 from .function_executor import FunctionExecutor
 
 
+"""
+Decode state of flow
+
+Decoded flow is kept on the flow object, and reused until fields of the flow are replaced,
+so a flow is decoded once for mock data matching, the inspector and the event bus.
+
+Fields are the values of flow and its sections such as request.data, and each header of sections.
+Action list is not a field, encoders and decoders add their actions to it.
+Values inside fields changed in place, such as request.query, are not tracked.
+Flow editors are run by FlowEditorHandler.script_executor, which drops the decoded flow after them,
+other code changing a flow in place should call drop_decode_state.
+"""
+
+DECODE_STATE_ATTR = 'decode_state'
+_MISSING = object()
+
+
+def get_flow_fields(flow):
+    """
+    Return {path: value} of fields in flow, path is (key, ), (section, key) or (section, 'headers', name)
+    """
+    fields = {}
+    for key, value in flow.items():
+        if key == 'action':
+            continue
+        if not isinstance(value, dict):
+            fields[(key, )] = value
+            continue
+        for sub_key, sub_value in value.items():
+            fields[(key, sub_key)] = sub_value
+            # Headers are usually modified in place by decoders
+            if sub_key == 'headers' and isinstance(sub_value, dict):
+                for name, header_value in sub_value.items():
+                    fields[(key, sub_key, name)] = header_value
+    return fields
+
+
+def is_same_fields(fields, other_fields):
+    if len(fields) != len(other_fields):
+        return False
+    for path, value in fields.items():
+        if other_fields.get(path, _MISSING) is not value:
+            return False
+    return True
+
+
+def drop_decode_state(flow):
+    """
+    Drop the decoded flow kept on flow, it is decoded again when used
+    """
+    try:
+        delattr(flow, DECODE_STATE_ATTR)
+    except AttributeError:
+        pass
+
+
+def get_digest(value):
+    """
+    Return digest of a decoded value, None if it can not be pickled
+    """
+    if value is _MISSING:
+        return _MISSING
+    try:
+        return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).digest()
+    except Exception:
+        return None
+
+
+def get_field(flow, path):
+    target = flow
+    for key in path:
+        if not isinstance(target, dict) or key not in target:
+            return _MISSING
+        target = target[key]
+    return target
+
+
+def set_field(flow, path, value):
+    target = flow
+    for key in path[:-1]:
+        target = target[key]
+    if value is _MISSING:
+        target.pop(path[-1], None)
+    else:
+        target[path[-1]] = value
+
+
+class DecodeState:
+
+    def __init__(self, fields, decoded_flow):
+        # Values are kept, so the identities can not be reused by other objects
+        self.fields = fields
+        self.decoded_flow = decoded_flow
+
+
+class DecodedFields:
+    """
+    Fields decoded in place, see EncoderDecoder.decode_in_place
+    """
+
+    def __init__(self, origin_fields, decoded_fields):
+        # {path: value before decoding}
+        self.origin = {}
+        # {path: digest of decoded value}
+        self.decoded = {}
+        for path in origin_fields.keys() | decoded_fields.keys():
+            origin_value = origin_fields.get(path, _MISSING)
+            decoded_value = decoded_fields.get(path, _MISSING)
+            if origin_value is not decoded_value:
+                self.origin[path] = origin_value
+                self.decoded[path] = get_digest(decoded_value)
+
+    def is_modified(self, flow):
+        for path, decoded_digest in self.decoded.items():
+            if decoded_digest is None or get_digest(get_field(flow, path)) != decoded_digest:
+                return True
+        return False
+
+    def restore(self, flow):
+        for path, origin_value in self.origin.items():
+            set_field(flow, path, origin_value)
+
+
 class EncoderDecoder(FunctionExecutor):
     def __init__(self):
         self.encoder = application.encoder
@@ -35,3 +161,52 @@ class EncoderDecoder(FunctionExecutor):
 
         EncoderDecoder.func_handler(matched_funcs, new_flow, handler_type='decoder')
         output.update(new_flow)
+
+    def decode(self, flow):
+        """
+        Return decoded flow for reading, the flow itself if no decoder matched
+
+        Decoders write on a copy-on-write view of the flow,
+        the result is cached on the flow until fields of the flow are replaced.
+        Wrap the result with CopyOnWriteDict before modifying it.
+        """
+        fields = get_flow_fields(flow)
+        decode_state = getattr(flow, DECODE_STATE_ATTR, None)
+        if decode_state and is_same_fields(decode_state.fields, fields):
+            return decode_state.decoded_flow
+
+        matched_funcs = EncoderDecoder.get_matched_sorted_handler(self.decoder, flow)
+        if matched_funcs:
+            decoded_flow = CopyOnWriteDict(flow)
+            EncoderDecoder.func_handler(matched_funcs, decoded_flow, handler_type='decoder')
+        else:
+            decoded_flow = flow
+        try:
+            setattr(flow, DECODE_STATE_ATTR, DecodeState(fields, decoded_flow))
+        except AttributeError:
+            # Plain dict, not cached
+            pass
+        return decoded_flow
+
+    def decode_in_place(self, flow):
+        """
+        Decode the flow in place, return DecodedFields or None if no decoder matched
+        """
+        matched_funcs = EncoderDecoder.get_matched_sorted_handler(self.decoder, flow)
+        if not matched_funcs:
+            return None
+        origin_fields = get_flow_fields(flow)
+        EncoderDecoder.func_handler(matched_funcs, flow, handler_type='decoder')
+        return DecodedFields(origin_fields, get_flow_fields(flow))
+
+    def encode_modified(self, flow, decoded_fields):
+        """
+        Encode the flow decoded by decode_in_place
+
+        If decoded fields are not modified, origin values are restored instead of encoding them again.
+        If decoders only modified values in place, no field is tracked and the flow is always encoded.
+        """
+        if decoded_fields and decoded_fields.decoded and not decoded_fields.is_modified(flow):
+            decoded_fields.restore(flow)
+            return
+        self.encoder_handler(flow)
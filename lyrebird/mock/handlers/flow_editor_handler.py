@@ -1,5 +1,6 @@
 from lyrebird import application
 from .function_executor import FunctionExecutor
+from .encoder_decoder_handler import drop_decode_state
 
 
 class FlowEditorHandler(FunctionExecutor):
@@ -62,6 +63,8 @@ class FlowEditorHandler(FunctionExecutor):
 
     @staticmethod
     def script_executor(func_list, flow):
-        application.encoders_decoders.decoder_handler(flow)
+        decoded_fields = application.encoders_decoders.decode_in_place(flow)
         FlowEditorHandler.func_handler(func_list, flow)
-        application.encoders_decoders.encoder_handler(flow)
+        application.encoders_decoders.encode_modified(flow, decoded_fields)
+        # Values inside fields may be changed in place by flow editors
+        drop_decode_state(flow)
@@ -2,6 +2,7 @@ import re
 import traceback
 from lyrebird.log import get_logger
 from lyrebird.utils import HookedDict
+from lyrebird.application import HandlerList
 
 logger = get_logger()
 
@@ -28,15 +29,25 @@ class FunctionExecutor:
 
     @staticmethod
     def get_matched_sorted_handler(func_list, flow):
-        matched_func = []
-        if not isinstance(flow, HookedDict):
-            flow = HookedDict(flow)
-        for func in func_list:
-            rules = func['rules']
-            if not rules or FunctionExecutor._is_req_match_rule(rules, flow):
-                matched_func.append(func)
-        matched_sorted_func = sorted(matched_func, key = lambda f:f['rank'])
-        return matched_sorted_func
+        if not func_list:
+            return []
+        return FunctionExecutor.get_dispatch_table(func_list).match(flow)
+
+    @staticmethod
+    def get_dispatch_table(func_list):
+        """
+        Table of HandlerList is built once and cached until the list is modified
+        """
+        if not isinstance(func_list, HandlerList):
+            return DispatchTable(func_list)
+        cached = func_list.dispatch_table
+        if cached is not None and cached[0] == func_list.version:
+            return cached[1]
+        # Read the version before building, the table is stale if the list is modified meanwhile
+        version = func_list.version
+        dispatch_table = DispatchTable(func_list)
+        func_list.dispatch_table = (version, dispatch_table)
+        return dispatch_table
 
     @staticmethod
     def _is_req_match_rule(rules, flow):
@@ -56,3 +67,74 @@ class FunctionExecutor:
             if not result:
                 return None
         return result
+
+
+class DispatchTable:
+    """
+    Functions sorted by rank, rule patterns are compiled and grouped by target key
+
+    `match` extracts each target of flow once, the result is the same as
+    matching every function by `FunctionExecutor._is_req_match_rule` and sorting them by rank
+    """
+
+    def __init__(self, func_list):
+        self.funcs = sorted(func_list, key=lambda f: f['rank'])
+        # Count of rules should be matched by each function
+        self.rule_counts = []
+        # {rule key: (prop keys, [(function index, pattern)])}
+        self.rule_groups = {}
+        for index, func in enumerate(self.funcs):
+            rules = func['rules'] or {}
+            self.rule_counts.append(len(rules))
+            for rule_key, pattern in rules.items():
+                if isinstance(pattern, str):
+                    try:
+                        pattern = re.compile(pattern)
+                    except re.error:
+                        # Raised when the rule is matched, same as before
+                        pass
+                group = self.rule_groups.setdefault(rule_key, (rule_key.split('.'), []))
+                group[1].append((index, pattern))
+
+    def match(self, flow):
+        if not self.rule_groups:
+            return list(self.funcs)
+        matched_counts = [0] * len(self.funcs)
+        for prop_keys, patterns in self.rule_groups.values():
+            target = get_rule_target(prop_keys, flow)
+            if not target:
+                continue
+            for index, pattern in patterns:
+                if isinstance(pattern, re.Pattern):
+                    is_match = pattern.search(target)
+                else:
+                    is_match = re.search(pattern, target)
+                if is_match:
+                    matched_counts[index] += 1
+        return [func for func, rule_count, matched_count in zip(self.funcs, self.rule_counts, matched_counts)
+                if rule_count == matched_count]
+
+
+def get_rule_target(prop_keys, flow):
+    """
+    Same as `FunctionExecutor._get_rule_target` on HookedDict(flow), without copying the flow
+
+    Keys of headers are case-insensitive
+    """
+    result = flow
+    parent_key = None
+    for prop_key in prop_keys:
+        if parent_key is not None and parent_key.lower() == 'headers' and isinstance(result, dict):
+            value = result.get(prop_key)
+            if value is None:
+                lower_key = prop_key.lower()
+                for key, header_value in result.items():
+                    if key.lower() == lower_key:
+                        value = header_value
+            result = value
+        else:
+            result = result.get(prop_key)
+        if not result:
+            return None
+        parent_key = prop_key
+    return result
@@ -8,12 +8,14 @@ from .. import context
 from lyrebird import utils
 from lyrebird import application
 from lyrebird.log import get_logger
+from lyrebird.task import Pipeline, PipelineStage
 from lyrebird.utils import CaseInsensitiveDict
-from lyrebird.mock.blueprints.apis.bandwidth import config
+from lyrebird.mock.blueprints.apis.bandwidth import throttler
 from lyrebird.mock.context import LYREBIRD_UNPROXY_HEADERS
 from urllib.parse import urlparse, unquote
 from .http_data_helper import DataHelper
 from .http_header_helper import HeadersHelper
+from .response_body import ResponseBody, remove_body_file
 from .proxy_handler import ProxyHandler
 
 
@@ -21,6 +23,8 @@ logger = get_logger()
 proxy_handler = ProxyHandler()
 lyrebird_response_headers = None
 
+REQUEST_POST_PIPELINE = 'request_post'
+
 
 class HandlerContext:
     """
@@ -59,6 +63,8 @@ class HandlerContext:
         self.response_source = ''
         self.is_proxiable = True
         self.response_chunk_size = 2048
+        # Temp file of streamed response body, saved in record mode
+        self.response_body_file = None
         self.request_origin_data = None
         self._parse_request()
 
@@ -253,48 +259,43 @@ class HandlerContext:
     def _generator_bytes(self):
         def generator():
             try:
-                _resp_data = DataHelper.flow2origin(self.flow['response'], chain=self.response_chain) or ''
-                length = len(_resp_data)
-                size = self.response_chunk_size
-                bandwidth = config.bandwidth
-                if bandwidth > 0:
-                    sleep_time = self.response_chunk_size / (bandwidth * 1024)
-                else:
-                    sleep_time = 0
-                for i in range(int(length/size) + 1):
-                    time.sleep(sleep_time)
+                _resp_data = DataHelper.flow2origin(self.flow['response'], chain=self.response_chain) or b''
+                if isinstance(_resp_data, str):
+                    _resp_data = _resp_data.encode()
+                for chunk in throttler.throttle([_resp_data], self.client_address):
                     self.server_resp_time = time.time()
-                    yield _resp_data[ i * size : (i+1) * size ]
+                    yield chunk
             finally:
-                def request_post_handler():
-                    self.request_post_processing()
                 self.update_client_resp_time()
-                application.server['task'].add_task('request_post', request_post_handler)
+                application.server['task'].submit(REQUEST_POST_PIPELINE, self, block=self.is_recording)
         return generator
 
     def _generator_stream(self):
         def generator():
             upstream = self.response
+            body = ResponseBody(upstream.headers, spill=self.is_recording)
             try:
-                bandwidth = config.bandwidth
-                if bandwidth > 0:
-                    sleep_time = self.response_chunk_size / (bandwidth * 1024)
-                else:
-                    sleep_time = 0
-                buffer = []
-                for item in upstream.response:
-                    buffer.append(item)
-                    time.sleep(sleep_time)
+                for item in throttler.throttle(upstream.response, self.client_address):
+                    body.write(item)
                     self.server_resp_time = time.time()
                     yield item
             finally:
-                def request_post_handler():
-                    self.request_post_processing()
-                self.response.data = b''.join(buffer)
-                DataHelper.origin2flow(self.response, output=self.flow['response'], chain=self.response_chain)
+                body.close()
+                if body.is_streaming:
+                    # Large body is not decoded for the inspector
+                    self.flow['response']['data'] = body.get_prefix_data()
+                    self.flow['response']['stream'] = body.info()
+                    self.response_body_file = body.file_path
+                else:
+                    self.response.data = body.getvalue()
+                    DataHelper.origin2flow(self.response, output=self.flow['response'], chain=self.response_chain)
                 self.update_client_resp_time()
                 upstream.close()
-                application.server['task'].add_task('request_post', request_post_handler)
+                try:
+                    application.server['task'].submit(REQUEST_POST_PIPELINE, self, block=self.is_recording)
+                except Exception:
+                    self.release_response_body_file()
+                    raise
         return generator
 
     def update_response_headers_code2flow(self, output_key='response'):
@@ -329,12 +330,15 @@ class HandlerContext:
         self.client_resp_time = time.time()
         # 消息总线 客户端响应事件，启用此事件
         resp_data = self.flow['response'].get('data', '')
-        if isinstance(resp_data, str):
+        if self.flow['response'].get('stream'):
+            self.flow['size'] = self.flow['response']['stream']['length']
+        elif isinstance(resp_data, str):
             self.flow['size'] = len(resp_data.encode())
         elif resp_data:
             self.flow['size'] = len(resp_data)
         else:
             self.flow['size'] = 0
+        context.application.cache.update_size(self.flow)
 
         self.flow['duration'] = self.server_resp_time - self.client_req_time
 
@@ -343,13 +347,7 @@ class HandlerContext:
         parsed_url = self._get_parse_url_dict(url)
         self.flow['request'].update(parsed_url)
     
-    def request_post_processing(self):
-        method = self.flow['request']['method']
-        url = self.flow['request']['url']
-        code = self.flow['response']['code']
-        duration = utils.convert_time(self.flow['duration'])
-        size = utils.convert_size(self.flow['size'])
-
+    def request_post_decode(self):
         # Diff Mode proxy request
         if context.application.is_diff_mode == context.MockMode.MULTIPLE and self.response_source == 'mock':
             proxy_handler.handle(self, in_request_handler=False)
@@ -358,8 +356,17 @@ class HandlerContext:
                 self.update_response_data2flow(output_key='proxy_response')
 
         # Import decoder for decoding the requested content
-        decode_flow = {}
-        application.encoders_decoders.decoder_handler(self.flow, output=decode_flow)
+        # self.flow is not modified after response, decoders write on a copy-on-write view
+        # and the event bus takes a snapshot when publishing.
+        # The decoded flow is kept on self.flow and reused by the inspector
+        return application.encoders_decoders.decode(self.flow)
+
+    def request_post_publish(self, decode_flow):
+        method = self.flow['request']['method']
+        url = self.flow['request']['url']
+        code = self.flow['response']['code']
+        duration = utils.convert_time(self.flow['duration'])
+        size = utils.convert_size(self.flow['size'])
 
         context.application.event_bus.publish(
             'flow',
@@ -370,9 +377,31 @@ class HandlerContext:
             )
         )
 
-        if context.application.work_mode == context.Mode.RECORD:
-            dm = context.application.data_manager
+    def request_post_persist(self):
+        dm = context.application.data_manager
+        if not self.response_body_file:
             dm.save_data(self.flow)
+            return
+
+        # Streamed body is decoded from the temp file only when it is saved
+        try:
+            with open(self.response_body_file, 'rb') as f:
+                self.response.data = f.read()
+            flow = utils.CopyOnWriteDict(self.flow)
+            flow['response']['data'] = DataHelper.origin2flow(self.response, chain=self.response_chain)
+            flow['response'].pop('stream', None)
+            dm.save_data(flow)
+        finally:
+            self.release_response_body_file()
+
+    @property
+    def is_recording(self):
+        # Flows are saved in record mode, they are never dropped by the post pipeline
+        return context.application.work_mode == context.Mode.RECORD
+
+    def release_response_body_file(self):
+        remove_body_file(self.response_body_file)
+        self.response_body_file = None
 
     def update_server_req_time(self):
         self.server_req_time = time.time()
@@ -397,3 +426,40 @@ class HandlerContext:
             self.flow['action'].append(action)
         else:
             self.flow['action'] = [action]
+
+
+def _decode_stage(handler_context):
+    try:
+        return handler_context, handler_context.request_post_decode()
+    except Exception:
+        handler_context.release_response_body_file()
+        raise
+
+
+def _publish_stage(item):
+    handler_context, decode_flow = item
+    try:
+        handler_context.request_post_publish(decode_flow)
+    except Exception:
+        handler_context.release_response_body_file()
+        raise
+    if handler_context.is_recording:
+        return handler_context
+    handler_context.release_response_body_file()
+
+
+def _persist_stage(handler_context):
+    handler_context.request_post_persist()
+
+
+def create_request_post_pipeline():
+    """
+    Post processing of each request after response: decode -> publish -> persist(record mode only)
+
+    Decode may send the diff mode proxy request, so it has more workers by default
+    """
+    return Pipeline(REQUEST_POST_PIPELINE, [
+        PipelineStage('decode', _decode_stage, workers=4),
+        PipelineStage('publish', _publish_stage),
+        PipelineStage('persist', _persist_stage)
+    ], on_drop=HandlerContext.release_response_body_file)
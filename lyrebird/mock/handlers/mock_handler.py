@@ -81,7 +81,7 @@ class MockHandler:
         logger.info(
             f'<Mock> Hit Group:{activated_group.get("name")} - Data:{hit_data["name"]} \nURL: {handler_context.flow["request"]["url"]}\nGroupID:{activated_group["id"]} DataID:{hit_data["id"]}')
         handler_context.flow['response']['code'] = hit_data['response']['code']
-        handler_context.flow['response']['headers'] = {k:v for k,v in hit_data['response']['headers'].items()}
+        handler_context.flow['response']['headers'] = utils.CaseInsensitiveDict(hit_data['response']['headers'])
         handler_context.flow['response']['data'] = hit_data['response'].get('data', '')
 
         handler_context.set_response_edited()
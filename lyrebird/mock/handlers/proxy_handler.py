@@ -1,5 +1,4 @@
 import urllib
-import requests
 from requests.packages import urllib3
 from flask import Response, jsonify, stream_with_context
 from .. import context
@@ -7,6 +6,7 @@ from lyrebird import application
 from lyrebird.log import get_logger
 from lyrebird.mock import lb_http_status
 from .duplicate_request_handler import DuplicateRequest
+from .upstream_client import UpstreamClient
 import traceback
 
 
@@ -14,6 +14,8 @@ import traceback
 urllib3.disable_warnings()
 
 logger = get_logger()
+# Shared by all proxy requests, connections to upstream are reused
+upstream_client = UpstreamClient()
 
 
 class ProxyHandler:
@@ -48,7 +50,7 @@ class ProxyHandler:
         headers = handler_context.get_request_headers()
 
         try:
-            r = requests.request(
+            r = upstream_client.request(
                 method, 
                 origin_url, 
                 headers=headers, 
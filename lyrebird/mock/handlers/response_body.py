@@ -0,0 +1,117 @@
+import os
+import hashlib
+import binascii
+import tempfile
+from lyrebird import application
+from lyrebird.log import get_logger
+
+
+"""
+Response body of proxy
+
+Body is buffered for the inspector and decoded by Content-Type after response.
+Body larger than the threshold is streamed without buffering, only a bounded prefix, the length
+and the hash are kept in flow. The full body is spilled to a temp file if recording is on.
+
+Set by config:
+    mock.stream.threshold: bytes, body larger than it is streamed, 0 means always buffered
+    mock.stream.prefix_size: bytes of the prefix kept in flow
+"""
+
+logger = get_logger()
+
+DEFAULT_STREAM_THRESHOLD = 4 * 1024 * 1024
+DEFAULT_STREAM_PREFIX_SIZE = 64 * 1024
+
+TEXT_CONTENT_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml')
+
+
+class ResponseBody:
+
+    def __init__(self, headers, spill=False):
+        self.threshold = application.config.get('mock.stream.threshold', DEFAULT_STREAM_THRESHOLD)
+        self.prefix_size = application.config.get('mock.stream.prefix_size', DEFAULT_STREAM_PREFIX_SIZE)
+        self.content_type = headers.get('Content-Type', '') or ''
+        self.spill = spill
+        self.buffer = []
+        self.length = 0
+        self.prefix = b''
+        self.hash = None
+        self.file = None
+        self.file_path = None
+        self.is_streaming = False
+
+        content_length = headers.get('Content-Length')
+        if content_length and content_length.isdigit() and self.is_over_threshold(int(content_length)):
+            self.start_streaming()
+
+    def is_over_threshold(self, length):
+        return self.threshold and self.threshold > 0 and length > self.threshold
+
+    def write(self, chunk):
+        self.length += len(chunk)
+        if not self.is_streaming:
+            self.buffer.append(chunk)
+            if self.is_over_threshold(self.length):
+                self.start_streaming()
+            return
+
+        if len(self.prefix) < self.prefix_size:
+            self.prefix += chunk[:self.prefix_size - len(self.prefix)]
+        self.hash.update(chunk)
+        if self.file:
+            try:
+                self.file.write(chunk)
+            except OSError as e:
+                logger.warning(f'Write temp file of response body failed, body is not recorded. {e}')
+                self.close()
+                remove_body_file(self.file_path)
+                self.file_path = None
+
+    def start_streaming(self):
+        self.is_streaming = True
+        self.hash = hashlib.sha256()
+        if self.spill:
+            try:
+                self.file = tempfile.NamedTemporaryFile(prefix='lyrebird-body-', delete=False)
+                self.file_path = self.file.name
+            except OSError as e:
+                logger.warning(f'Create temp file of response body failed, body is not recorded. {e}')
+        # Move buffered chunks
+        buffer, self.buffer, self.length = self.buffer, [], 0
+        for chunk in buffer:
+            self.write(chunk)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def getvalue(self):
+        return b''.join(self.buffer)
+
+    def get_prefix_data(self):
+        """
+        Prefix in flow is not decoded by Content-Type, text is shown as it is, others are in base64
+        """
+        if self.content_type.lower().startswith(TEXT_CONTENT_TYPES):
+            return self.prefix.decode('utf-8', errors='replace')
+        return binascii.b2a_base64(self.prefix).decode('utf-8')
+
+    def info(self):
+        return {
+            'length': self.length,
+            'sha256': self.hash.hexdigest() if self.hash else None,
+            'prefix_size': len(self.prefix),
+            'truncated': self.length > len(self.prefix),
+            'recorded': bool(self.file_path)
+        }
+
+
+def remove_body_file(file_path):
+    if not file_path:
+        return
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
@@ -0,0 +1,190 @@
+import time
+import threading
+import requests
+from http import cookiejar
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib.parse import urlparse
+from lyrebird import application
+
+
+"""
+Upstream client
+
+A shared requests session for proxy, connections to upstream are kept alive and reused by host
+
+Pool is set by config:
+    proxy.pool.connections: number of host pools kept, the least recently used one is closed
+    proxy.pool.maxsize: max connections kept of each host
+    proxy.pool.idle_timeout: seconds, pool of a host is closed if it is not used for a while
+"""
+
+DEFAULT_POOL_CONNECTIONS = 100
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60
+
+
+class UpstreamMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.request_count = 0
+            self.connection_count = 0
+            self.handshake_time = 0
+            self.max_handshake_time = 0
+            self.idle_closed_count = 0
+            # {host: [request count, connection count]}
+            self.hosts = {}
+
+    def add_request(self, host):
+        with self.lock:
+            self.request_count += 1
+            self.hosts.setdefault(host, [0, 0])[0] += 1
+
+    def add_connection(self, host, duration):
+        with self.lock:
+            self.connection_count += 1
+            self.handshake_time += duration
+            self.max_handshake_time = max(self.max_handshake_time, duration)
+            self.hosts.setdefault(host, [0, 0])[1] += 1
+
+    def status(self):
+        with self.lock:
+            return {
+                'request': self.request_count,
+                'new_connection': self.connection_count,
+                'reused_connection': max(self.request_count - self.connection_count, 0),
+                'avg_handshake_time': round(self.handshake_time / self.connection_count, 3) if self.connection_count else 0,
+                'max_handshake_time': round(self.max_handshake_time, 3),
+                'idle_closed': self.idle_closed_count,
+                'hosts': {host: {'request': count[0], 'new_connection': count[1]} for host, count in self.hosts.items()}
+            }
+
+
+upstream_metrics = UpstreamMetrics()
+
+
+class MeteredHTTPConnection(HTTPConnection):
+
+    def connect(self):
+        start_time = time.time()
+        super().connect()
+        upstream_metrics.add_connection(f'{self.host}:{self.port}', (time.time() - start_time) * 1000)
+
+
+class MeteredHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        # TCP and TLS handshake
+        start_time = time.time()
+        super().connect()
+        upstream_metrics.add_connection(f'{self.host}:{self.port}', (time.time() - start_time) * 1000)
+
+
+class MeteredHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = MeteredHTTPConnection
+
+
+class MeteredHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = MeteredHTTPSConnection
+
+
+class UpstreamAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': MeteredHTTPConnectionPool,
+            'https': MeteredHTTPSConnectionPool
+        }
+
+    def close_host_pool(self, scheme, host, port):
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            if (key.key_scheme, key.key_host, key.key_port) == (scheme, host, port):
+                # Connections of the pool are closed when it is removed
+                pools.pop(key, None)
+
+
+class BlockAllCookiePolicy(cookiejar.DefaultCookiePolicy):
+    """
+    Session is shared by all clients, cookies of upstream response must not be kept in session
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class UpstreamClient:
+    """
+    Thread-safe, requests are sent by one session
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = None
+        self.adapter = None
+        # {(scheme, host, port): last used time}
+        self.last_used = {}
+
+    def get_session(self):
+        if self.session:
+            return self.session
+        with self.lock:
+            if not self.session:
+                self.adapter = UpstreamAdapter(
+                    pool_connections=application.config.get('proxy.pool.connections', DEFAULT_POOL_CONNECTIONS),
+                    pool_maxsize=application.config.get('proxy.pool.maxsize', DEFAULT_POOL_MAXSIZE)
+                )
+                session = requests.Session()
+                session.cookies.set_policy(BlockAllCookiePolicy())
+                session.mount('http://', self.adapter)
+                session.mount('https://', self.adapter)
+                self.session = session
+        return self.session
+
+    def request(self, method, url, **kwargs):
+        session = self.get_session()
+        parsed_url = urlparse(url)
+        scheme = parsed_url.scheme.lower()
+        port = parsed_url.port or (443 if scheme == 'https' else 80)
+        self.close_idle_pool(scheme, parsed_url.hostname, port)
+        upstream_metrics.add_request(f'{parsed_url.hostname}:{port}')
+        return session.request(method, url, **kwargs)
+
+    def close_idle_pool(self, scheme, host, port):
+        idle_timeout = application.config.get('proxy.pool.idle_timeout', DEFAULT_IDLE_TIMEOUT)
+        now = time.time()
+        pool_key = (scheme, host, port)
+        with self.lock:
+            last_used = self.last_used.get(pool_key)
+            self.last_used[pool_key] = now
+            if not last_used or not idle_timeout or now - last_used <= idle_timeout:
+                return
+        # Kept connections may be closed by upstream already
+        self.adapter.close_host_pool(scheme, host, port)
+        with upstream_metrics.lock:
+            upstream_metrics.idle_closed_count += 1
+
+    def close(self):
+        with self.lock:
+            if self.session:
+                self.session.close()
+            self.session = None
+            self.adapter = None
+            self.last_used = {}
+
+    def status(self):
+        status = upstream_metrics.status()
+        status['pool_connections'] = application.config.get('proxy.pool.connections', DEFAULT_POOL_CONNECTIONS)
+        status['pool_maxsize'] = application.config.get('proxy.pool.maxsize', DEFAULT_POOL_MAXSIZE)
+        status['idle_timeout'] = application.config.get('proxy.pool.idle_timeout', DEFAULT_IDLE_TIMEOUT)
+        return status
@@ -7,6 +7,7 @@ import traceback
 import datetime
 import signal
 from lyrebird.base_server import ProcessServer
+from lyrebird import shared_payload
 from concurrent.futures import ThreadPoolExecutor
 from lyrebird import application
 from lyrebird.compatibility import prepare_application_for_monkey_patch, monkey_patch_application
@@ -19,6 +20,7 @@ class Reporter(ProcessServer):
     def __init__(self):
         super().__init__()
         self.scripts = []
+        self.payload_server = None
         self.workspace = application.config.get('reporter.workspace')
         self.report_queue = application.sync_manager.get_multiprocessing_queue()
         if not self.workspace:
@@ -64,6 +66,9 @@ class Reporter(ProcessServer):
         self.async_obj['report_queue'] = self.report_queue
         self.async_obj['workspace'] = self.workspace
         self.async_obj['process_namespace'] = self.process_namespace
+        self.payload_server = application.server.get('shared_payload')
+        if self.payload_server:
+            self.async_obj['payload_release_queue'] = self.payload_server.release_queue
         super().start()
 
     def run(self, async_obj, config, *args, **kwargs):
@@ -72,6 +77,7 @@ class Reporter(ProcessServer):
 
         workspace = async_obj['workspace']
         reportor_queue = async_obj['report_queue']
+        payload_release_queue = async_obj.get('payload_release_queue')
 
         monkey_patch_application(async_obj)
         scripts = self._read_reporter(workspace)
@@ -85,7 +91,11 @@ class Reporter(ProcessServer):
                 data = reportor_queue.get()
                 if not data:
                     break
-                new_data = deepcopy(data)
+                # data is unpickled from queue, it's a private copy of this process already
+                try:
+                    new_data = shared_payload.resolve_and_release(data, payload_release_queue)
+                except shared_payload.SharedPayloadError:
+                    continue
                 for script in scripts:
                     try:
                         self.thread_executor.submit(script, new_data)
@@ -96,6 +106,8 @@ class Reporter(ProcessServer):
 
     def report(self, data):
         if self.running:
+            if self.payload_server:
+                data = self.payload_server.export(data)
             self.report_queue.put(data)
         else:
             task_manager = application.server.get('task')
@@ -0,0 +1,245 @@
+"""
+Shared payload transport
+
+Large str and bytes values in messages sent to child processes are written into shared memory once,
+and replaced by a small SharedPayload handle before pickled into the queue.
+The same value sent to many processes, such as a flow body checked by several checkers, shares one segment.
+
+Child process resolves handles and sends the segment names back by the release queue,
+segment is unlinked when all references are released.
+Segment not released in max age since its last reference is unlinked, handles of it could not be resolved then,
+such failures are sent back by the release queue and counted.
+"""
+import time
+import queue
+import threading
+import traceback
+from multiprocessing import shared_memory, resource_tracker
+from lyrebird import application
+from lyrebird import log
+from lyrebird.base_server import ThreadServer
+
+
+logger = log.get_logger()
+
+# Values smaller than this size(bytes) are pickled as before
+DEFAULT_THRESHOLD = 64 * 1024
+# Seconds before an unreleased segment is unlinked, in case the child process crashed
+DEFAULT_MAX_AGE = 60
+# Sent by child process to the release queue when a handle could not be resolved
+RESOLVE_FAILED = 'resolve-failed'
+
+
+class SharedPayloadError(Exception):
+    pass
+
+
+class SharedPayload:
+    """
+    Handle of a value in shared memory
+    """
+    __slots__ = ('name', 'size', 'is_str')
+
+    def __init__(self, name, size, is_str):
+        self.name = name
+        self.size = size
+        self.is_str = is_str
+
+    def __getstate__(self):
+        return (self.name, self.size, self.is_str)
+
+    def __setstate__(self, state):
+        self.name, self.size, self.is_str = state
+
+
+class SharedPayloadServer(ThreadServer):
+    """
+    Owner of shared memory segments, worked in main process
+
+    Threshold is set by `event.multiprocess.shared_memory_threshold`, 0 to disable
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.name = 'shared-payload'
+        self.release_queue = application.sync_manager.get_multiprocessing_queue()
+        self.lock = threading.Lock()
+        # {name: [shared memory, reference count, value, last acquire time, data size]}
+        self.segments = {}
+        # {id(value): name}, the value is kept in segments so the id is not reused
+        self.value_segments = {}
+        self.exported_count = 0
+        self.shared_count = 0
+        self.resolve_failed_count = 0
+
+    def start(self, *args, **kwargs):
+        # Child processes should use the same tracker, or segments are unlinked when a child exits
+        resource_tracker.ensure_running()
+        super().start(*args, **kwargs)
+
+    def stop(self):
+        super().stop()
+        self.release_queue.put(None)
+
+    def terminate(self):
+        with self.lock:
+            names = list(self.segments)
+        for name in names:
+            self._unlink(name)
+
+    def run(self):
+        while self.running:
+            try:
+                names = self.release_queue.get(timeout=DEFAULT_MAX_AGE / 2)
+            except queue.Empty:
+                names = []
+            except Exception:
+                logger.error(f'Shared payload release failed. {traceback.format_exc()}')
+                continue
+            if names is None:
+                break
+            if names == RESOLVE_FAILED:
+                with self.lock:
+                    self.resolve_failed_count += 1
+                names = []
+            for name in names:
+                self.release(name)
+            self.release_expired()
+
+    def export(self, value):
+        """
+        Return a copy of value, large str and bytes values inside are replaced by SharedPayload
+        """
+        threshold = application.config.get('event.multiprocess.shared_memory_threshold', DEFAULT_THRESHOLD)
+        if not threshold:
+            return value
+        return self._export(value, threshold)
+
+    def _export(self, value, threshold):
+        if isinstance(value, (str, bytes)):
+            if len(value) < threshold:
+                return value
+            return self.acquire(value) or value
+        if isinstance(value, dict):
+            return {k: self._export(v, threshold) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._export(v, threshold) for v in value]
+        if type(value) == tuple:
+            return tuple(self._export(v, threshold) for v in value)
+        return value
+
+    def acquire(self, value):
+        is_str = isinstance(value, str)
+        with self.lock:
+            name = self.value_segments.get(id(value))
+            if name:
+                segment = self.segments[name]
+                segment[1] += 1
+                # Max age counts from the last reference, it may be queued behind others
+                segment[3] = time.time()
+                self.shared_count += 1
+                return SharedPayload(name, segment[4], is_str)
+
+        data = value.encode() if is_str else value
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        except Exception:
+            logger.error(f'Create shared memory failed. {traceback.format_exc()}')
+            return
+        shm.buf[:len(data)] = data
+        with self.lock:
+            self.segments[shm.name] = [shm, 1, value, time.time(), len(data)]
+            self.value_segments[id(value)] = shm.name
+            self.exported_count += 1
+        return SharedPayload(shm.name, len(data), is_str)
+
+    def release(self, name):
+        with self.lock:
+            segment = self.segments.get(name)
+            if not segment:
+                return
+            segment[1] -= 1
+            if segment[1] > 0:
+                return
+        self._unlink(name)
+
+    def release_expired(self):
+        max_age = application.config.get('event.multiprocess.shared_memory_max_age', DEFAULT_MAX_AGE)
+        expired_time = time.time() - max_age
+        with self.lock:
+            names = [name for name, segment in self.segments.items() if segment[3] < expired_time]
+        for name in names:
+            logger.warning(f'Shared payload {name} is not released in {max_age}s, unlink it')
+            self._unlink(name)
+
+    def _unlink(self, name):
+        with self.lock:
+            segment = self.segments.pop(name, None)
+            if not segment:
+                return
+            self.value_segments.pop(id(segment[2]), None)
+        shm = segment[0]
+        try:
+            shm.close()
+            shm.unlink()
+        except Exception:
+            logger.error(f'Unlink shared memory {name} failed. {traceback.format_exc()}')
+
+    def status(self):
+        with self.lock:
+            return {
+                'segments': len(self.segments),
+                'size': sum(segment[4] for segment in self.segments.values()),
+                'exported': self.exported_count,
+                'shared': self.shared_count,
+                'resolve_failed': self.resolve_failed_count
+            }
+
+
+def resolve(value, names=None):
+    """
+    Replace SharedPayload in value by the data in shared memory, used in child process
+
+    Return the resolved value and names of segments, which should be sent to release queue after resolved
+    """
+    if names is None:
+        names = []
+    if isinstance(value, SharedPayload):
+        shm = shared_memory.SharedMemory(name=value.name)
+        try:
+            data = bytes(shm.buf[:value.size])
+        finally:
+            shm.close()
+        names.append(value.name)
+        return (data.decode() if value.is_str else data), names
+    if isinstance(value, dict):
+        return {k: resolve(v, names)[0] for k, v in value.items()}, names
+    if isinstance(value, list):
+        return [resolve(v, names)[0] for v in value], names
+    if type(value) == tuple:
+        return tuple(resolve(v, names)[0] for v in value), names
+    return value, names
+
+
+def release(release_queue, names):
+    if names and release_queue is not None:
+        release_queue.put(names)
+
+
+def resolve_and_release(value, release_queue):
+    """
+    Return the resolved value, used in child process
+
+    Resolved segments are released even if resolving failed.
+    Raise SharedPayloadError if a segment is gone, the failure is logged and sent to the release queue
+    """
+    names = []
+    try:
+        return resolve(value, names)[0]
+    except Exception as e:
+        logger.error(f'Resolve shared payload failed, the message is dropped. {traceback.format_exc()}')
+        if release_queue is not None:
+            release_queue.put(RESOLVE_FAILED)
+        raise SharedPayloadError(str(e)) from e
+    finally:
+        release(release_queue, names)
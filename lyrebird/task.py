@@ -1,6 +1,8 @@
-from queue import Queue
+import time
+import threading
+from queue import Queue, Full
 from lyrebird.base_server import ThreadServer
-from collections import defaultdict
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
 import traceback
 from lyrebird import application
@@ -9,6 +11,9 @@ from lyrebird.log import get_logger
 
 logger = get_logger()
 
+DEFAULT_STAGE_WORKERS = 1
+DEFAULT_STAGE_QUEUE_SIZE = 1000
+
 
 class Task:
     READY = 0
@@ -31,36 +36,190 @@ class Task:
             logger.error(f'Exec task catch a exception:\n {traceback.format_exc()}')
 
 
+class PipelineStage:
+    """
+    One stage of Pipeline, items are handled by `workers` threads from a bounded queue
+
+    func returns the item passed to next stage, or None to stop the item here
+    Workers and queue size are overridden by config `task.pipeline.<pipeline>.<stage>.workers`
+    and `task.pipeline.<pipeline>.<stage>.queue_size`
+    """
+
+    def __init__(self, name, func, workers=DEFAULT_STAGE_WORKERS, queue_size=DEFAULT_STAGE_QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue = None
+        self.threads = []
+        self.next_stage = None
+        self.lock = threading.Lock()
+        self.processed_count = 0
+        self.error_count = 0
+        self.dropped_count = 0
+        self.total_latency = 0
+        self.max_latency = 0
+
+    def start(self, pipeline_name):
+        config_prefix = f'task.pipeline.{pipeline_name}.{self.name}'
+        self.workers = application.config.get(f'{config_prefix}.workers', self.workers)
+        self.queue_size = application.config.get(f'{config_prefix}.queue_size', self.queue_size)
+        self.queue = Queue(maxsize=self.queue_size)
+        self.threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.run, name=f'{pipeline_name}-{self.name}-{index}', daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            start_time = time.time()
+            try:
+                result = self.func(item)
+            except Exception:
+                result = None
+                with self.lock:
+                    self.error_count += 1
+                logger.error(f'Pipeline stage {self.name} error:\n {traceback.format_exc()}')
+            latency = (time.time() - start_time) * 1000
+            with self.lock:
+                self.processed_count += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            if result is not None and self.next_stage:
+                # Blocked when the next stage is full, slow stage pushes back to the first stage
+                self.next_stage.queue.put(result)
+
+    def status(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'workers': self.workers,
+                'queue_size': self.queue.qsize() if self.queue else 0,
+                'max_queue_size': self.queue_size,
+                'processed': self.processed_count,
+                'error': self.error_count,
+                'dropped': self.dropped_count,
+                'avg_latency': round(self.total_latency / self.processed_count, 3) if self.processed_count else 0,
+                'max_latency': round(self.max_latency, 3)
+            }
+
+
+class Pipeline:
+    """
+    Stages run one after another for each item, each stage has its own queue and workers
+
+    Workers are started when the first item is submitted.
+    Item submitted when the first stage is full is dropped, counted and logged, the submitter is never blocked,
+    on_drop(item) is called to release resources of the dropped item.
+    Items which must not be lost are submitted with block=True, the submitter waits for space instead
+    """
+
+    def __init__(self, name, stages, on_drop=None):
+        self.name = name
+        self.stages = stages
+        self.on_drop = on_drop
+        self.running = False
+        self.lock = threading.Lock()
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            for stage in self.stages:
+                stage.start(self.name)
+            self.running = True
+
+    def submit(self, item, block=False):
+        if not self.running:
+            self.start()
+        stage = self.stages[0]
+        if block:
+            stage.queue.put(item)
+            return
+        try:
+            stage.queue.put_nowait(item)
+        except Full:
+            with stage.lock:
+                stage.dropped_count += 1
+                dropped_count = stage.dropped_count
+            logger.warning(f'Pipeline {self.name} stage {stage.name} is full, item is dropped. Dropped: {dropped_count}')
+            if self.on_drop:
+                self.on_drop(item)
+
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+        # Items in queue are handled before the stage stops
+        for stage in self.stages:
+            stage.stop()
+            for thread in stage.threads:
+                thread.join()
+
+    def status(self):
+        return {
+            'name': self.name,
+            'stages': [stage.status() for stage in self.stages]
+        }
+
+
 class BackgroundTaskServer(ThreadServer):
 
     def __init__(self):
         super().__init__()
-        self.tasks = []
-        self.cmds = application.sync_manager.get_queue()
+        # Task count of each status, tasks are not kept after added
+        self.task_counter = Counter()
+        self.task_counter_lock = threading.Lock()
+        self.pipelines = {}
         self.executor = ThreadPoolExecutor(thread_name_prefix='bg-')
 
-    def run(self):
-        while self.running:
-            cmd = self.cmds.get()
-            if cmd is None or cmd == 'stop':
-                break
-            elif cmd == 'clear':
-                dead_tasks = []
-                for task in self.tasks:
-                    if task.status == Task.FINISH or task.status == Task.ERROR:
-                        dead_tasks.append(task)
-                for dead_task in dead_tasks:
-                    self.tasks.remove(dead_task)
-
     def add_task(self, name, func):
         task = Task(name, func)
-        self.tasks.append(task)
-        self.executor.submit(task.run)
-        self.clear()
+        self._count_task(Task.READY)
+        self.executor.submit(self._run_task, task)
+
+    def _run_task(self, task):
+        self._count_task(Task.RUNNING, Task.READY)
+        task.run()
+        self._count_task(task.status, Task.RUNNING)
+
+    def _count_task(self, status, previous_status=None):
+        with self.task_counter_lock:
+            self.task_counter[status] += 1
+            if previous_status is not None:
+                self.task_counter[previous_status] -= 1
+
+    def add_pipeline(self, pipeline):
+        self.pipelines[pipeline.name] = pipeline
+
+    def submit(self, pipeline_name, item, block=False):
+        self.pipelines[pipeline_name].submit(item, block=block)
 
     def stop(self):
         super().stop()
-        self.cmds.put('stop')
+        for pipeline in self.pipelines.values():
+            pipeline.stop()
 
-    def clear(self):
-        self.cmds.put('clear')
+    def status(self):
+        with self.task_counter_lock:
+            tasks = {
+                'ready': self.task_counter[Task.READY],
+                'running': self.task_counter[Task.RUNNING],
+                'finish': self.task_counter[Task.FINISH],
+                'error': self.task_counter[Task.ERROR]
+            }
+        return {
+            'tasks': tasks,
+            'pipelines': [pipeline.status() for pipeline in self.pipelines.values()]
+        }
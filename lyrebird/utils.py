@@ -2,6 +2,7 @@ import re
 import os
 import json
 import math
+import hashlib
 import time
 import uuid
 import redis
@@ -11,9 +12,11 @@ import tarfile
 import requests
 import datetime
 import netifaces
+import threading
 import traceback
 from pathlib import Path
 from copy import deepcopy
+from collections import OrderedDict
 from jinja2 import Template, StrictUndefined
 from jinja2.exceptions import UndefinedError, TemplateSyntaxError
 from contextlib import closing
@@ -241,11 +244,125 @@ def handle_jinja2_keywords(data, params=None):
     return after_data
 
 
+JINJA2_MARKERS = ('{{', '{%', '{#')
+# Jinja2 converts all kinds of newline into `\n` when rendering
+JINJA2_NEWLINE_PATTERN = re.compile(r'(\r\n|\r|\n)')
+
+
+class CompiledTemplate:
+    '''
+    Jinja2 templates compiled from one data, the fallback template is compiled when it is needed
+
+    Source is not kept, so cached templates do not pin large data
+    '''
+
+    def __init__(self, source):
+        self.template = None
+        self.template_error = None
+        self.fallback_template = None
+        try:
+            self.template = Template(source, keep_trailing_newline=True, undefined=StrictUndefined)
+        except TemplateSyntaxError as e:
+            self.template_error = e
+
+    def get_template(self):
+        if self.template_error:
+            raise self.template_error.with_traceback(None)
+        return self.template
+
+    def get_fallback_template(self, source, params):
+        if not self.fallback_template:
+            data = handle_jinja2_keywords(source, params)
+            self.fallback_template = Template(data, keep_trailing_newline=True)
+        return self.fallback_template
+
+
+class TemplateRenderCache:
+    '''
+    LRU cache of compiled templates used by `render`, and the statistics of rendering
+
+    Templates are keyed by the digest of data and the tojson config, size can be set by `mock.render.cache_size`
+    '''
+
+    DEFAULT_SIZE = 256
+
+    def __init__(self):
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+        self.skip = 0
+        self.render_count = 0
+        self.render_time = 0
+        self.last_render_time = 0
+
+    @staticmethod
+    def get_source(data, enable_tojson=True):
+        return handle_jinja2_tojson_by_config(data) if enable_tojson else data
+
+    def get(self, data, enable_tojson=True):
+        tojson_keys = tuple(config.get('config.value.tojsonKey')) if enable_tojson else None
+        key = (hashlib.sha256(data.encode('utf-8', 'surrogatepass')).digest(), tojson_keys)
+        with self._lock:
+            compiled = self._templates.get(key)
+            if compiled:
+                self._templates.move_to_end(key)
+                self.hit += 1
+                return compiled
+            self.miss += 1
+
+        compiled = CompiledTemplate(self.get_source(data, enable_tojson=enable_tojson))
+
+        max_size = config.get('mock.render.cache_size', self.DEFAULT_SIZE)
+        with self._lock:
+            self._templates[key] = compiled
+            while len(self._templates) > max_size:
+                self._templates.popitem(last=False)
+        return compiled
+
+    def record_skip(self):
+        with self._lock:
+            self.skip += 1
+
+    def record_render(self, duration):
+        with self._lock:
+            self.render_count += 1
+            self.render_time += duration
+            self.last_render_time = duration
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def status(self):
+        with self._lock:
+            return {
+                'size': len(self._templates),
+                'hit': self.hit,
+                'miss': self.miss,
+                'skip': self.skip,
+                'render_count': self.render_count,
+                'average_render_time': self.render_time / self.render_count if self.render_count else 0,
+                'last_render_time': self.last_render_time
+            }
+
+
+render_cache = TemplateRenderCache()
+
+
 def render(data, enable_tojson=True):
     if not isinstance(data, str):
         logger.warning(f'Format error! Expected str, found {type(data)}')
         return
 
+    # Fast path, nothing to render
+    if not any(marker in data for marker in JINJA2_MARKERS):
+        render_cache.record_skip()
+        if '\r' in data:
+            return JINJA2_NEWLINE_PATTERN.sub('\n', data)
+        return data
+
+    start_time = time.time()
     params = {
         'config': config,
         'ip': config.get('ip'),
@@ -254,22 +371,22 @@ def render(data, enable_tojson=True):
         'now':  datetime.datetime.now()
     }
 
-    if enable_tojson:
-        data = handle_jinja2_tojson_by_config(data)
+    compiled = render_cache.get(data, enable_tojson=enable_tojson)
 
     # Jinja2 doc
     # undefined and UndefinedError https://jinja.palletsprojects.com/en/3.1.x/api/#undefined-types
     # TemplateSyntaxError https://jinja.palletsprojects.com/en/3.1.x/api/#jinja2.TemplateSyntaxError
 
     try:
-        template_data = Template(data, keep_trailing_newline=True, undefined=StrictUndefined)
-        data = template_data.render(params)
+        data = compiled.get_template().render(params)
     except (UndefinedError, TemplateSyntaxError):
-        data = handle_jinja2_keywords(data, params)
-        template_data = Template(data, keep_trailing_newline=True)
-        data = template_data.render(params)
+        source = render_cache.get_source(data, enable_tojson=enable_tojson)
+        data = compiled.get_fallback_template(source, params).render(params)
     except Exception:
         logger.error(f'Format error!\n {traceback.format_exc()}')
+        data = render_cache.get_source(data, enable_tojson=enable_tojson)
+    finally:
+        render_cache.record_render(time.time() - start_time)
 
     return data
 
@@ -455,6 +572,189 @@ class HookedDict(dict):
         return (self.__class__, (dict(self),))
 
 
+class CopyOnWriteDict(dict):
+    '''
+    A writable view of a dict, changes of the view never affect the origin dict.
+
+    Values are shared with the origin dict until they are written.
+    Nested dict and list are wrapped when they are read,
+    so writing at any depth copies only the containers on the path to the written key,
+    and large values such as response data are never copied.
+
+    Copies by `dict(view)`, `{**view}`, `view.copy()` and `copy.copy(view)` read values
+    through the view, so nested values of them are wrapped too.
+    '''
+
+    def __iter__(self):
+        # Overridden so dict(view) and {**view} read values by __getitem__ instead of the raw storage
+        return super(CopyOnWriteDict, self).__iter__()
+
+    def __getitem__(self, key):
+        value = super(CopyOnWriteDict, self).__getitem__(key)
+        wrapped_value = _copy_on_write_value(value)
+        if wrapped_value is not value:
+            super(CopyOnWriteDict, self).__setitem__(key, wrapped_value)
+        return wrapped_value
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key not in self:
+            return super(CopyOnWriteDict, self).pop(key, *args)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self:
+            return super(CopyOnWriteDict, self).popitem()
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def copy(self):
+        return CopyOnWriteDict(self)
+
+    def __copy__(self):
+        return CopyOnWriteDict(self)
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        new_view = CopyOnWriteDict(self)
+        new_view.update(other)
+        return new_view
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class CopyOnWriteList(list):
+    '''
+    List read from CopyOnWriteDict, a shallow copy of the origin list
+    '''
+
+    def __init__(self, origin):
+        super(CopyOnWriteList, self).__init__(_copy_on_write_value(v) for v in origin)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(list(self), memo)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+def _copy_on_write_value(value):
+    value_type = type(value)
+    if value_type in (dict, FrozenDict, HookedDict, CopyOnWriteDict):
+        return CopyOnWriteDict(value)
+    if value_type in (CaseInsensitiveDict, FrozenCaseInsensitiveDict):
+        # Headers, values are strings
+        return CaseInsensitiveDict(value)
+    if value_type in (list, FrozenList, CopyOnWriteList):
+        return CopyOnWriteList(value)
+    return value
+
+
+class FrozenDict(dict):
+    '''
+    Read-only dict, shared by all event subscribers
+
+    Copy it by `dict(...)`, `copy` or `deepcopy` to get a writable dict,
+    pickled FrozenDict is loaded as dict
+    '''
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only, copy it before modifying')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class FrozenCaseInsensitiveDict(CaseInsensitiveDict):
+    '''
+    Read-only CaseInsensitiveDict, headers of a frozen flow, see FrozenDict
+    '''
+
+    def __init__(self, raw_dict=None):
+        super(FrozenCaseInsensitiveDict, self).__init__()
+        for k, v in (raw_dict or {}).items():
+            CaseInsensitiveDict.__setitem__(self, k, v)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only, copy it before modifying')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self):
+        return CaseInsensitiveDict(self)
+
+    def __reduce__(self):
+        return (CaseInsensitiveDict, (dict(self),))
+
+
+class FrozenList(list):
+    '''
+    Read-only list, see FrozenDict
+    '''
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only, copy it before modifying')
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+
+    def copy(self):
+        return list(self)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+def freeze(value):
+    '''
+    Return a read-only snapshot of value
+
+    dict and list are copied into FrozenDict and FrozenList, headers into FrozenCaseInsensitiveDict,
+    immutable values are shared, other objects are deep copied
+    '''
+    value_type = type(value)
+    if value is None or value_type in (str, bytes, int, float, bool, FrozenDict, FrozenList, FrozenCaseInsensitiveDict):
+        return value
+    if value_type in (dict, CopyOnWriteDict, HookedDict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if value_type == CaseInsensitiveDict:
+        return FrozenCaseInsensitiveDict(value)
+    if value_type in (list, CopyOnWriteList):
+        return FrozenList(freeze(v) for v in value)
+    if value_type == tuple:
+        return tuple(freeze(v) for v in value)
+    return deepcopy(value)
+
+
 class TargetMatch:
 
     @staticmethod
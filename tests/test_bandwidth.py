@@ -0,0 +1,88 @@
+import time
+import threading
+import pytest
+from lyrebird.mock.blueprints.apis.bandwidth import Conf, BandwidthThrottler, BANDWIDTH_SCOPE_GLOBAL
+
+
+@pytest.fixture
+def conf():
+    conf = Conf()
+    conf.bandwidth = 200
+    return conf
+
+
+def send(throttler, data, client_address=None):
+    start_time = time.monotonic()
+    chunks = list(throttler.throttle([data], client_address))
+    assert b''.join(chunks) == data
+    return time.monotonic() - start_time, len(chunks)
+
+
+def test_throttle_benchmark(conf):
+    """
+    Time of throttled response keeps close to size / bandwidth, with few sleeps
+    """
+    throttler = BandwidthThrottler(conf)
+    data = b'x' * 100 * 1024
+    expected = len(data) / (conf.bandwidth * 1024)
+    duration, chunk_count = send(throttler, data)
+
+    error = (duration - expected) / expected
+    print(f'\nThrottle 100KB at 200KB/s: {duration:.3f}s, error {error:.1%}, '
+          f'{chunk_count} chunks, {throttler.status()["sleep_count"]} sleeps')
+    assert abs(error) < 0.05
+    # 2048 bytes per chunk before
+    assert chunk_count < len(data) / 2048
+
+
+def test_throttle_unlimited(conf):
+    conf.bandwidth = -1
+    throttler = BandwidthThrottler(conf)
+    duration, chunk_count = send(throttler, b'x' * 1024 * 1024)
+    assert duration < 0.1
+    assert chunk_count == 1
+
+
+def test_throttle_shared_bucket(conf):
+    throttler = BandwidthThrottler(conf)
+    data = b'x' * 50 * 1024
+    durations = {}
+
+    def client(name, address):
+        durations[name] = send(throttler, data, address)[0]
+
+    # 2 responses of the same client share the bandwidth
+    threads = [threading.Thread(target=client, args=(i, '10.0.0.1')) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(durations.values()) == pytest.approx(0.5, rel=0.1)
+
+    # Other clients are not affected, unless the scope is global
+    durations.clear()
+    threads = [threading.Thread(target=client, args=(i, f'10.0.0.{i}')) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(durations.values()) == pytest.approx(0.25, rel=0.1)
+
+    conf.scope = BANDWIDTH_SCOPE_GLOBAL
+    durations.clear()
+    threads = [threading.Thread(target=client, args=(i, f'10.0.0.{i}')) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(durations.values()) == pytest.approx(0.5, rel=0.1)
+    assert throttler.status()['bucket_count'] == 1
+
+
+def test_throttle_latency(conf):
+    conf.bandwidth = -1
+    conf.latency = 100
+    conf.jitter = 20
+    throttler = BandwidthThrottler(conf)
+    duration, _ = send(throttler, b'x')
+    assert 0.08 <= duration < 0.15
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from lyrebird.mock.cache import ListCache
 
 def test_list_cache():
@@ -12,3 +13,40 @@ def test_list_cache_max():
     for i in range(20):
         cache.add(i)
     assert cache.items()[9] == 19
+
+def test_list_cache_get_and_delete_by_ids():
+    cache = ListCache(maxlen=10)
+    for i in range(20):
+        cache.add({'id': str(i)})
+    assert cache.get('9') is None
+    assert cache.get('19') == {'id': '19'}
+    cache.delete_by_ids('19', '18', '0')
+    assert cache.get('19') is None
+    assert len(cache) == 8
+    assert cache.items()[0] == {'id': '10'}
+
+def test_list_cache_max_bytes():
+    cache = ListCache(maxbytes=100)
+    for i in range(10):
+        cache.add({'id': str(i), 'size': 30})
+    assert [item['id'] for item in cache.items()] == ['7', '8', '9']
+    assert cache.status()['size'] == 90
+
+    flow = cache.get('9')
+    flow['size'] = 80
+    cache.update_size(flow)
+    assert [item['id'] for item in cache.items()] == ['9']
+    assert cache.status()['size'] == 80
+
+def test_list_cache_thread_safe():
+    cache = ListCache(maxlen=100)
+
+    def add_and_delete(start):
+        for i in range(start, start + 1000):
+            cache.add({'id': str(i)})
+            cache.delete_by_ids(str(i - 50))
+            cache.get(str(i - 10))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(add_and_delete, range(0, 4000, 1000)))
+    assert len(cache) == len(cache.items()) <= 100
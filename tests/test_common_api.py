@@ -1,6 +1,6 @@
 import time
 import pytest
-from lyrebird import application
+from lyrebird import application, utils
 from lyrebird.config import ConfigManager
 from lyrebird.mock.mock_server import LyrebirdMockServer
 
@@ -63,3 +63,25 @@ def test_render_api_with_enable_tojson_false(client):
     today = time.strftime('%Y-%m-%d', time.localtime())
     assert resp.json['code'] == 1000
     assert resp.json['data'] == render_response_data_not_tojson + today + '"'
+
+def test_render_api_status(client):
+    utils.render_cache.clear()
+    status = client.get('/api/render').json['data']
+    for _ in range(2):
+        client.put('/api/render', json={
+            'data': origin_data
+        })
+    client.put('/api/render', json={
+        'data': '"keyA":"valueA"'
+    })
+    resp = client.get('/api/render')
+    assert resp.json['code'] == 1000
+    assert resp.json['data']['miss'] == status['miss'] + 1
+    assert resp.json['data']['hit'] == status['hit'] + 1
+    assert resp.json['data']['skip'] == status['skip'] + 1
+    assert resp.json['data']['render_count'] == status['render_count'] + 2
+
+def test_upstream_api_status(client):
+    resp = client.get('/api/upstream')
+    assert resp.json['code'] == 1000
+    assert 'pool_maxsize' in resp.json['data']
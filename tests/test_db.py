@@ -1,5 +1,11 @@
+import json
 import time
+import queue
+import sqlite3
+import threading
 import pytest
+import datetime
+from copy import deepcopy
 from .utils import FakeSocketio, FakeBackgroundTaskServer
 from pathlib import Path
 from typing import NamedTuple
@@ -7,7 +13,11 @@ import lyrebird
 from lyrebird import application
 from lyrebird.event import EventServer
 from lyrebird.config import personal_config_template
-from lyrebird.db.database_server import LyrebirdDatabaseServer
+from lyrebird.db import database_server
+from lyrebird.db.database_server import LyrebirdDatabaseServer, Event, EventBody
+from lyrebird.db.retention import EventRetentionServer, get_metadata_content
+from lyrebird.mock.handlers.encoder_decoder_handler import EncoderDecoder
+from sqlalchemy.exc import OperationalError
 
 
 MockConfigManager = NamedTuple('MockConfigManager', [('config', dict), ('personal_config', dict), ('ROOT', object), ('root', object)])
@@ -99,3 +109,429 @@ def test_get_event_with_multiple_search_str(event_server, task_server, db_server
     assert search_str2 in events[0].message
     assert search_str1 in events[1].message
     assert search_str2 in events[1].message
+
+
+def test_write_events_in_batch(event_server, task_server, db_server):
+    application._cm.config['event.db.batch_interval'] = 300
+    publish_time = 10
+    for i in range(publish_time):
+        event_server.publish('Test', {'message': f'test-{i}'})
+    time.sleep(0.6)
+
+    events = db_server.get_event([])
+    assert len(events) == publish_time
+    assert events[0].message == f'test-{publish_time-1}'
+    assert events[0].timestamp
+
+    status = db_server.get_writer_status()
+    assert status['event_count'] == publish_time
+    assert status['batch_count'] < publish_time
+    assert status['max_batch_size'] > 1
+    assert status['queue_size'] == 0
+    assert db_server.get_database_info()['writer']['event_count'] == publish_time
+
+
+@pytest.fixture
+def fts_db_server(event_server):
+    application._cm.config['event.db.fts'] = True
+    application._cm.config['event.db.fts.content_fields'] = ['flow.request.url']
+    application.encoders_decoders = EncoderDecoder()
+    server = LyrebirdDatabaseServer()
+    server.start()
+    application.server['db'] = server
+    yield server
+    server.stop()
+
+
+def test_fts_search(event_server, task_server, fts_db_server):
+    assert fts_db_server.fts_enabled
+    channel_name = 'Test'
+    for message in ['mei', 'tuan', 'meituan', 'Meituan dianping', 'dianping "quoted"']:
+        event_server.publish(channel_name, {'message': message})
+    event_server.publish('flow', {'message': 'flow', 'flow': {'request': {'url': 'http://somehost/api/search'}}})
+    time.sleep(0.2)
+
+    events = fts_db_server.get_event(channel_rules=[], search_str='mei + tuan')
+    assert [e.message for e in events] == ['Meituan dianping', 'meituan']
+    assert fts_db_server.get_page_count(channel_rules=[], page_size=1, search_str='mei + tuan') == 2
+
+    # Term shorter than FTS_MIN_TERM_LENGTH
+    events = fts_db_server.get_event(channel_rules=[], search_str='ping + ng')
+    assert len(events) == 2
+    events = fts_db_server.get_event(channel_rules=[], search_str='"quoted"')
+    assert len(events) == 1
+
+    # Content field
+    events = fts_db_server.get_event(channel_rules=[], search_str='api/search')
+    assert len(events) == 1
+    assert events[0].channel == 'flow'
+    assert len(fts_db_server.get_event(channel_rules=['Test'], search_str='api/search')) == 0
+
+
+def test_fts_migration(event_server, tmpdir):
+    path = str(tmpdir/'migration.db')
+    server = LyrebirdDatabaseServer(path=path)
+    assert not server.fts_enabled
+    server._write_batch(server.session, [
+        {'event_id': 'event-1', 'channel': 'Test', 'content': '{"message": "meituan"}', 'message': 'meituan'},
+        {'event_id': 'event-2', 'channel': 'flow', 'content': '{"flow": {"request": {"url": "http://somehost/api/search"}}}', 'message': None}
+    ])
+
+    application._cm.config['event.db.fts'] = True
+    application._cm.config['event.db.fts.content_fields'] = ['flow.request.url']
+    server = LyrebirdDatabaseServer(path=path)
+    assert server.fts_enabled
+    # Existing events are indexed in background
+    server.fts_backfill_thread.join(timeout=5)
+    assert not server.fts_backfill_thread.is_alive()
+    assert 'event_fts_backfill' not in server.session.bind.table_names()
+    assert len(server.get_event(channel_rules=[], search_str='tuan')) == 1
+    assert len(server.get_event(channel_rules=[], search_str='api/search')) == 1
+
+    # Index is maintained on delete
+    session = server.session
+    session.query(Event).filter(Event.event_id == 'event-1').delete()
+    session.commit()
+    assert len(server.get_event(channel_rules=[], search_str='tuan')) == 0
+
+    # Events written while full-text search is disabled are indexed when it is enabled again
+    application._cm.config['event.db.fts'] = False
+    server = LyrebirdDatabaseServer(path=path)
+    server._write_batch(server.session, [
+        {'event_id': 'event-3', 'channel': 'Test', 'content': '{"message": "waimai"}', 'message': 'waimai'}
+    ])
+    application._cm.config['event.db.fts'] = True
+    server = LyrebirdDatabaseServer(path=path)
+    server.fts_backfill_thread.join(timeout=5)
+    assert len(server.get_event(channel_rules=[], search_str='waimai')) == 1
+    assert len(server.get_event(channel_rules=[], search_str='api/search')) == 1
+
+
+def test_write_batch_retry_locked_database(event_server, tmpdir, monkeypatch):
+    monkeypatch.setattr(database_server, 'DB_LOCKED_RETRY_INTERVAL', 0)
+    server = LyrebirdDatabaseServer(path=str(tmpdir/'locked.db'))
+    session = server.session
+    commit = session.commit
+    errors = [OperationalError('COMMIT', {}, sqlite3.OperationalError('database is locked'))]
+
+    def locked_commit():
+        if errors:
+            raise errors.pop()
+        commit()
+
+    monkeypatch.setattr(session, 'commit', locked_commit)
+    server._write_batch_with_retry(session, [
+        {'event_id': 'event-1', 'channel': 'Test', 'content': '{}', 'message': 'test'}
+    ])
+    assert server.get_event_count(['Test']) == 1
+    assert len(server.get_event(channel_rules=['Test'])) == 1
+    assert server.error_log == []
+
+
+def test_fts_rows_of_same_event_id(event_server, fts_db_server):
+    fts_db_server._write_batch(fts_db_server.session, [
+        {'event_id': None, 'channel': 'Test', 'content': '{}', 'message': 'meituan', 'fts_content': ''},
+        {'event_id': 'event-1', 'channel': 'Test', 'content': '{}', 'message': 'dianping', 'fts_content': ''},
+        {'event_id': 'event-1', 'channel': 'Test', 'content': '{}', 'message': 'waimai', 'fts_content': ''}
+    ])
+    for message in ['meituan', 'dianping', 'waimai']:
+        events = fts_db_server.get_event(channel_rules=[], search_str=message)
+        assert [e.message for e in events] == [message]
+
+
+def test_keyset_pagination(event_server, task_server, db_server):
+    for i in range(5):
+        event_server.publish('Test', {'message': f'test-{i}'})
+    for i in range(3):
+        event_server.publish('Other', {'message': f'other-{i}'})
+    time.sleep(0.2)
+
+    events = db_server.get_event(['Test'], limit=2)
+    assert [e.message for e in events] == ['test-4', 'test-3']
+    events = db_server.get_event(['Test'], limit=2, before_id=events[-1].id)
+    assert [e.message for e in events] == ['test-2', 'test-1']
+    events = db_server.get_event(['Test'], offset=100, limit=2, before_id=events[-1].id)
+    assert [e.message for e in events] == ['test-0']
+
+    other_events = db_server.get_event(['Other'])
+    page = db_server.get_page_index_by_event_id(other_events[-1].event_id, [], limit=2)
+    assert page == 1
+    events = db_server.get_event([], offset=page*2, limit=2)
+    assert other_events[-1].event_id in [e.event_id for e in events]
+    assert db_server.get_page_index_by_event_id(other_events[-1].event_id, ['Other'], limit=2) == 1
+    assert db_server.get_page_index_by_event_id(other_events[-1].event_id, [], limit=2, search_str='other') == 1
+    assert db_server.get_page_index_by_event_id('not-exist', [], limit=2) == 0
+
+
+def test_channel_counter(event_server, task_server, db_server):
+    for i in range(5):
+        event_server.publish('Test', {'message': f'test-{i}'})
+    for i in range(3):
+        event_server.publish('Other', {'message': f'other-{i}'})
+    time.sleep(0.2)
+
+    assert db_server.get_event_count(['Test']) == 5
+    assert db_server.get_event_count(['Test', 'Other', 'Test']) == 8
+    assert db_server.get_event_count([]) == 8
+    assert db_server.get_page_count(['Test'], page_size=2) == 3
+    assert db_server.get_page_count(['Test', 'Other'], page_size=2, search_str='other') == 2
+    assert [item[0] for item in db_server.get_channel_list()] == ['Other', 'Test']
+
+    # Counter is loaded from database
+    db_server.load_channel_counter()
+    assert db_server.get_event_count(['Test']) == 5
+
+    db_server.reset()
+    assert db_server.get_event_count([]) == 0
+    assert db_server.get_channel_list() == []
+
+
+def write_events(db_server, channel, count, days_ago=0, content=None):
+    db_server._write_batch(db_server.session, [
+        {'event_id': f'{channel}-{days_ago}-{i}', 'channel': channel, 'content': content or json.dumps({'message': 'test'}), 'message': 'test'}
+        for i in range(count)
+    ])
+    if days_ago:
+        session = db_server.session
+        session.query(Event).filter(Event.event_id.like(f'{channel}-{days_ago}-%')) \
+            .update({Event._timestamp: datetime.datetime.utcnow() - datetime.timedelta(days=days_ago)}, synchronize_session=False)
+        session.commit()
+
+
+def test_retention_max_age_and_rows(event_server, tmpdir):
+    db_server = LyrebirdDatabaseServer(path=str(tmpdir/'retention.db'))
+    write_events(db_server, 'Test', 5, days_ago=3)
+    write_events(db_server, 'Test', 5)
+    write_events(db_server, 'Other', 10)
+
+    application._cm.config['event.db.retention'] = {
+        'Test': {'max_age': 2},
+        '*': {'max_rows': 4}
+    }
+    application._cm.config['event.db.retention.batch_size'] = 3
+    retention_server = EventRetentionServer(db_server)
+    retention_server.run_once()
+
+    assert db_server.get_event_count(['Test']) == 5
+    assert db_server.get_event_count(['Other']) == 4
+    assert [e.event_id for e in db_server.get_event(['Other'])] == [f'Other-0-{i}' for i in range(9, 5, -1)]
+    assert retention_server.status()['deleted_count'] == 11
+
+    db_server.load_channel_counter()
+    assert db_server.get_event_count(['Test']) == 5
+    assert db_server.get_event_count(['Other']) == 4
+
+
+def test_retention_max_bytes(event_server, tmpdir):
+    db_server = LyrebirdDatabaseServer(path=str(tmpdir/'retention.db'))
+    content = json.dumps({'message': 'x' * 2000})
+    write_events(db_server, 'Test', 10, content=content)
+    assert db_server.get_channel_size('Test') == 10 * len(content)
+    page_count = db_server.session.execute('PRAGMA page_count').scalar()
+
+    application._cm.config['event.db.retention'] = {'Test': {'max_bytes': f'{len(content) * 3}B'}}
+    retention_server = EventRetentionServer(db_server)
+    retention_server.run_once()
+
+    assert db_server.get_event_count(['Test']) == 3
+    assert db_server.get_channel_size('Test') == 3 * len(content)
+    # Free pages are released by incremental vacuum
+    assert db_server.session.execute('PRAGMA freelist_count').scalar() == 0
+    assert db_server.session.execute('PRAGMA page_count').scalar() < page_count
+    write_events(db_server, 'Test', 1, content=content)
+    assert db_server.get_channel_size('Test') == 4 * len(content)
+
+
+def test_retention_metadata_only(event_server, tmpdir):
+    db_server = LyrebirdDatabaseServer(path=str(tmpdir/'retention.db'))
+    flow_event = {
+        'message': 'flow',
+        'channel': 'flow',
+        'other': 'other',
+        'flow': {
+            'id': 'flow-id',
+            'request': {'url': 'http://somehost/api', 'data': 'request body'},
+            'response': {'code': 200, 'data': 'response body'}
+        }
+    }
+    write_events(db_server, 'flow', 3, days_ago=2, content=json.dumps(flow_event))
+    write_events(db_server, 'flow', 2, content=json.dumps(flow_event))
+
+    application._cm.config['event.db.retention'] = {'flow': {'metadata_after': 1}}
+    retention_server = EventRetentionServer(db_server)
+    retention_server.run_once()
+    assert retention_server.status()['compacted_count'] == 3
+
+    events = db_server.get_event(['flow'])
+    assert db_server.get_event_count(['flow']) == 5
+    new_contents = [json.loads(e.content) for e in events[:2]]
+    old_contents = [json.loads(e.content) for e in events[2:]]
+    assert all(content == flow_event for content in new_contents)
+    for content in old_contents:
+        assert content['metadata_only']
+        assert content['message'] == 'flow'
+        assert 'other' not in content
+        assert content['flow']['request'] == {'url': 'http://somehost/api'}
+        assert content['flow']['response'] == {'code': 200}
+
+    retention_server.run_once()
+    assert retention_server.status()['compacted_count'] == 3
+    assert get_metadata_content(events[-1].content) is None
+    assert get_metadata_content('not json') is None
+
+    # Events in the new database are compacted from the beginning
+    db_server.start()
+    db_server.reset()
+    assert db_server.compact_watermark == {}
+    write_events(db_server, 'flow', 2, days_ago=2, content=json.dumps(flow_event))
+    retention_server.run_once()
+    assert retention_server.status()['compacted_count'] == 5
+    db_server.stop()
+
+
+def test_migrate_auto_vacuum(event_server, tmpdir):
+    db_path = tmpdir/'old.db'
+    connection = sqlite3.connect(str(db_path))
+    connection.execute('CREATE TABLE old (id INTEGER PRIMARY KEY)')
+    connection.commit()
+    assert connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+    connection.close()
+
+    db_server = LyrebirdDatabaseServer(path=str(db_path))
+    assert db_server.session.execute('PRAGMA auto_vacuum').scalar() == 2
+
+
+@pytest.fixture
+def compression_db_server(event_server):
+    application._cm.config['event.db.compression'] = 'zlib'
+    application.encoders_decoders = EncoderDecoder()
+    server = LyrebirdDatabaseServer()
+    server.start()
+    application.server['db'] = server
+    yield server
+    server.stop()
+
+
+def make_flow_event(index, body):
+    return {
+        'message': f'flow-{index}',
+        'flow': {
+            'id': f'flow-{index}',
+            'request': {'url': f'http://somehost/api/{index}'},
+            'response': {'code': 200, 'data': body}
+        }
+    }
+
+
+def test_compressed_content(event_server, task_server, compression_db_server):
+    body = json.dumps({'data': [{'name': f'item-{i}'} for i in range(100)]})
+    for i in range(3):
+        event_server.publish('flow', make_flow_event(i, body))
+    event_server.publish('flow', make_flow_event(3, 'small body'))
+    event_server.publish('Test', {'message': 'test'})
+    time.sleep(0.2)
+
+    events = compression_db_server.get_event([])
+    assert len(events) == 5
+    for e in events:
+        assert e.content is None
+        assert isinstance(e.compressed_content, bytes)
+        content = json.loads(e.json()['content'])
+        assert content['message'] == e.message
+        assert 'response_body_hash' not in e.json()
+    flow_contents = [json.loads(e.json()['content']) for e in events if e.channel == 'flow']
+    assert [c['flow']['response']['data'] for c in flow_contents] == ['small body', body, body, body]
+
+    # Identical response bodies are stored once
+    session = compression_db_server.session
+    assert session.query(EventBody).count() == 1
+    assert len({e.response_body_hash for e in events if e.response_body_hash}) == 1
+
+    # Body is restored for events of any query
+    event = session.query(Event).filter(Event.event_id == events[-1].event_id).one()
+    assert json.loads(event.get_content())['flow']['response']['data'] == body
+
+    # Unused bodies are deleted by retention
+    application._cm.config['event.db.retention'] = {'flow': {'max_rows': 1}}
+    EventRetentionServer(compression_db_server).run_once()
+    assert session.query(EventBody).count() == 0
+    events = compression_db_server.get_event(['flow'])
+    assert json.loads(events[0].json()['content'])['flow']['response']['data'] == 'small body'
+
+    # Compressed content is compacted into compressed metadata
+    application._cm.config['event.db.retention'] = {'flow': {'metadata_after': 0}}
+    EventRetentionServer(compression_db_server).run_once()
+    session.expire_all()
+    event = compression_db_server.get_event(['flow'])[0]
+    assert event.content is None
+    content = json.loads(event.json()['content'])
+    assert content['metadata_only']
+    assert content['flow']['response'] == {'code': 200}
+
+
+def test_delete_unused_bodies_with_writer(event_server, compression_db_server):
+    retention_server = EventRetentionServer(compression_db_server)
+    body = json.dumps({'data': [{'name': f'item-{i}'} for i in range(100)]})
+    compression_db_server.pop_response_body(make_flow_event(0, body), {})
+
+    # Batch being written holds body_lock, its body is known but not committed
+    with compression_db_server.body_lock:
+        delete_thread = threading.Thread(target=retention_server.delete_unused_bodies)
+        delete_thread.start()
+        delete_thread.join(timeout=0.2)
+        assert delete_thread.is_alive()
+    delete_thread.join()
+
+    # Known bodies are forgotten, the body is sent to the writer again
+    row = {}
+    compression_db_server.pop_response_body(make_flow_event(1, body), row)
+    assert 'response_body' in row
+
+
+def test_compression_benchmark(event_server, tmpdir):
+    """
+    Report database size and insert throughput with and without compression
+    """
+    application.encoders_decoders = EncoderDecoder()
+    bodies = [json.dumps({'data': [{'name': f'item-{i}-{j}', 'value': j} for j in range(200)]}) for i in range(5)]
+    report = {}
+    for compression in (None, 'zlib', 'zstd'):
+        application._cm.config['event.db.compression'] = compression
+        path = tmpdir/f'benchmark-{compression}.db'
+        db_server = LyrebirdDatabaseServer(path=str(path))
+        if compression and db_server.compression != compression:
+            continue
+
+        db_server.storage_queue = queue.Queue()
+        start_time = time.time()
+        for i in range(500):
+            db_server.event_receiver(make_flow_event(i, bodies[i % len(bodies)]), channel='flow', event_id=f'event-{i}')
+        rows = db_server._make_rows([db_server.storage_queue.get_nowait() for _ in range(db_server.storage_queue.qsize())])
+        for i in range(0, len(rows), 100):
+            db_server._write_batch(db_server.session, rows[i:i+100])
+        duration = time.time() - start_time
+        report[compression] = {'size': path.size(), 'events_per_second': round(len(rows) / duration)}
+
+    print(f'\nEvent compression benchmark: {report}')
+    assert report['zlib']['size'] < report[None]['size']
+
+
+def test_make_row_from_snapshot(event_server, db_server):
+    def encode(flow):
+        flow['request']['data'] = 'encoded'
+
+    application.encoder.append({'name': 'encode', 'func': encode, 'rules': {'request.url': 'meituan'}, 'rank': 0})
+    try:
+        application.encoders_decoders = EncoderDecoder()
+        matched_event = {'message': 'flow', 'flow': {'request': {'url': 'http://www.meituan.com', 'data': 'origin'}}}
+        unmatched_event = {'message': 'flow', 'flow': {'request': {'url': 'http://www.bing.com', 'data': 'origin'}}}
+        origin_matched_event = deepcopy(matched_event)
+
+        row = db_server.make_row(matched_event, 'flow', 'event-1')
+        assert json.loads(row['content'])['flow']['request']['data'] == 'encoded'
+        assert matched_event == origin_matched_event
+
+        row = db_server.make_row(unmatched_event, 'flow', 'event-2')
+        assert json.loads(row['content']) == unmatched_event
+    finally:
+        application.encoder.clear()
@@ -3,10 +3,12 @@ import json
 import pytest
 import codecs
 import tarfile
+import tracemalloc
 import lyrebird
 from pathlib import Path
 from copy import deepcopy
 from typing import NamedTuple
+from collections import OrderedDict
 from urllib.parse import urlparse
 from .utils import FakeSocketio
 from lyrebird.mock import dm
@@ -1312,3 +1314,47 @@ def test_get_snapshot_file_detail(data_manager):
 
     snapshot_info, output_path = data_manager.get_snapshot_file_detail(filename)
     assert snapshot_info == data_manager.id_map.get(group_id)
+
+
+def test_matched_data_copy_on_write(data_manager):
+    flow = {
+        'request': {
+            'url': 'http://somehost/api/search'
+        }
+    }
+    data_manager.activate('groupK-UUID')
+    mock_data = data_manager.get_matched_data(flow)[0]
+    activated_data = data_manager.activated_data[mock_data['id']]
+    origin_response = deepcopy(activated_data['response'])
+
+    mock_data['response']['headers'] = {'isMocked': 'True'}
+    mock_data['response']['data'] = 'modified'
+    mock_data['request']['url'] = 'modified'
+    assert activated_data['response'] == origin_response
+    assert activated_data['request']['url'] == dataJ['request']['url']
+
+
+def test_matched_data_allocation_with_large_body(data_manager):
+    large_data = {
+        'id': 'large-UUID',
+        'name': 'large',
+        'rule': {'request.url': '(?=.*/api/large)'},
+        'request': {'url': 'http://somehost/api/large', 'data': {f'key{i}': [i] * 10 for i in range(10000)}},
+        'response': {'code': 200, 'headers': {'Content-Type': 'application/json'}, 'data': ''}
+    }
+    data_manager.activated_data = OrderedDict({'large-UUID': large_data})
+    flow = {
+        'request': {
+            'url': 'http://somehost/api/large'
+        }
+    }
+
+    tracemalloc.start()
+    deepcopy(large_data)
+    _, deepcopy_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    data_manager.get_matched_data(flow)
+    _, matched_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert matched_peak * 10 < deepcopy_peak
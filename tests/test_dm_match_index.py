@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from lyrebird.mock.dm import MatchRules
+from lyrebird.mock.dm.match_index import CompiledMatchRule, MatchIndex, get_required_literals
+
+
+RULES = [
+    {'request.url': '(?=.*/api/search)'},
+    {'request.url': '(?=.*/api/search\\?)'},
+    {'request.url': '(?=.*/api/search$)'},
+    {'request.url': '^http://somehost/'},
+    {'request.data.id': 1},
+    {'request.data.isOpen': True},
+    {'request.data': None},
+    {'request.url': '(?=.*search)', 'request.data.name': 'a'},
+    {
+        'must': {
+            'match': {'request.url': '(?=.*search)'},
+            'exists': ['request.data.name']
+        },
+        'must_not': {
+            'match': {'request.data.name': '(?=.*a)'},
+            'exists': ['request.data.age']
+        }
+    },
+    {'must': {}},
+    {'must': {'match': {}}},
+    {'unknown': {}},
+    {'request.url': {}},
+    {},
+    None,
+]
+
+FLOWS = [
+    {'request': {'url': 'http://somehost/api/search'}},
+    {'request': {'url': 'http://somehost/api/search?q=1'}},
+    {'request': {'url': 'http://otherhost/api/searching'}},
+    {'request': {'url': 'http://somehost/api/location', 'data': {'id': 1}}},
+    {'request': {'url': 'http://somehost/api/search', 'data': {'name': 'b'}}},
+    {'request': {'url': 'http://somehost/api/search', 'data': {'name': 'a'}}},
+    {'request': {'url': 'http://somehost/api/search', 'data': {'name': 'b', 'age': 1}}},
+    {'request': {'url': 'http://somehost/', 'data': {'isOpen': True}}},
+    {'request': {'url': 'http://somehost/', 'data': None}},
+    {'request': {'url': 1}},
+    {'request': {}},
+]
+
+
+def test_compiled_rule_same_as_match_rules():
+    for rule in RULES:
+        compiled_rule = CompiledMatchRule(rule)
+        for flow in FLOWS:
+            assert compiled_rule.match(flow) == MatchRules.match(flow, rule), (rule, flow)
+
+
+def test_compiled_rule_invalid_pattern_fallback():
+    compiled_rule = CompiledMatchRule({'request.url': '(?=.*search'})
+    assert compiled_rule.is_fallback == True
+
+
+def test_required_literals():
+    assert get_required_literals('(?=.*/api/search)(?=.*PARAMS)') == [('/api/search', False), ('PARAMS', False)]
+    assert get_required_literals('(?=.*/api/search\\?)') == [('/api/search?', False)]
+    assert get_required_literals('^/api/search$') == [('/api/search', True)]
+    assert get_required_literals('/api/v1.0/ab*c') == [('/api/v1', False), ('0/a', False), ('c', False)]
+    assert get_required_literals('search|location') == []
+    assert get_required_literals('(?i)search') == []
+    assert get_required_literals('(search)') == []
+    # Escapes whose following chars are not literals
+    assert get_required_literals('/api/\\x41bc') == []
+    assert get_required_literals('/api/\\u0041bc') == []
+    assert get_required_literals('/api/\\101bc') == []
+    assert get_required_literals('(?=.*/api/\\N{LATIN CAPITAL LETTER A})') == []
+
+
+def test_match_index_first_match_in_order():
+    activated_data = OrderedDict()
+    activated_data['unindexed'] = {'rule': {'request.data.id': 1}}
+    activated_data['search'] = {'rule': {'request.url': '(?=.*/api/search)'}}
+    activated_data['search-query'] = {'rule': {'request.url': '(?=.*/api/search\\?)'}}
+    activated_data['host'] = {'rule': {'request.url': '(?=.*somehost)'}}
+    activated_data['location'] = {'rule': {'request.url': '(?=.*/api/location$)'}}
+    match_index = MatchIndex(activated_data)
+
+    assert 'unindexed' in [match_index.data_ids[i] for i in match_index.unindexed]
+    assert 'host' in [match_index.data_ids[i] for i in match_index.unindexed]
+
+    assert match_index.match({'request': {'url': 'http://somehost/api/search?q=1'}}) == 'search'
+    assert match_index.match({'request': {'url': 'http://somehost/api/location'}}) == 'host'
+    assert match_index.match({'request': {'url': 'http://otherhost/api/location'}}) == 'location'
+    assert match_index.match({'request': {'url': 'http://otherhost/api/search', 'data': {'id': 1}}}) == 'unindexed'
+    assert match_index.match({'request': {'url': 'http://otherhost/api/other'}}) is None
+
+
+def test_match_index_same_as_scan():
+    activated_data = OrderedDict((f'data-{i}', {'rule': rule}) for i, rule in enumerate(RULES))
+    match_index = MatchIndex(activated_data)
+    for flow in FLOWS:
+        expected = None
+        for data_id, data in activated_data.items():
+            if MatchRules.match(flow, data['rule']):
+                expected = data_id
+                break
+        assert match_index.match(flow) == expected
+
+
+def test_match_index_outdated():
+    activated_data = OrderedDict()
+    activated_data['search'] = {'rule': {'request.url': '(?=.*/api/search)'}}
+    match_index = MatchIndex(activated_data)
+    assert match_index.is_outdated(activated_data) == False
+
+    activated_data.pop('search')
+    assert match_index.is_outdated(activated_data) == True
+    assert match_index.is_outdated(OrderedDict()) == True
@@ -0,0 +1,78 @@
+import time
+import pytest
+from typing import NamedTuple
+from lyrebird import application
+from lyrebird.mock.emitter import SocketIOEmitter
+
+
+MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
+
+
+class RecordSocketio:
+
+    def __init__(self):
+        self.history = []
+
+    def emit(self, event, *args, **kwargs):
+        self.history.append((event, args))
+
+
+@pytest.fixture
+def socket_io():
+    application._cm = MockConfigManager(config={
+        'socketio.emit': {
+            'event': {'mode': 'batch', 'interval': 0.2},
+            'action': {'mode': 'latest', 'interval': 0.2},
+            'alert': {'mode': 'immediate'}
+        }
+    })
+    return RecordSocketio()
+
+
+def test_emit_latest(socket_io):
+    emitter = SocketIOEmitter(lambda: socket_io)
+    for i in range(10):
+        emitter.emit('action', f'update {i}')
+
+    # The first one is sent at once, the latest one is sent at the end of window
+    assert socket_io.history == [('action', ('update 0',))]
+    time.sleep(0.4)
+    assert socket_io.history == [('action', ('update 0',)), ('action', ('update 9',))]
+    assert emitter.status()['sent'] == 2
+    assert emitter.status()['received'] == 10
+
+
+def test_emit_batch(socket_io):
+    emitter = SocketIOEmitter(lambda: socket_io)
+    emitter.emit('event', {'id': 'id-0', 'channel': 'flow'})
+    for i in range(1, 6):
+        emitter.emit('event', {'id': f'id-{i}', 'channel': 'flow' if i % 2 else 'notice'})
+
+    assert len(socket_io.history) == 1
+    time.sleep(0.4)
+    assert len(socket_io.history) == 2
+
+    event, (frame,) = socket_io.history[1]
+    assert event == 'event'
+    assert frame['id'] == 'id-5'
+    assert frame['channel'] == 'flow'
+    assert frame['channels'] == {
+        'flow': {'ids': ['id-1', 'id-3', 'id-5'], 'count': 3},
+        'notice': {'ids': ['id-2', 'id-4'], 'count': 2}
+    }
+
+
+def test_emit_immediate(socket_io):
+    emitter = SocketIOEmitter(lambda: socket_io)
+    for i in range(5):
+        emitter.emit('alert', i)
+    assert [args[0] for _, args in socket_io.history] == list(range(5))
+
+
+def test_emit_flush(socket_io):
+    emitter = SocketIOEmitter(lambda: socket_io)
+    emitter.emit('action', 'first')
+    emitter.emit('action', 'second')
+    emitter.flush(force=True)
+    assert socket_io.history == [('action', ('first',)), ('action', ('second',))]
+    assert emitter.status()['pending'] == {}
@@ -1,11 +1,15 @@
 import time
+import queue
+import inspect
 import pytest
+import threading
 import lyrebird
 from .utils import FakeSocketio, FakeBackgroundTaskServer
 from typing import NamedTuple
 from lyrebird import application
-from lyrebird.event import EventServer
+from lyrebird.event import Event, EventServer, Subscriber, CustomExecutePool
 from lyrebird import CustomEventReceiver
+from lyrebird.utils import HookedDict, FrozenDict
 
 
 MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
@@ -106,6 +110,225 @@ def test_event_default_information_with_sender(callback_tester, event_server, ta
     assert resent_history.get('channel') == 'Test'
 
 
+def test_subscriber_drop_oldest(event_server, task_server):
+    tester = CallbackTester()
+    subscriber = Subscriber(event_server, {
+        'channel': 'Test', 'func': tester.callback, 'queue_size': 2, 'overflow_policy': 'drop-oldest'
+    }, (), {})
+    # Events are queued before the worker starts
+    subscriber.max_workers = 0
+    for i in range(5):
+        subscriber.put(Event(str(i), 'Test', i))
+    assert [e.message for e in subscriber.queue] == [3, 4]
+    assert subscriber.status()['dropped'] == 3
+    subscriber.stop()
+
+
+def test_subscriber_drop_newest(event_server, task_server):
+    tester = CallbackTester()
+    subscriber = Subscriber(event_server, {
+        'channel': 'Test', 'func': tester.callback, 'queue_size': 2, 'overflow_policy': 'drop-newest'
+    }, (), {})
+    subscriber.max_workers = 0
+    for i in range(5):
+        subscriber.put(Event(str(i), 'Test', i))
+    assert [e.message for e in subscriber.queue] == [0, 1]
+    assert subscriber.status()['dropped'] == 3
+    subscriber.stop()
+
+
+def test_subscriber_default_lossless(event_server, task_server):
+    tester = CallbackTester()
+    subscriber = Subscriber(event_server, {'channel': 'Test', 'func': tester.callback}, (), {})
+    subscriber.max_workers = 0
+    # Queue is unbounded by default
+    for i in range(2000):
+        subscriber.put(Event(str(i), 'Test', i))
+    assert len(subscriber.queue) == 2000
+    assert subscriber.status()['dropped'] == 0
+    subscriber.stop()
+
+    # Bounded queue blocks by default
+    subscriber = Subscriber(event_server, {'channel': 'Test', 'func': tester.callback, 'queue_size': 2}, (), {})
+    assert subscriber.overflow_policy == 'block'
+    assert subscriber.block_timeout is None
+    subscriber.max_workers = 0
+    for i in range(2):
+        subscriber.put(Event(str(i), 'Test', i))
+    producer = threading.Thread(target=subscriber.put, args=(Event('2', 'Test', 2),))
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()
+    with subscriber.mutex:
+        subscriber.queue.popleft()
+        subscriber.not_full.notify()
+    producer.join(1)
+    assert not producer.is_alive()
+    assert [e.message for e in subscriber.queue] == [1, 2]
+    assert subscriber.status()['dropped'] == 0
+    subscriber.stop()
+
+
+def test_subscriber_block_timeout(event_server, task_server):
+    tester = CallbackTester()
+    subscriber = Subscriber(event_server, {
+        'channel': 'Test', 'func': tester.callback, 'queue_size': 2, 'overflow_policy': 'block', 'block_timeout': 0.1
+    }, (), {})
+    # No worker consumes the queue, the dispatcher is not blocked longer than block_timeout
+    subscriber.max_workers = 0
+    start_time = time.time()
+    for i in range(3):
+        subscriber.put(Event(str(i), 'Test', i))
+    assert time.time() - start_time < 1
+    assert [e.message for e in subscriber.queue] == [1, 2]
+    assert subscriber.status()['dropped'] == 1
+    subscriber.stop()
+
+
+def test_subscriber_block(event_server, task_server):
+    tester = CallbackTester()
+
+    def slow_callback(msg):
+        time.sleep(0.01)
+        tester.callback(msg)
+
+    event_server.subscribe({'channel': 'Test', 'func': slow_callback, 'queue_size': 2, 'overflow_policy': 'block'})
+    for i in range(20):
+        event_server.publish('Test', {'index': i})
+
+    for _ in range(20):
+        time.sleep(0.1)
+        if len(tester.history) == 20:
+            break
+    assert [msg['index'] for msg in tester.history] == list(range(20))
+
+    status = event_server.get_subscriber_status()
+    assert len(status) == 1
+    assert status[0]['name'] == 'slow_callback'
+    assert status[0]['dropped'] == 0
+    assert status[0]['processed'] == 20
+    assert sum(status[0]['latency_histogram'].values()) == 20
+
+
+def test_subscriber_callback_record(event_server, task_server):
+    def callback_with_kwargs(msg, channel=None, event_id=None):
+        pass
+
+    def callback_without_args():
+        pass
+
+    process_executor = event_server.process_executor
+    subscriber = Subscriber(event_server, {'channel': 'Test', 'func': callback_with_kwargs, 'process': True}, (), {}, process_executor)
+    assert subscriber.is_valid
+    assert subscriber.accepts_channel and subscriber.accepts_event_id
+    assert subscriber.is_process
+
+    subscriber = Subscriber(event_server, {'channel': 'Test', 'func': CallbackTester().callback, 'process': True}, (), {}, process_executor)
+    assert subscriber.is_valid
+    assert not subscriber.accepts_channel and not subscriber.accepts_event_id
+    # Bound methods are not sent to process executor
+    assert not subscriber.is_process
+
+    subscriber = Subscriber(event_server, {'channel': 'Test', 'func': callback_without_args}, (), {})
+    assert not subscriber.is_valid
+
+
+def test_multiprocess_channels_cache(event_server, task_server):
+    application._cm.config['event.multiprocess.channels'] = ['flow']
+    channels = event_server.get_multiprocess_channels()
+    assert channels == {'flow'}
+    assert event_server.get_multiprocess_channels() is channels
+
+    application._cm.config['event.multiprocess.channels'] = ['flow', 'Test']
+    assert event_server.get_multiprocess_channels() == {'flow', 'Test'}
+
+
+def test_subscribe_channel_pattern_and_rules(event_server, task_server):
+    pattern_tester = CallbackTester()
+    rules_tester = CallbackTester()
+    event_server.subscribe({'channel': 'flow*', 'func': pattern_tester.callback})
+    event_server.subscribe({
+        'channel': 'flow',
+        'func': rules_tester.callback,
+        'rules': {'flow.request.host': '(?=.*meituan)'}
+    })
+
+    assert [s.func_info['func'] for s in event_server.get_channel_subscribers('flow.extra')] == [pattern_tester.callback]
+    assert event_server.get_channel_subscribers('Test') == ()
+
+    event_server.publish('flow', {'flow': {'request': {'host': 'www.meituan.com'}}})
+    event_server.publish('flow', {'flow': {'request': {'host': 'www.example.com'}}})
+    event_server.publish('flow.extra', {'message': 'extra'})
+    event_server.publish('Test', {'message': 'ignored'})
+    time.sleep(0.2)
+
+    assert [msg['channel'] for msg in pattern_tester.history] == ['flow', 'flow', 'flow.extra']
+    assert [msg['flow']['request']['host'] for msg in rules_tester.history] == ['www.meituan.com']
+    status = {s['channel']: s for s in event_server.get_subscriber_status()}
+    assert status['flow']['filtered'] == 1
+    assert status['flow']['received'] == 1
+
+    event_server.unsubscribe({'channel': 'flow*', 'func': pattern_tester.callback})
+    assert event_server.pattern_channels == []
+    assert event_server.get_channel_subscribers('flow.extra') == ()
+
+
+def test_only_report_channel_with_pattern_subscriber(event_server, task_server):
+    tester = CallbackTester()
+    event_server.only_report_channel = ['flow.extra', 'report']
+    event_server.subscribe({'channel': 'flow*', 'func': tester.callback})
+
+    assert event_server.is_channel_subscribed('flow.extra')
+    assert not event_server.is_channel_subscribed('report')
+    event_server.publish('flow.extra', {'message': 'extra'})
+    event_server.publish('report', {'message': 'report'})
+    time.sleep(0.2)
+    assert [msg['channel'] for msg in tester.history] == ['flow.extra']
+
+
+def test_execute_pool_sharding(event_server):
+    pool = CustomExecutePool()
+    pool.build_hash_ring(4)
+    pool.worker_queues = [queue.Queue() for _ in range(4)]
+    checkers = [{'origin': f'/checkers/checker_{i}.py', 'name': 'on_flow'} for i in range(20)]
+
+    for index in range(3):
+        for func_info in checkers:
+            flow_event = Event(str(index), 'flow', {'flow': {'id': f'flow-{index}'}})
+            pool.submit(func_info, flow_event, [index], {}, {})
+
+    # All events of one checker are sent to one process in order
+    for worker_queue in pool.worker_queues:
+        received = {}
+        while not worker_queue.empty():
+            origin, name, callback_args, _, _ = worker_queue.get()
+            received.setdefault(origin, []).append(callback_args[0])
+        for args in received.values():
+            assert args == [0, 1, 2]
+    assert len([count for count in pool.submit_count if count]) > 1
+    assert sum(pool.submit_count) == 60
+
+    pool.shard_by = 'flow'
+    flow_event = Event('event-id', 'flow', {'flow': {'id': 'flow-id'}})
+    assert len({pool.get_worker_index(pool.get_shard_key(func_info, flow_event)) for func_info in checkers}) == 1
+
+    pool.build_hash_ring(1)
+    assert pool.get_worker_index('any-key') == 0
+
+
+def test_unsubscribe(event_server, task_server):
+    tester = CallbackTester()
+    func_info = {'channel': 'Test', 'func': tester.callback}
+    event_server.subscribe(func_info)
+    event_server.unsubscribe(func_info)
+    event_server.unsubscribe({'channel': 'Unknown', 'func': tester.callback})
+
+    event_server.publish('Test', 'Hello')
+    time.sleep(0.2)
+    assert event_server.pubsub_channels.get('Test') == []
+    assert tester.history == []
+
+
 def test_state(event_server, task_server):
     event_server.publish('Test', 'NewActivity', state=True)
 
@@ -130,3 +353,96 @@ def test_customer_event_issue(event_server):
         assert msg.get('message') == 'issue_string'
 
     lyrebird.subscribe('notice', msg_receiver)
+
+
+def test_event_message_snapshot(event_server, task_server):
+    cb_tester = CallbackTester()
+    event_server.subscribe({'channel': 'Test', 'func': cb_tester.callback})
+
+    message = {'message': 'test', 'flow': {'request': {'url': 'http://somehost/api'}}}
+    event_server.publish('Test', message)
+    message['flow']['request']['url'] = 'changed'
+    time.sleep(0.2)
+
+    received = cb_tester.history[0]
+    assert received['flow']['request']['url'] == 'http://somehost/api'
+    assert received['channel'] == 'Test'
+    with pytest.raises(TypeError):
+        received['flow']['request']['url'] = 'changed'
+
+
+def test_event_flow_snapshot(event_server, task_server):
+    cb_tester = CallbackTester()
+    event_server.subscribe({'channel': 'flow', 'func': cb_tester.callback})
+
+    data = 'x' * 1024
+    flow = HookedDict({
+        'request': {'url': 'http://somehost/api', 'headers': {'Content-Type': 'application/json'}},
+        'response': {'code': 200, 'data': data}
+    })
+    event_server.publish('flow', {'message': 'flow', 'flow': flow})
+    flow['request']['headers']['Content-Type'] = 'changed'
+    time.sleep(0.2)
+
+    received = cb_tester.history[0]['flow']
+    # Values are shared, containers are frozen
+    assert received['response']['data'] is data
+    assert received['request']['headers']['content-type'] == 'application/json'
+    assert type(received) == FrozenDict
+    with pytest.raises(TypeError):
+        received['request']['url'] = 'changed'
+    with pytest.raises(TypeError):
+        received['request']['headers']['Content-Type'] = 'changed'
+
+
+def test_publish_sender(event_server, task_server):
+    cb_tester = CallbackTester()
+    event_server.subscribe({'channel': 'Test', 'func': cb_tester.callback})
+
+    for _ in range(2):
+        lyrebird.publish('Test', {'message': 'test'})
+    application._cm.config['event.sender_attribution'] = False
+    lyrebird.publish('Test', {'message': 'test'})
+    time.sleep(0.2)
+
+    assert cb_tester.history[0]['sender'] == {'file': 'test_event.py', 'function': 'test_publish_sender'}
+    assert cb_tester.history[1]['sender'] == cb_tester.history[0]['sender']
+    assert 'sender' not in cb_tester.history[2]
+
+
+def test_publish_sender_benchmark(event_server, task_server):
+    """
+    Compare sender attribution with inspect.stack, and publish throughput with attribution on and off
+    """
+    count = 200
+
+    def inspect_stack_sender():
+        frame_info = inspect.stack()[1]
+        return {'file': frame_info.filename[frame_info.filename.rfind('/') + 1:], 'function': frame_info.function}
+
+    def frame_walk_sender():
+        return EventServer.get_sender(2)
+
+    def in_deep_stack(depth, func):
+        if depth:
+            return in_deep_stack(depth - 1, func)
+        return func()
+
+    def timeit(func):
+        start_time = time.time()
+        for _ in range(count):
+            in_deep_stack(50, func)
+        return time.time() - start_time
+
+    assert in_deep_stack(50, inspect_stack_sender) == in_deep_stack(50, frame_walk_sender)
+    inspect_stack_duration = timeit(inspect_stack_sender)
+    get_sender_duration = timeit(frame_walk_sender)
+
+    publish_duration = {}
+    for attribution in (True, False):
+        application._cm.config['event.sender_attribution'] = attribution
+        publish_duration[attribution] = timeit(lambda: event_server.publish('Test', {'message': 'test'}))
+
+    print(f'\nSender attribution of {count} calls: inspect.stack {inspect_stack_duration:.3f}s, get_sender {get_sender_duration:.3f}s')
+    print(f'Publish {count} events: {count/publish_duration[True]:.0f}/s with sender, {count/publish_duration[False]:.0f}/s without sender')
+    assert get_sender_duration < inspect_stack_duration
@@ -2,7 +2,9 @@ import pytest
 from copy import deepcopy
 from lyrebird import application
 from lyrebird.checker import LyrebirdCheckerServer
+from lyrebird.utils import HookedDict
 from lyrebird.mock.handlers.encoder_decoder_handler import EncoderDecoder
+from lyrebird.mock.handlers.flow_editor_handler import FlowEditorHandler
 
 
 FILENAME = 'encoder_decoder.py'
@@ -126,3 +128,52 @@ def test_decoder_handler_not_match_and_exist_output(checker_server):
     assert output['request']['data'] == ''
     output['request']['data'] == 'test'
     assert flow['request']['data'] == ''
+
+
+def test_decode_cached_on_flow(checker_server):
+    flow = HookedDict(deepcopy(FLOW_DATA_MATCH))
+    decoded_flow = application.encoders_decoders.decode(flow)
+    assert decoded_flow['request']['data'] == 'decode'
+    assert flow['request']['data'] == ''
+    assert application.encoders_decoders.decode(flow) is decoded_flow
+
+    # Decoded again after fields of flow are replaced
+    flow['request']['data'] = 'new'
+    assert application.encoders_decoders.decode(flow) is not decoded_flow
+
+    flow = HookedDict(deepcopy(FLOW_DATA_NO_MATCH))
+    assert application.encoders_decoders.decode(flow) is flow
+
+
+def test_decode_after_flow_editor(checker_server):
+    def edit_query(flow):
+        flow['request']['query']['a'] = '2'
+
+    flow = HookedDict(deepcopy(FLOW_DATA_MATCH))
+    flow['request']['query'] = {'a': '1'}
+    assert application.encoders_decoders.decode(flow)['request']['query']['a'] == '1'
+
+    # Value inside a field is changed in place
+    FlowEditorHandler.script_executor([{'name': 'edit_query', 'func': edit_query}], flow)
+    assert application.encoders_decoders.decode(flow)['request']['query']['a'] == '2'
+
+
+def test_encode_only_modified(checker_server):
+    flow = deepcopy(FLOW_DATA_MATCH)
+    decoded_fields = application.encoders_decoders.decode_in_place(flow)
+    assert flow['request']['data'] == 'decode'
+    application.encoders_decoders.encode_modified(flow, decoded_fields)
+    # Origin data is restored without encoding
+    assert flow['request']['data'] == ''
+    assert 'encoder' not in [action['id'] for action in flow['action']]
+
+    flow = deepcopy(FLOW_DATA_MATCH)
+    decoded_fields = application.encoders_decoders.decode_in_place(flow)
+    assert isinstance(decoded_fields.decoded[('request', 'data')], bytes)
+    flow['request']['data'] = 'edited'
+    application.encoders_decoders.encode_modified(flow, decoded_fields)
+    assert flow['request']['data'] == 'encode'
+    assert flow['action'][-1]['id'] == 'encoder'
+
+    flow = deepcopy(FLOW_DATA_NO_MATCH)
+    assert application.encoders_decoders.decode_in_place(flow) is None
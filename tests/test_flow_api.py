@@ -111,7 +111,7 @@ def get_server():
 @pytest.fixture(scope='module', autouse=True)
 def setup_and_teardown_environment():
     with get_server().app.test_client() as init_client:
-        context.application.cache._cache.clear()
+        context.application.cache.clear()
         for url in REQUEST_URL:
             init_client.get(url)
     yield
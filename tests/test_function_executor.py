@@ -0,0 +1,78 @@
+from lyrebird.application import HandlerList
+from lyrebird.utils import HookedDict
+from lyrebird.mock.handlers.function_executor import FunctionExecutor
+
+
+def func_info(name, rules=None, rank=0):
+    return {'name': name, 'func': lambda flow: None, 'rules': rules, 'rank': rank}
+
+
+def matched_names(func_list, flow):
+    return [func['name'] for func in FunctionExecutor.get_matched_sorted_handler(func_list, flow)]
+
+
+def legacy_matched_names(func_list, flow):
+    flow = HookedDict(flow)
+    matched = [func for func in func_list if not func['rules'] or FunctionExecutor._is_req_match_rule(func['rules'], flow)]
+    return [func['name'] for func in sorted(matched, key=lambda f: f['rank'])]
+
+
+FLOW = {
+    'request': {
+        'url': 'http://www.example.com/search?q=lyrebird',
+        'method': 'GET',
+        'headers': {'Content-Type': 'application/json'}
+    },
+    'response': {
+        'code': 200
+    }
+}
+
+
+def test_dispatch_same_as_legacy():
+    func_list = HandlerList([
+        func_info('no_rules', rank=3),
+        func_info('url', {'request.url': '(?=.*search)'}, rank=1),
+        func_info('url_and_method', {'request.url': 'example', 'request.method': 'POST'}),
+        func_info('header', {'request.headers.content-type': 'json'}, rank=-1),
+        func_info('missing', {'request.data': '.*'}),
+        func_info('same_rank', {'request.method': 'GET'}, rank=1),
+    ])
+    assert matched_names(func_list, FLOW) == legacy_matched_names(func_list, FLOW)
+    assert matched_names(func_list, FLOW) == ['header', 'url', 'same_rank', 'no_rules']
+    # Plain list is not cached
+    assert matched_names(list(func_list), FLOW) == ['header', 'url', 'same_rank', 'no_rules']
+
+
+def test_dispatch_table_invalidated():
+    func_list = HandlerList([func_info('url', {'request.url': 'search'})])
+    assert matched_names(func_list, FLOW) == ['url']
+    dispatch_table = func_list.dispatch_table
+    assert dispatch_table is not None
+    assert matched_names(func_list, FLOW) == ['url']
+    assert func_list.dispatch_table is dispatch_table
+
+    func_list.append(func_info('method', {'request.method': 'GET'}, rank=-1))
+    assert func_list.dispatch_table is None
+    assert matched_names(func_list, FLOW) == ['method', 'url']
+
+    func_list.remove(func_list[0])
+    assert matched_names(func_list, FLOW) == ['method']
+    del func_list[:]
+    assert matched_names(func_list, FLOW) == []
+
+
+def test_dispatch_table_modified_while_building():
+    func_list = HandlerList()
+
+    class RegisterWhileBuilding(dict):
+        # Another function is registered when the table is being built
+        def __getitem__(self, key):
+            if key == 'rank' and len(func_list) == 1:
+                func_list.append(func_info('method', {'request.method': 'GET'}, rank=-1))
+            return super().__getitem__(key)
+
+    func_list.append(RegisterWhileBuilding(func_info('url', {'request.url': 'search'})))
+    assert matched_names(func_list, FLOW) == ['url']
+    # Table built from the old list is not used
+    assert matched_names(func_list, FLOW) == ['method', 'url']
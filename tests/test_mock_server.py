@@ -44,7 +44,7 @@ def client():
 
 @pytest.fixture
 def clear():
-    context.application.cache._cache.clear()
+    context.application.cache.clear()
 
 
 @pytest.fixture
@@ -67,9 +67,9 @@ def test_mock_api_with_query(client, clear):
     url = quote(origin_url, safe='')
     client.get(f'/mock/?url={url}')
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
-    assert cache_list._cache[0]['request']['query']['url'] == url
-    assert cache_list._cache[0]['request']['url'] == f'?url={url}'
+    assert len(cache_list.items()) == 1
+    assert cache_list.items()[0]['request']['query']['url'] == url
+    assert cache_list.items()[0]['request']['url'] == f'?url={url}'
 
 
 def test_mock_api_put(client, clear):
@@ -83,9 +83,9 @@ def test_mock_api_put(client, clear):
     client.put(url, headers=headers, data=origin_body)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
     assert origin_json == flow_body
 
@@ -101,9 +101,9 @@ def test_mock_api_patch(client, clear):
     client.patch(url, headers=headers, data=origin_body)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
     assert origin_json == flow_body
 
@@ -119,9 +119,9 @@ def test_mock_content_type_json(client, clear):
     client.post(url, headers=headers, data=origin_body)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
 
     assert origin_json == flow_body
@@ -135,9 +135,9 @@ def test_mock_content_type_javascript(client, clear):
     client.post(url, headers=headers, data=origin_js)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
 
     assert origin_js == flow_body
@@ -151,9 +151,9 @@ def test_mock_content_type_text(client, clear):
     client.post(url, headers=headers, data=origin_text)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
 
     assert origin_text == flow_body
@@ -167,9 +167,9 @@ def test_mock_content_type_form(client, clear):
     client.post(url, headers=headers, data=origin_data)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
 
     assert origin_data == urlencode(flow_body)
@@ -183,9 +183,9 @@ def test_mock_content_type_default(client, clear):
     client.post(url, headers=headers, data=origin_data)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['request']['data']
 
     flow_body_a2b = binascii.a2b_base64(flow_body.encode())
@@ -204,9 +204,9 @@ def test_mock_content_type_json_keep_origin_request(client, clear, keep_origin_d
     client.post(url, headers=headers, data=origin_body)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['origin_request']['data']
 
     assert origin_body == flow_body
@@ -220,9 +220,9 @@ def test_mock_content_type_javascript_keep_origin_request(client, clear, keep_or
     client.post(url, headers=headers, data=origin_js)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['origin_request']['data']
 
     assert origin_js == flow_body
@@ -236,9 +236,9 @@ def test_mock_content_type_text_keep_origin_request(client, clear, keep_origin_d
     client.post(url, headers=headers, data=origin_text)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['origin_request']['data']
 
     assert origin_text == flow_body
@@ -252,9 +252,9 @@ def test_mock_content_type_form_keep_origin_request(client, clear, keep_origin_d
     client.post(url, headers=headers, data=origin_data)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['origin_request']['data']
 
     assert origin_data == flow_body
@@ -268,9 +268,9 @@ def test_mock_content_type_default_keep_origin_request(client, clear, keep_origi
     client.post(url, headers=headers, data=origin_data)
 
     cache_list = context.application.cache
-    assert len(cache_list._cache) == 1
+    assert len(cache_list.items()) == 1
 
-    flow = cache_list._cache[0]
+    flow = cache_list.items()[0]
     flow_body = flow['origin_request']['data']
 
     flow_body_a2b = binascii.a2b_base64(flow_body.encode())
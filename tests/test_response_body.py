@@ -0,0 +1,89 @@
+import os
+import hashlib
+import binascii
+import pytest
+from typing import NamedTuple
+from lyrebird import application
+from lyrebird.mock.handlers.response_body import ResponseBody, remove_body_file
+from lyrebird.mock.handlers.handler_context import HandlerContext, _publish_stage
+
+
+MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
+
+BODY = b'{"data": "' + b'x' * 1000 + b'"}'
+
+
+@pytest.fixture(autouse=True)
+def config():
+    application._cm = MockConfigManager(config={
+        'mock.stream.threshold': 100,
+        'mock.stream.prefix_size': 10
+    })
+
+
+def write_chunks(body, data, size=64):
+    for i in range(0, len(data), size):
+        body.write(data[i:i+size])
+    body.close()
+
+
+def test_body_buffered():
+    body = ResponseBody({'Content-Type': 'application/json'})
+    write_chunks(body, BODY[:100])
+    assert not body.is_streaming
+    assert body.getvalue() == BODY[:100]
+
+
+def test_body_streamed():
+    body = ResponseBody({'Content-Type': 'application/json'})
+    write_chunks(body, BODY)
+    assert body.is_streaming
+    assert body.buffer == []
+    assert body.file_path is None
+    assert body.get_prefix_data() == BODY[:10].decode()
+    assert body.info() == {
+        'length': len(BODY),
+        'sha256': hashlib.sha256(BODY).hexdigest(),
+        'prefix_size': 10,
+        'truncated': True,
+        'recorded': False
+    }
+
+    body = ResponseBody({'Content-Type': 'application/octet-stream', 'Content-Length': str(len(BODY))})
+    assert body.is_streaming
+    write_chunks(body, BODY)
+    assert body.get_prefix_data() == binascii.b2a_base64(BODY[:10]).decode()
+    assert body.info()['sha256'] == hashlib.sha256(BODY).hexdigest()
+
+
+def test_body_spilled_to_file():
+    body = ResponseBody({'Content-Type': 'application/json'}, spill=True)
+    write_chunks(body, BODY)
+    assert body.info()['recorded']
+    with open(body.file_path, 'rb') as f:
+        assert f.read() == BODY
+    remove_body_file(body.file_path)
+
+
+def test_body_stream_disabled():
+    application._cm.config['mock.stream.threshold'] = 0
+    body = ResponseBody({'Content-Type': 'application/json', 'Content-Length': str(len(BODY))}, spill=True)
+    write_chunks(body, BODY)
+    assert not body.is_streaming
+    assert body.getvalue() == BODY
+
+
+def test_body_file_removed_on_error(monkeypatch):
+    body = ResponseBody({'Content-Type': 'application/json'}, spill=True)
+    write_chunks(body, BODY)
+    handler_context = HandlerContext.__new__(HandlerContext)
+    handler_context.response_body_file = body.file_path
+
+    def publish_failed(decode_flow):
+        raise Exception('Publish failed')
+    monkeypatch.setattr(handler_context, 'request_post_publish', publish_failed)
+
+    with pytest.raises(Exception):
+        _publish_stage((handler_context, {}))
+    assert not os.path.exists(body.file_path)
+    assert handler_context.response_body_file is None
@@ -0,0 +1,116 @@
+import time
+import pytest
+import multiprocessing
+from typing import NamedTuple
+from lyrebird import application
+from lyrebird import shared_payload
+from lyrebird.shared_payload import SharedPayload, SharedPayloadServer
+from lyrebird.utils import freeze
+
+
+MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
+
+
+@pytest.fixture
+def payload_server():
+    application._cm = MockConfigManager(config={
+        'event.multiprocess.shared_memory_threshold': 1024
+    })
+    server = SharedPayloadServer()
+    yield server
+    server.terminate()
+
+
+def resolve_in_child(value, result_queue, release_queue):
+    resolved, names = shared_payload.resolve(value)
+    shared_payload.release(release_queue, names)
+    result_queue.put(resolved)
+
+
+def test_export_and_resolve(payload_server):
+    body = 'x' * 2048
+    message = freeze({'flow': {'request': {'data': b'y' * 2048}, 'response': {'data': body}}, 'channel': 'flow'})
+
+    exported = payload_server.export(message)
+    assert isinstance(exported['flow']['response']['data'], SharedPayload)
+    assert isinstance(exported['flow']['request']['data'], SharedPayload)
+    assert exported['channel'] == 'flow'
+    assert payload_server.status()['segments'] == 2
+
+    resolved, names = shared_payload.resolve(exported)
+    assert resolved == message
+    for name in names:
+        payload_server.release(name)
+    assert payload_server.status()['segments'] == 0
+
+
+def test_shared_by_references(payload_server):
+    body = 'x' * 2048
+    message = freeze({'flow': {'response': {'data': body}}})
+
+    # Same body sent to 3 checkers is written once
+    handles = [payload_server.export(message)['flow']['response']['data'] for _ in range(3)]
+    assert len({handle.name for handle in handles}) == 1
+    status = payload_server.status()
+    assert status['exported'] == 1
+    assert status['shared'] == 2
+
+    for _ in range(2):
+        payload_server.release(handles[0].name)
+        assert payload_server.status()['segments'] == 1
+    payload_server.release(handles[0].name)
+    assert payload_server.status()['segments'] == 0
+
+
+def test_small_value_not_exported(payload_server):
+    message = {'flow': {'response': {'data': 'x' * 10}}}
+    assert payload_server.export(message) == message
+    application._cm.config['event.multiprocess.shared_memory_threshold'] = 0
+    assert payload_server.export({'data': 'x' * 2048}) == {'data': 'x' * 2048}
+    assert payload_server.status()['segments'] == 0
+
+
+def test_resolve_in_child_process(payload_server):
+    body = 'x' * 4096
+    exported = payload_server.export({'data': body})
+    result_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=resolve_in_child, args=(exported, result_queue, payload_server.release_queue))
+    process.start()
+    assert result_queue.get(timeout=10) == {'data': body}
+    process.join()
+
+    names = payload_server.release_queue.get(timeout=10)
+    assert names == [exported['data'].name]
+    for name in names:
+        payload_server.release(name)
+    assert payload_server.status()['segments'] == 0
+
+
+def test_expiry_refreshed_by_reference(payload_server):
+    application._cm.config['event.multiprocess.shared_memory_max_age'] = 1
+    body = 'x' * 2048
+    message = freeze({'data': body})
+    handle = payload_server.export(message)['data']
+    payload_server.segments[handle.name][3] -= 2
+
+    # Reused segment is kept for the new reference
+    payload_server.export(message)
+    payload_server.release_expired()
+    assert payload_server.status()['segments'] == 1
+
+
+def test_resolve_failed(payload_server):
+    handle = payload_server.export({'data': 'x' * 2048})['data']
+    payload_server.terminate()
+
+    with pytest.raises(shared_payload.SharedPayloadError):
+        shared_payload.resolve_and_release({'data': handle}, payload_server.release_queue)
+
+    # Failure is counted by the server
+    payload_server.start()
+    for _ in range(100):
+        if payload_server.status()['resolve_failed']:
+            break
+        time.sleep(0.1)
+    payload_server.stop()
+    assert payload_server.status()['resolve_failed'] == 1
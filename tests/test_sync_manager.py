@@ -0,0 +1,38 @@
+import time
+import queue
+import multiprocessing
+from lyrebird import application
+from lyrebird.application import QUEUE_SCOPE_THREAD, QUEUE_SCOPE_PROCESS, QUEUE_SCOPE_MANAGER
+
+
+def test_get_queue_by_scope():
+    sync_manager = application.sync_manager
+    assert isinstance(sync_manager.get_queue(QUEUE_SCOPE_THREAD), queue.Queue)
+
+    process_queue = sync_manager.get_queue(QUEUE_SCOPE_PROCESS)
+    assert isinstance(process_queue, multiprocessing.queues.Queue)
+    assert process_queue in sync_manager.async_objs['multiprocessing_queues']
+
+    manager_queue = sync_manager.get_queue()
+    assert manager_queue in sync_manager.async_objs['manager_queues']
+
+
+def test_queue_latency_benchmark():
+    """
+    put/get latency of each queue type, producer and consumer are in the same process
+    """
+    count = 200
+    message = {'channel': 'flow', 'flow': {'id': 'flow-id', 'response': {'data': 'x' * 1024}}}
+
+    latency = {}
+    for scope in (QUEUE_SCOPE_THREAD, QUEUE_SCOPE_PROCESS, QUEUE_SCOPE_MANAGER):
+        q = application.sync_manager.get_queue(scope)
+        start_time = time.time()
+        for _ in range(count):
+            q.put(message)
+            assert q.get(timeout=10) == message
+        latency[scope] = (time.time() - start_time) / count * 1000 * 1000
+
+    print('\nQueue put/get latency: ' + ', '.join(f'{scope} {value:.1f}us' for scope, value in latency.items()))
+    assert latency[QUEUE_SCOPE_THREAD] < latency[QUEUE_SCOPE_PROCESS]
+    assert latency[QUEUE_SCOPE_THREAD] < latency[QUEUE_SCOPE_MANAGER]
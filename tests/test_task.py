@@ -0,0 +1,135 @@
+import time
+import pytest
+import threading
+from typing import NamedTuple
+from lyrebird import application
+from lyrebird.task import BackgroundTaskServer, Pipeline, PipelineStage
+
+
+MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
+
+
+@pytest.fixture(autouse=True)
+def config():
+    application._cm = MockConfigManager(config={})
+
+
+def wait_for(condition, timeout=5):
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_add_task_counter():
+    server = BackgroundTaskServer()
+
+    def failed_task():
+        raise Exception('Task failed')
+
+    for _ in range(5):
+        server.add_task('test', lambda: None)
+    server.add_task('test', failed_task)
+
+    expected = {'ready': 0, 'running': 0, 'finish': 5, 'error': 1}
+    assert wait_for(lambda: server.status()['tasks'] == expected)
+
+
+def test_pipeline():
+    persisted = []
+
+    def decode(item):
+        return item * 10
+
+    def publish(item):
+        if item == 30:
+            raise Exception('Publish failed')
+        # Only odd items go to persist stage
+        if item % 20:
+            return item
+
+    pipeline = Pipeline('test', [
+        PipelineStage('decode', decode),
+        PipelineStage('publish', publish),
+        PipelineStage('persist', persisted.append)
+    ])
+    server = BackgroundTaskServer()
+    server.add_pipeline(pipeline)
+    for i in range(1, 6):
+        server.submit('test', i)
+    server.stop()
+
+    assert persisted == [10, 50]
+    stages = {stage['name']: stage for stage in server.status()['pipelines'][0]['stages']}
+    assert stages['decode']['processed'] == 5
+    assert stages['publish']['processed'] == 5
+    assert stages['publish']['error'] == 1
+    assert stages['persist']['processed'] == 2
+    assert stages['persist']['queue_size'] == 0
+
+
+def test_pipeline_bounded_queue():
+    release = threading.Event()
+    stage = PipelineStage('slow', lambda item: release.wait(), queue_size=2)
+    pipeline = Pipeline('test', [stage])
+
+    pipeline.submit(0)
+    assert wait_for(lambda: stage.queue.empty())
+    # 1 item is handled by the worker and 2 items are in queue, others are dropped without blocking
+    start_time = time.time()
+    for i in range(1, 5):
+        pipeline.submit(i)
+    assert time.time() - start_time < 1
+    assert stage.status()['dropped'] == 2
+
+    release.set()
+    pipeline.stop()
+    assert stage.status()['processed'] == 3
+
+
+def test_pipeline_on_drop():
+    release = threading.Event()
+    dropped = []
+    pipeline = Pipeline('test', [PipelineStage('slow', lambda item: release.wait(), queue_size=1)], on_drop=dropped.append)
+    pipeline.submit(0)
+    assert wait_for(lambda: pipeline.stages[0].queue.empty())
+    for i in range(1, 4):
+        pipeline.submit(i)
+    assert dropped == [2, 3]
+    release.set()
+    pipeline.stop()
+
+
+def test_pipeline_blocking_submit():
+    release = threading.Event()
+    dropped = []
+    stage = PipelineStage('slow', lambda item: release.wait(), queue_size=1)
+    pipeline = Pipeline('test', [stage], on_drop=dropped.append)
+    pipeline.submit(0)
+    assert wait_for(lambda: stage.queue.empty())
+    pipeline.submit(1)
+    # The queue is full, a blocking submit waits for the worker instead of dropping the item
+    producer = threading.Thread(target=pipeline.submit, args=(2,), kwargs={'block': True})
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()
+    release.set()
+    producer.join(1)
+    assert not producer.is_alive()
+    pipeline.stop()
+    assert dropped == []
+    assert stage.status()['dropped'] == 0
+    assert stage.status()['processed'] == 3
+
+
+def test_pipeline_restart():
+    stage = PipelineStage('stage', lambda item: None, workers=2)
+    pipeline = Pipeline('test', [stage])
+    pipeline.start()
+    pipeline.stop()
+    pipeline.start()
+    assert len(stage.threads) == 2
+    pipeline.stop()
+    assert not any(thread.is_alive() for thread in stage.threads)
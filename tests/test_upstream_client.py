@@ -0,0 +1,76 @@
+import time
+import pytest
+import threading
+from typing import NamedTuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from lyrebird import application
+from lyrebird.mock.handlers.upstream_client import UpstreamClient, upstream_metrics
+
+
+MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = (self.headers.get('Cookie') or 'no cookie').encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=upstream')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    application._cm = MockConfigManager(config={
+        'proxy.pool.idle_timeout': 60
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    upstream_metrics.reset()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_reused(upstream):
+    client = UpstreamClient()
+    for _ in range(5):
+        r = client.request('GET', f'{upstream}/api', stream=True)
+        assert b''.join(r.iter_content(chunk_size=1024)) == b'no cookie'
+
+    status = client.status()
+    assert status['request'] == 5
+    assert status['new_connection'] == 1
+    assert status['reused_connection'] == 4
+    assert len(status['hosts']) == 1
+    client.close()
+
+
+def test_cookies_not_shared(upstream):
+    client = UpstreamClient()
+    r = client.request('GET', f'{upstream}/api', cookies={'user': 'a'})
+    assert r.text == 'user=a'
+    # Set-Cookie of upstream is not sent with other requests
+    r = client.request('GET', f'{upstream}/api')
+    assert r.text == 'no cookie'
+    client.close()
+
+
+def test_idle_pool_closed(upstream):
+    application._cm.config['proxy.pool.idle_timeout'] = 0.1
+    client = UpstreamClient()
+    client.request('GET', f'{upstream}/api').content
+    time.sleep(0.2)
+    client.request('GET', f'{upstream}/api').content
+
+    status = client.status()
+    assert status['idle_closed'] == 1
+    assert status['new_connection'] == 2
+    client.close()
@@ -1,4 +1,12 @@
-from lyrebird import utils
+import json
+import pickle
+import pytest
+import copy
+from copy import deepcopy
+from typing import NamedTuple
+from lyrebird import utils, application
+
+MockConfigManager = NamedTuple('MockConfigManager', [('config', dict)])
 
 def test_case_insenstive_dict():
     test_dict = utils.CaseInsensitiveDict({'Content-Type':'LBTests'})
@@ -29,3 +37,175 @@ def test_get_query_array():
     target_res = ['a', '1', 'b', '']
     assert utils.get_query_array(url_query_value_blank_no_equals_mark) == target_res
     assert utils.get_query_array(url_query_value_blank_one_equals_mark) == target_res
+
+
+def test_copy_on_write_dict():
+    origin = {
+        'id': 'data-UUID',
+        'response': {
+            'headers': {'Content-Type': 'application/json'},
+            'data': 'x' * 1024
+        },
+        'label': [{'name': 'a'}]
+    }
+    view = utils.CopyOnWriteDict(origin)
+    view['response']['headers']['isMocked'] = 'True'
+    view['response']['data'] = 'rendered'
+    view['label'][0]['name'] = 'b'
+    view['label'].append({'name': 'c'})
+    view['id'] = 'new-id'
+
+    assert origin['id'] == 'data-UUID'
+    assert origin['response']['headers'] == {'Content-Type': 'application/json'}
+    assert origin['response']['data'] == 'x' * 1024
+    assert origin['label'] == [{'name': 'a'}]
+
+    assert view['response']['headers']['isMocked'] == 'True'
+    assert view['response']['data'] == 'rendered'
+    assert view['label'] == [{'name': 'b'}, {'name': 'c'}]
+    assert json.loads(json.dumps(view))['label'][1]['name'] == 'c'
+    assert type(deepcopy(view)) == dict
+    assert pickle.loads(pickle.dumps(view)) == view
+
+
+def test_copy_on_write_dict_share_values():
+    data = 'x' * 1024
+    origin = {'response': {'data': data}}
+    view = utils.CopyOnWriteDict(origin)
+    assert view['response']['data'] is data
+
+
+def test_copy_on_write_dict_copies():
+    origin = {'response': {'headers': {'Content-Type': 'application/json'}}, 'label': [{'name': 'a'}]}
+    view = utils.CopyOnWriteDict(origin)
+    copies = [dict(view), {**view}, view.copy(), copy.copy(view), view | {}, {} | view, dict(view.items())]
+    for copied in copies:
+        copied['response']['headers']['isMocked'] = 'True'
+        copied['label'][0]['name'] = 'b'
+        copied['label'].append({'name': 'c'})
+    key, value = view.popitem()
+    value.append({'name': 'd'})
+
+    assert key == 'label'
+    assert origin == {'response': {'headers': {'Content-Type': 'application/json'}}, 'label': [{'name': 'a'}]}
+    assert isinstance(view.copy(), utils.CopyOnWriteDict)
+
+
+def test_copy_on_write_dict_hooked_dict():
+    origin = utils.HookedDict({'request': {'headers': {'Content-Type': 'text/html'}, 'data': 'origin'}})
+    view = utils.CopyOnWriteDict(origin)
+    view['request']['data'] = 'decoded'
+    view['request']['headers']['content-type'] = 'application/json'
+    nested_view = utils.CopyOnWriteDict(view)
+    nested_view['request']['data'] = 'nested'
+
+    assert origin['request']['data'] == 'origin'
+    assert origin['request']['headers']['Content-Type'] == 'text/html'
+    assert view['request']['data'] == 'decoded'
+    assert view['request']['headers']['Content-Type'] == 'application/json'
+
+
+def test_freeze_hooked_dict():
+    flow = utils.HookedDict({'request': {'url': 'http://somehost', 'headers': {'Content-Type': 'text/html'}}})
+    frozen = utils.freeze(flow)
+    assert type(frozen['request']) == utils.FrozenDict
+    headers = frozen['request']['headers']
+    assert type(headers) == utils.FrozenCaseInsensitiveDict
+    assert headers['content-type'] == 'text/html'
+    assert 'CONTENT-TYPE' in headers
+    with pytest.raises(TypeError):
+        frozen['request']['url'] = 'changed'
+    with pytest.raises(TypeError):
+        headers['Content-Type'] = 'application/json'
+
+    # Copies are writable and case insensitive
+    for headers_copy in (headers.copy(), deepcopy(headers), utils.CopyOnWriteDict(frozen)['request']['headers']):
+        assert type(headers_copy) == utils.CaseInsensitiveDict
+        headers_copy['content-type'] = 'application/json'
+        assert headers_copy['Content-Type'] == 'application/json'
+    assert headers['Content-Type'] == 'text/html'
+
+
+def test_freeze():
+    data = 'x' * 1024
+    origin = {'flow': {'response': {'data': data}}, 'label': [{'name': 'a'}], 'raw': ('a', ['b'])}
+    frozen = utils.freeze(origin)
+    origin['flow']['response']['data'] = 'changed'
+    origin['label'].append({'name': 'b'})
+
+    assert frozen['flow']['response']['data'] is data
+    assert frozen['label'] == [{'name': 'a'}]
+    assert isinstance(frozen['label'], list)
+    assert utils.freeze(frozen) is frozen
+    with pytest.raises(TypeError):
+        frozen['flow']['response']['data'] = 'changed'
+    with pytest.raises(TypeError):
+        frozen['label'].append({})
+    with pytest.raises(TypeError):
+        frozen['raw'][1].append('c')
+    with pytest.raises(TypeError):
+        frozen.update({})
+
+    # Copies are writable
+    assert json.loads(json.dumps(frozen))['label'] == [{'name': 'a'}]
+    for copied in (deepcopy(frozen), pickle.loads(pickle.dumps(frozen))):
+        assert type(copied) == dict
+        assert type(copied['flow']['response']) == dict
+        assert type(copied['label']) == list
+        copied['flow']['response']['data'] = 'changed'
+    writable = frozen.copy()
+    writable['new'] = 'value'
+    view = utils.CopyOnWriteDict(frozen)
+    view['flow']['response']['data'] = 'changed'
+    view['label'].append({'name': 'b'})
+    assert frozen['flow']['response']['data'] is data
+
+
+def test_render_cache():
+    application._cm = MockConfigManager(config={
+        'ip': '127.0.0.1',
+        'mock.port': 9090,
+        'config.value.tojsonKey': []
+    })
+    utils.render_cache.clear()
+    status = utils.render_cache.status()
+
+    assert utils.render('{{ip}}:{{port}}') == '127.0.0.1:9090'
+    assert utils.render('{{ip}}:{{port}}') == '127.0.0.1:9090'
+    assert utils.render('{{unknown}}') == '{{unknown}}'
+    assert utils.render('{{unknown}}') == '{{unknown}}'
+
+    new_status = utils.render_cache.status()
+    assert new_status['size'] == 2
+    assert new_status['miss'] == status['miss'] + 2
+    assert new_status['hit'] == status['hit'] + 2
+
+
+def test_render_cache_key_digest():
+    application._cm = MockConfigManager(config={
+        'ip': '127.0.0.1',
+        'config.value.tojsonKey': []
+    })
+    utils.render_cache.clear()
+    data = '{"ip": "{{ip}}", "data": "' + 'x' * 1024 * 1024 + '"}'
+    assert utils.render(data) == data.replace('{{ip}}', '127.0.0.1')
+    assert utils.render(data) == data.replace('{{ip}}', '127.0.0.1')
+    assert utils.render_cache.status()['size'] == 1
+
+    # Large data is not pinned by the cache
+    for key, compiled in utils.render_cache._templates.items():
+        assert len(key[0]) == 32
+        assert not hasattr(compiled, 'source')
+
+
+def test_render_without_template_marker():
+    application._cm = MockConfigManager(config={
+        'config.value.tojsonKey': []
+    })
+    data = '{"key": "value"}' * 1024
+    status = utils.render_cache.status()
+
+    assert utils.render(data) is data
+    assert utils.render('a\r\nb\rc') == 'a\nb\nc'
+    assert utils.render_cache.status()['skip'] == status['skip'] + 2
+    assert utils.render_cache.status()['miss'] == status['miss']
@@ -57,3 +57,6 @@ class FakeBackgroundTaskServer:
 
     def add_task(self, *args, **kwargs):
         pass
+
+    def submit(self, *args, **kwargs):
+        pass